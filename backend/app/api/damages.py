@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+
+from app.api.deps import get_retention_service, get_storage_service
+from app.db.init_db import DAMAGE_SEVERITIES, DAMAGE_TYPES
+from app.schemas.damage import DamageItemResponse, DetectionListResponse, DetectionSummary
+from app.services.retention_service import RetentionService
+from app.services.storage_service import StorageService
+from app.services.upload_service import sniff_image_type
+
+router = APIRouter()
+
+
+def _image_url(damage_id: str, archive: Optional[str]) -> str:
+    """图片地址，已归档的记录从归档中读取"""
+    if archive:
+        return f"/api/archive/{damage_id}/image"
+    return f"/uploads/{damage_id}.jpg"
+
+
+JOB_STATUSES = ("pending", "processing", "completed", "failed")
+INCLUDE_FIELDS = ("ai_result", "user_corrected")
+
+
+def _encode_cursor(created_at: datetime, damage_id: str) -> str:
+    """分页游标：上一页最后一条的 (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), damage_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, damage_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(damage_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def _etag(value) -> str:
+    digest = hashlib.sha256(
+        json.dumps(value, default=str, sort_keys=True).encode()
+    ).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    return bool(if_none_match) and etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def _etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+@router.get("/detections", response_model=DetectionListResponse)
+async def list_detections(
+    response: Response,
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    corrected: Optional[bool] = None,
+    status: str = Query("completed"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    include: List[str] = Query([]),
+    if_none_match: Optional[str] = Header(None),
+    storage_service: StorageService = Depends(get_storage_service)
+):
+    """
+    分页列出识别记录
+    
+    按识别时间倒序，使用 next_cursor 翻页 (键集分页，深翻页不变慢)。
+    响应带 ETag，轮询时携带 If-None-Match，数据未变化返回 304。
+    
+    Args:
+        type: 病害类型 (主病害)
+        severity: 严重程度 (主病害)
+        risk_level: 风险等级
+        corrected: 是否已被用户修正
+        status: 记录状态，默认只列出已完成的识别
+        cursor: 上一页返回的 next_cursor
+        limit: 每页数量
+        include: 额外返回的字段 (ai_result / user_corrected)，可重复
+        
+    Returns:
+        记录列表与下一页游标
+    """
+    if status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"不支持的 status: {status}")
+    invalid = [field for field in include if field not in INCLUDE_FIELDS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的 include: {', '.join(invalid)}，可选值: {', '.join(INCLUDE_FIELDS)}"
+        )
+    
+    filters = {
+        "damage_type": type,
+        "severity": severity,
+        "risk_level": risk_level,
+        "corrected": corrected,
+        "status": status
+    }
+    decoded_cursor = _decode_cursor(cursor) if cursor else None
+    
+    # 已完成的记录：ETag 由 damages 变更计数与查询参数生成，先于分页查询比较，
+    # 数据未变化的轮询只读一行计数
+    if status == "completed":
+        version = await storage_service.get_damages_version()
+        etag = _etag([version, filters, cursor, limit, sorted(include)])
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=_etag_headers(etag))
+    
+    rows = await storage_service.list_detections(
+        filters,
+        decoded_cursor,
+        limit + 1,
+        tuple(include)
+    )
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    
+    # 任务状态变化不计入变更计数，其余状态的列表按页面内容生成 ETag
+    if status != "completed":
+        etag = _etag([rows, next_cursor])
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=_etag_headers(etag))
+    response.headers.update(_etag_headers(etag))
+    
+    items = [
+        DetectionSummary(
+            id=row["id"],
+            image_url=f"/uploads/{row['id']}.jpg",
+            damage_type=row["damage_type"],
+            severity=row["severity"],
+            location=row["location"],
+            risk_level=row["risk_level"],
+            corrected=row["corrected"],
+            status=row["status"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            ai_result=row.get("ai_result"),
+            user_corrected=row.get("user_corrected")
+        )
+        for row in rows
+    ]
+    return DetectionListResponse(items=items, limit=limit, next_cursor=next_cursor)
+
+
+@router.get("/damage-items")
+async def query_damage_items(
+    type: Optional[List[str]] = Query(None),
+    severity: Optional[List[str]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0, le=10000),
+    storage_service: StorageService = Depends(get_storage_service)
+):
+    """
+    查询病害明细 (每处病害一条)
+    
+    一张图片中的多处病害分别返回，例如 ?type=坑槽&severity=严重&severity=危险
+    查询所有严重及以上的坑槽。
+    
+    Args:
+        type: 病害类型，可重复
+        severity: 严重程度，可重复
+        start: 起始时间 (含)
+        end: 截止时间 (不含)
+        limit: 返回数量
+        offset: 跳过数量
+        
+    Returns:
+        病害明细列表，按识别时间倒序
+    """
+    for values, allowed, name in (
+        (type, DAMAGE_TYPES, "type"),
+        (severity, DAMAGE_SEVERITIES, "severity")
+    ):
+        invalid = [value for value in values or [] if value not in allowed]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的 {name}: {', '.join(invalid)}，可选值: {', '.join(allowed)}"
+            )
+    
+    records = await storage_service.query_damage_items(
+        type, severity, start, end, limit, offset
+    )
+    items = [
+        DamageItemResponse(
+            damage_id=r["damage_id"],
+            item_index=r["item_index"],
+            type=r["type"],
+            severity=r["severity"],
+            raw_type=r["raw_type"],
+            location=r["location"],
+            size=r["size"],
+            suggestAction=r["suggest_action"],
+            confidence=r["confidence"],
+            risk_level=r["risk_level"],
+            image_url=_image_url(r["damage_id"], r["archive"]),
+            archived=r["archive"] is not None,
+            created_at=r["created_at"]
+        )
+        for r in records
+    ]
+    return {"limit": limit, "offset": offset, "items": items}
+
+
+@router.get("/archive")
+async def list_archives(
+    storage_service: StorageService = Depends(get_storage_service),
+    retention_service: RetentionService = Depends(get_retention_service)
+):
+    """列出冷存储中的归档 (每个归档对应一个月分区)"""
+    archives = await storage_service.list_archives()
+    store = retention_service.archive_store
+    for archive in archives:
+        archive["size"] = await asyncio.to_thread(store.size_of, archive["archive"])
+    return {"archives": archives}
+
+
+@router.get("/archive/{damage_id}")
+async def get_archived_damage(
+    damage_id: str,
+    storage_service: StorageService = Depends(get_storage_service),
+    retention_service: RetentionService = Depends(get_retention_service)
+):
+    """
+    查询已归档的病害记录
+    
+    Args:
+        damage_id: 病害记录ID
+        
+    Returns:
+        归档时的完整记录
+    """
+    entry = await storage_service.get_archive_entry(damage_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="记录未归档")
+    
+    record = await asyncio.to_thread(
+        retention_service.archive_store.read_record, entry["archive"], damage_id
+    )
+    if record is None:
+        raise HTTPException(status_code=404, detail="归档文件中不存在该记录")
+    
+    record["archive"] = entry["archive"]
+    record["image_url"] = _image_url(damage_id, entry["archive"])
+    return record
+
+
+@router.get("/archive/{damage_id}/image")
+async def get_archived_image(
+    damage_id: str,
+    storage_service: StorageService = Depends(get_storage_service),
+    retention_service: RetentionService = Depends(get_retention_service)
+):
+    """读取已归档记录的图片"""
+    entry = await storage_service.get_archive_entry(damage_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="记录未归档")
+    
+    image = await asyncio.to_thread(
+        retention_service.archive_store.read_image, entry["archive"], damage_id
+    )
+    if image is None:
+        raise HTTPException(status_code=404, detail="归档中不存在该图片")
+    
+    media_type = sniff_image_type(image[:12]) or "application/octet-stream"
+    return Response(content=image, media_type=media_type)
@@ -0,0 +1,48 @@
+from fastapi import Request
+
+from app.services.container import ServiceContainer
+from app.services.dedup_service import NearDuplicateIndex
+from app.services.detection_service import DetectionService
+from app.services.job_queue import JobQueue
+from app.services.retention_service import RetentionService
+from app.services.scheduler import InferenceScheduler
+from app.services.stats_service import StatsService
+from app.services.storage_service import StorageService
+from app.services.write_behind import WriteBehindWriter
+
+
+def get_services(request: Request) -> ServiceContainer:
+    """获取应用级服务容器"""
+    return request.app.state.services
+
+
+def get_storage_service(request: Request) -> StorageService:
+    return get_services(request).storage
+
+
+def get_detection_service(request: Request) -> DetectionService:
+    return get_services(request).detection
+
+
+def get_stats_service(request: Request) -> StatsService:
+    return get_services(request).stats
+
+
+def get_inference_scheduler(request: Request) -> InferenceScheduler:
+    return get_services(request).scheduler
+
+
+def get_job_queue(request: Request) -> JobQueue:
+    return get_services(request).job_queue
+
+
+def get_writer(request: Request) -> WriteBehindWriter:
+    return get_services(request).writer
+
+
+def get_retention_service(request: Request) -> RetentionService:
+    return get_services(request).retention
+
+
+def get_dedup_index(request: Request) -> NearDuplicateIndex:
+    return get_services(request).dedup
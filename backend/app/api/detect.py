@@ -1,53 +1,180 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response, Depends
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Union
+from datetime import datetime
+from pathlib import PurePath
+import asyncio
+import functools
+import io
+import logging
 import uuid
 import base64
 import json
+import zipfile
 
+from app.api.deps import (
+    get_dedup_index, get_detection_service, get_inference_scheduler, get_job_queue,
+    get_storage_service, get_writer
+)
+from app.core.config import settings
+from app.core.metrics import stage
+from app.services.dedup_service import HashEntry, NearDuplicateIndex, to_signed
 from app.services.detection_service import DetectionService
+from app.services.ollama_client import (
+    InferenceError, InferenceTimeoutError, InferenceUnavailableError
+)
 from app.services.storage_service import StorageService
-from app.schemas.damage import DamageDetectionResponse, DamageCreate
+from app.services.scheduler import InferenceScheduler
+from app.services.job_queue import JobQueue, QueueFullError
+from app.services.write_behind import WriteBehindWriter
+from app.services.vector_store import HNSW_MAX_EF_SEARCH, VectorStoreError, SimilarityFilter
+from app.services.upload_service import (
+    UnsupportedImageError, UploadTooLargeError, ingest_upload, sniff_image_type
+)
+from app.schemas.damage import DamageDetectionResponse, DamageCreate, JobAcceptedResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-detection_service = DetectionService()
-storage_service = StorageService()
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+# 带这些标记的识别结果不完整，记录照常保存但不供近似重复帧复用
+DEGRADED_RESULT_KEYS = ("truncated", "error", "partial")
+
+
+def _inference_status(error: InferenceError) -> int:
+    """推理异常对应的 HTTP 状态码"""
+    if isinstance(error, InferenceUnavailableError):
+        return 503
+    if isinstance(error, InferenceTimeoutError):
+        return 504
+    return 502
+
+
+def _duplicate_response(entry: HashEntry) -> DamageDetectionResponse:
+    """近似重复帧的响应：复用原记录的ID、图片与识别结果"""
+    ai_result = entry.result.result()
+    return DamageDetectionResponse(
+        id=entry.damage_id,
+        image_url=f"/uploads/{entry.damage_id}.jpg",
+        damages=ai_result.get("damages", []),
+        risk_level=ai_result.get("riskLevel", "未知"),
+        deduplicated=True
+    )
 
 
-@router.post("/detect", response_model=DamageDetectionResponse)
-async def detect_damage(file: UploadFile = File(...)):
+async def _submit_detection(
+    writer: WriteBehindWriter,
+    dedup: NearDuplicateIndex,
+    record: DamageCreate,
+    image_bytes: bytes
+):
+    """
+    提交识别结果后写
+
+    近似重复索引条目由后写队列在记录入库后 resolve，之后的重复帧才复用该记录ID；
+    不完整的结果 (输出截断、解析失败、分块缺失) 不供复用。
+    识别失败或未提交时调用方须 dedup.discard。
+    """
+    if any(record.ai_result.get(key) for key in DEGRADED_RESULT_KEYS):
+        dedup.discard(record.id)
+    await writer.submit(record, image_bytes)
+
+
+def _sse(event: str, data) -> str:
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post(
+    "/detect",
+    response_model=Union[DamageDetectionResponse, JobAcceptedResponse]
+)
+async def detect_damage(
+    response: Response,
+    file: UploadFile = File(...),
+    async_mode: bool = Query(False, alias="async"),
+    storage_service: StorageService = Depends(get_storage_service),
+    detection_service: DetectionService = Depends(get_detection_service),
+    job_queue: JobQueue = Depends(get_job_queue),
+    writer: WriteBehindWriter = Depends(get_writer),
+    dedup: NearDuplicateIndex = Depends(get_dedup_index)
+):
     """
     检测道路病害
     
+    与最近识别的图片近似重复 (如行车记录仪连续帧) 时直接返回原记录的结果，
+    不调用模型也不新建记录，响应中 deduplicated 为 true。
+    
     Args:
         file: 上传的图片文件
+        async_mode: 为 true 时立即返回任务ID，结果通过 /api/jobs/{id} 查询
         
     Returns:
-        识别结果和病害列表
+        识别结果和病害列表，异步模式下返回任务信息
     """
-    # 验证文件类型
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="只支持图片文件")
-    
-    # 读取文件
-    image_bytes = await file.read()
-    
-    # 保存图片
+    # 分块读取：超限立即中止，按文件头校验类型，同时计算哈希并落盘
+    try:
+        upload = await ingest_upload(file, storage_service.file_store)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     image_id = str(uuid.uuid4())
-    image_path = await storage_service.save_image(image_id, image_bytes)
     
-    # AI 识别
-    ai_result = await detection_service.detect(image_bytes)
+    # 异步模式：保存图片并入队后立即返回 (内容由 worker 从文件读取)
+    if async_mode:
+        image_path = await upload.save_as(image_id)
+        try:
+            await job_queue.enqueue(image_id, image_path)
+        except QueueFullError as e:
+            # 未入队，删除已保存的图片
+            await storage_service.file_store.delete(image_path)
+            raise HTTPException(status_code=503, detail=str(e))
+        
+        response.status_code = 202
+        return JobAcceptedResponse(
+            job_id=image_id,
+            status="pending",
+            status_url=f"/api/jobs/{image_id}"
+        )
     
-    # 存储识别结果到数据库
-    damage_record = DamageCreate(
-        id=image_id,
-        image_path=image_path,
-        ai_result=ai_result
-    )
-    await storage_service.save_detection(damage_record)
+    image_bytes = await upload.read()
+    with stage("dedup"):
+        fingerprint = await dedup.fingerprint(image_bytes)
+        duplicate = await dedup.claim(fingerprint, image_id)
+    if duplicate is not None:
+        # 复用原记录，不保存本次上传
+        await upload.discard()
+        return _duplicate_response(duplicate)
     
-    # 存储图像向量
-    await storage_service.save_embedding(image_id, image_bytes, ai_result)
+    # 保存图片与 AI 识别并行 (相同图片命中缓存时不调用模型)
+    save_task = asyncio.create_task(upload.save_as(image_id))
+    try:
+        try:
+            ai_result = await detection_service.detect(image_bytes, upload.sha256)
+        except InferenceError as e:
+            raise HTTPException(status_code=_inference_status(e), detail=str(e))
+        finally:
+            image_path = await save_task
+        
+        # 识别结果与图像向量由后台批量写入，不阻塞响应
+        await _submit_detection(
+            writer,
+            dedup,
+            DamageCreate(
+                id=image_id,
+                image_path=image_path,
+                ai_result=ai_result,
+                phash=to_signed(fingerprint) if fingerprint is not None else None
+            ),
+            image_bytes
+        )
+    except BaseException:
+        # 识别或提交失败，作废索引条目，等待中的重复帧自行识别
+        dedup.discard(image_id)
+        raise
     
     return DamageDetectionResponse(
         id=image_id,
@@ -57,20 +184,346 @@ async def detect_damage(file: UploadFile = File(...)):
     )
 
 
+@router.post("/detect/stream")
+async def detect_damage_stream(
+    file: UploadFile = File(...),
+    tokens: bool = Query(False, description="是否推送模型原始输出片段"),
+    storage_service: StorageService = Depends(get_storage_service),
+    detection_service: DetectionService = Depends(get_detection_service),
+    writer: WriteBehindWriter = Depends(get_writer),
+    dedup: NearDuplicateIndex = Depends(get_dedup_index)
+):
+    """
+    流式检测道路病害 (server-sent events)
+    
+    事件顺序：accepted (图片已接收) → damage (每解析出一条病害推送一次，
+    tokens=true 时穿插 token) → result (完整的 DamageDetectionResponse)；
+    推理失败时以 error 事件结束。近似重复帧在 accepted 之后直接返回
+    原记录的 result (deduplicated 为 true)。
+    
+    Args:
+        file: 上传的图片文件
+        tokens: 是否推送模型原始输出片段
+        
+    Returns:
+        text/event-stream 响应
+    """
+    try:
+        upload = await ingest_upload(file, storage_service.file_store)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    image_id = str(uuid.uuid4())
+    image_url = f"/uploads/{image_id}.jpg"
+    
+    async def stream():
+        image_bytes = await upload.read()
+        with stage("dedup"):
+            fingerprint = await dedup.fingerprint(image_bytes)
+            duplicate = await dedup.claim(fingerprint, image_id)
+        if duplicate is not None:
+            await upload.discard()
+            response = _duplicate_response(duplicate)
+            yield _sse("accepted", {"id": response.id, "image_url": response.image_url})
+            yield _sse("result", response.model_dump())
+            return
+        
+        # 保存图片与识别并行
+        save_task = asyncio.create_task(upload.save_as(image_id))
+        submitted = False
+        try:
+            try:
+                yield _sse("accepted", {"id": image_id, "image_url": image_url})
+                async for event, data in detection_service.detect_stream(
+                    image_bytes, upload.sha256
+                ):
+                    if event == "token":
+                        if tokens:
+                            yield _sse("token", {"text": data})
+                    elif event == "damage":
+                        yield _sse("damage", data)
+                    else:
+                        ai_result = data
+            except InferenceError as e:
+                yield _sse("error", {"status": _inference_status(e), "detail": str(e)})
+                return
+            finally:
+                image_path = await save_task
+            
+            # 识别结果与图像向量由后台批量写入
+            await _submit_detection(
+                writer,
+                dedup,
+                DamageCreate(
+                    id=image_id,
+                    image_path=image_path,
+                    ai_result=ai_result,
+                    phash=to_signed(fingerprint) if fingerprint is not None else None
+                ),
+                image_bytes
+            )
+            submitted = True
+        finally:
+            # 识别失败、客户端断开或未提交时作废索引条目
+            if not submitted:
+                dedup.discard(image_id)
+        
+        response = DamageDetectionResponse(
+            id=image_id,
+            image_url=image_url,
+            damages=ai_result.get("damages", []),
+            risk_level=ai_result.get("riskLevel", "未知")
+        )
+        yield _sse("result", response.model_dump())
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _collect_batch_images(files: List[UploadFile]) -> list:
+    """读取批量上传内容，展开 zip 压缩包，返回 (文件名, 字节) 列表"""
+    images = []
+    for file in files:
+        content_type = file.content_type or ""
+        filename = file.filename or ""
+        
+        if content_type in ("application/zip", "application/x-zip-compressed") \
+                or filename.lower().endswith(".zip"):
+            data = await file.read()
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if PurePath(info.filename).suffix.lower() not in IMAGE_EXTENSIONS:
+                            continue
+                        if info.file_size > settings.MAX_FILE_SIZE:
+                            raise HTTPException(
+                                status_code=413,
+                                detail=f"压缩包内文件过大: {info.filename}"
+                            )
+                        with archive.open(info) as entry:
+                            if sniff_image_type(entry.read(12)) is None:
+                                continue
+                        images.append((info.filename, archive.read(info)))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"无效的压缩包: {filename}")
+        else:
+            try:
+                upload = await ingest_upload(file)
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=f"{filename}: {str(e)}")
+            except UnsupportedImageError:
+                raise HTTPException(
+                    status_code=400, detail=f"只支持图片或 zip 文件: {filename}"
+                )
+            images.append((filename, await upload.read()))
+        
+        if len(images) > settings.MAX_BATCH_FILES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"单次最多上传 {settings.MAX_BATCH_FILES} 张图片"
+            )
+    
+    if not images:
+        raise HTTPException(status_code=400, detail="未找到可识别的图片")
+    return images
+
+
+async def _detect_one(
+    storage_service: StorageService,
+    detection_service: DetectionService,
+    dedup: NearDuplicateIndex,
+    writer: WriteBehindWriter,
+    item: tuple
+) -> Union[DamageCreate, HashEntry]:
+    """
+    批量模式下处理单张图片：保存文件、识别并提交后写
+    
+    Returns:
+        提交的记录；近似重复时返回命中的索引条目
+    """
+    _, image_bytes = item
+    image_id = str(uuid.uuid4())
+    with stage("dedup"):
+        fingerprint = await dedup.fingerprint(image_bytes)
+        duplicate = await dedup.claim(fingerprint, image_id)
+    if duplicate is not None:
+        return duplicate
+    
+    try:
+        image_path = await storage_service.save_image(image_id, image_bytes)
+        ai_result = await detection_service.detect(image_bytes)
+        record = DamageCreate(
+            id=image_id,
+            image_path=image_path,
+            ai_result=ai_result,
+            phash=to_signed(fingerprint) if fingerprint is not None else None
+        )
+        await _submit_detection(writer, dedup, record, image_bytes)
+    except BaseException:
+        dedup.discard(image_id)
+        raise
+    return record
+
+
+@router.post("/detect/batch")
+async def detect_damage_batch(
+    files: List[UploadFile] = File(...),
+    storage_service: StorageService = Depends(get_storage_service),
+    detection_service: DetectionService = Depends(get_detection_service),
+    inference_scheduler: InferenceScheduler = Depends(get_inference_scheduler),
+    dedup: NearDuplicateIndex = Depends(get_dedup_index),
+    writer: WriteBehindWriter = Depends(get_writer)
+):
+    """
+    批量检测道路病害
+    
+    支持多张图片或 zip 压缩包。图片经推理调度器并发识别，
+    每完成一张即以 NDJSON 行返回；识别结果与单张检测一样交给后写队列，
+    按批合并写入，失败重试并转入死信。
+    近似重复的图片复用已有记录的结果，不新建记录。
+    
+    Args:
+        files: 上传的图片或 zip 文件
+        
+    Returns:
+        NDJSON 流，每行一个识别结果，最后一行为汇总
+    """
+    images = await _collect_batch_images(files)
+    
+    async def stream():
+        succeeded = failed = deduplicated = 0
+        
+        detect_one = functools.partial(
+            _detect_one, storage_service, detection_service, dedup, writer
+        )
+        async for item, result, error in inference_scheduler.map_unordered(
+            detect_one, images
+        ):
+            filename = item[0]
+            if error is not None:
+                failed += 1
+                line = {"filename": filename, "success": False, "error": str(error)}
+            elif isinstance(result, HashEntry):
+                succeeded += 1
+                deduplicated += 1
+                response = _duplicate_response(result)
+                line = {"filename": filename, "success": True, **response.model_dump()}
+            else:
+                succeeded += 1
+                record = result
+                response = DamageDetectionResponse(
+                    id=record.id,
+                    image_url=f"/uploads/{record.id}.jpg",
+                    damages=record.ai_result.get("damages", []),
+                    risk_level=record.ai_result.get("riskLevel", "未知")
+                )
+                line = {"filename": filename, "success": True, **response.model_dump()}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        
+        yield json.dumps({
+            "summary": True,
+            "total": len(images),
+            "succeeded": succeeded,
+            "failed": failed,
+            "deduplicated": deduplicated
+        }, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.get("/similar/{damage_id}")
-async def find_similar_damages(damage_id: str, limit: int = 5):
+async def find_similar_damages(
+    damage_id: str,
+    limit: int = Query(5, ge=1, le=100),
+    # offset + limit (含被排除的查询记录本身) 不超过 HNSW 索引一次能返回的候选数
+    offset: int = Query(0, ge=0, le=HNSW_MAX_EF_SEARCH - 101),
+    type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    storage_service: StorageService = Depends(get_storage_service)
+):
     """
     查找相似病害案例
     
     Args:
         damage_id: 病害记录ID
         limit: 返回数量
+        offset: 跳过的结果数量 (分页)
+        type: 病害类型过滤
+        severity: 严重程度过滤
+        start: 起始时间 (含)
+        end: 截止时间 (不含)
         
     Returns:
         相似病害列表
     """
-    similar_cases = await storage_service.find_similar(damage_id, limit)
+    filters = SimilarityFilter(
+        damage_type=type,
+        severity=severity,
+        start=start,
+        end=end
+    )
+    try:
+        similar_cases = await storage_service.find_similar(
+            damage_id, limit, offset, filters
+        )
+    except VectorStoreError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return {
         "damage_id": damage_id,
+        "limit": limit,
+        "offset": offset,
         "similar_cases": similar_cases
     }
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    detection_service: DetectionService = Depends(get_detection_service)
+):
+    """获取识别结果缓存命中统计"""
+    return detection_service.cache.stats()
+
+
+@router.get("/dedup/stats")
+async def get_dedup_stats(dedup: NearDuplicateIndex = Depends(get_dedup_index)):
+    """获取近似重复帧抑制统计"""
+    return dedup.stats()
+
+
+@router.get("/persistence/stats")
+async def get_persistence_stats(writer: WriteBehindWriter = Depends(get_writer)):
+    """获取识别结果后写队列统计"""
+    return writer.stats()
+
+
+@router.get("/preprocess/stats")
+async def get_preprocess_stats(
+    detection_service: DetectionService = Depends(get_detection_service)
+):
+    """获取图片预处理累计统计"""
+    return detection_service.preprocessor.stats()
+
+
+@router.get("/tiling/stats")
+async def get_tiling_stats(
+    detection_service: DetectionService = Depends(get_detection_service)
+):
+    """获取大图分块识别累计统计"""
+    return detection_service.tiler.stats()
+
+
+@router.get("/triage/stats")
+async def get_triage_stats(
+    detection_service: DetectionService = Depends(get_detection_service)
+):
+    """获取推理前预筛的跳过率与抽样复核统计"""
+    return detection_service.triage.stats()
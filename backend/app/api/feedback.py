@@ -1,13 +1,29 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas.damage import DamageFeedback
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from datetime import date
+from app.api.deps import get_stats_service, get_storage_service
+from app.core.config import settings
+from app.schemas.damage import DamageFeedback, DamageFeedbackBatch
 from app.services.storage_service import StorageService
+from app.services.stats_service import StatsService
 
 router = APIRouter()
-storage_service = StorageService()
+
+
+def _feedback_message(count_before: int, count_after: int) -> str:
+    """修正总数跨过重训练阈值时提示可触发模型优化"""
+    threshold = settings.RETRAIN_THRESHOLD
+    if count_after // threshold > count_before // threshold:
+        return f"已收集 {count_after} 条修正数据，可触发模型优化"
+    return "反馈已保存"
 
 
 @router.post("/feedback")
-async def submit_feedback(feedback: DamageFeedback):
+async def submit_feedback(
+    feedback: DamageFeedback,
+    storage_service: StorageService = Depends(get_storage_service),
+    stats_service: StatsService = Depends(get_stats_service)
+):
     """
     提交用户修正数据
     
@@ -18,29 +34,103 @@ async def submit_feedback(feedback: DamageFeedback):
         保存状态
     """
     try:
-        await storage_service.save_correction(
+        correction_count = await storage_service.save_correction(
             damage_id=feedback.damage_id,
-            corrected_data=feedback.corrected
+            corrected_data=feedback.corrected.model_dump()
         )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if correction_count is None:
+        raise HTTPException(status_code=404, detail="病害记录不存在")
+    
+    stats_service.invalidate()
+    return {
+        "success": True,
+        "message": _feedback_message(correction_count - 1, correction_count),
+        "correction_count": correction_count
+    }
+
+
+@router.post("/feedback/batch")
+async def submit_feedback_batch(
+    batch: DamageFeedbackBatch,
+    storage_service: StorageService = Depends(get_storage_service),
+    stats_service: StatsService = Depends(get_stats_service)
+):
+    """
+    批量提交用户修正数据
+    
+    整批在一条语句中写入，同一记录出现多次时以最后一条为准。
+    
+    Args:
+        batch: 修正数据列表
         
-        # 检查是否需要触发重训练
-        correction_count = await storage_service.get_correction_count()
-        
-        message = "反馈已保存"
-        if correction_count % 100 == 0:
-            message = f"已收集 {correction_count} 条修正数据，可触发模型优化"
-        
-        return {
-            "success": True,
-            "message": message,
-            "correction_count": correction_count
-        }
+    Returns:
+        保存状态及未找到的记录ID
+    """
+    if len(batch.items) > settings.FEEDBACK_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"单次最多提交 {settings.FEEDBACK_BATCH_MAX} 条修正"
+        )
+    
+    items = [
+        (feedback.damage_id, feedback.corrected.model_dump())
+        for feedback in batch.items
+    ]
+    try:
+        correction_count, saved_ids = await storage_service.save_corrections(items)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    saved = set(saved_ids)
+    missing = sorted({damage_id for damage_id, _ in items} - saved)
+    inserted = sum(1 for damage_id, _ in items if damage_id in saved)
+    
+    stats_service.invalidate()
+    return {
+        "success": True,
+        "message": _feedback_message(correction_count - inserted, correction_count),
+        "saved": inserted,
+        "missing_ids": missing,
+        "correction_count": correction_count
+    }
 
 
 @router.get("/stats")
-async def get_statistics():
+async def get_statistics(stats_service: StatsService = Depends(get_stats_service)):
     """获取统计数据"""
-    stats = await storage_service.get_statistics()
+    stats = await stats_service.get_statistics()
     return stats
+
+
+@router.get("/stats/timeseries")
+async def get_statistics_timeseries(
+    dimension: str = "total",
+    bucket: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    stats_service: StatsService = Depends(get_stats_service)
+):
+    """
+    获取按时间分桶的统计数据
+    
+    Args:
+        dimension: 统计维度 (total/type/severity/risk_level/corrected)
+        bucket: 时间粒度 (day/week/month)
+        start: 起始日期 (含)
+        end: 截止日期 (不含)
+        
+    Returns:
+        按时间升序的分桶统计
+    """
+    try:
+        series = await stats_service.get_timeseries(dimension, bucket, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "dimension": dimension,
+        "bucket": bucket,
+        "series": series
+    }
@@ -1,15 +1,17 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from app.core.config import settings
 
 router = APIRouter()
 
 
 @router.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """健康检查"""
+    endpoints = request.app.state.services.detection.llm.status()
     return {
         "status": "healthy",
         "app": settings.APP_NAME,
         "ollama": settings.OLLAMA_BASE_URL,
-        "model": settings.OLLAMA_MODEL
+        "model": settings.OLLAMA_MODEL,
+        "inference_endpoints": endpoints
     }
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends
+
+from app.api.deps import get_storage_service
+from app.services.storage_service import StorageService
+from app.schemas.damage import DamageDetectionResponse, JobStatusResponse
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(
+    job_id: str,
+    storage_service: StorageService = Depends(get_storage_service)
+):
+    """
+    查询异步检测任务
+    
+    Args:
+        job_id: 任务ID (即病害记录ID)
+        
+    Returns:
+        任务状态，完成时附带识别结果
+    """
+    job = await storage_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    result = None
+    if job["status"] == "completed" and job["ai_result"] is not None:
+        ai_result = job["ai_result"]
+        result = DamageDetectionResponse(
+            id=job_id,
+            image_url=f"/uploads/{job_id}.jpg",
+            damages=ai_result.get("damages", []),
+            risk_level=ai_result.get("riskLevel", "未知")
+        )
+    
+    return JobStatusResponse(
+        job_id=job_id,
+        status=job["status"],
+        attempts=job["attempts"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        result=result
+    )
@@ -0,0 +1,305 @@
+import bisect
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图桶上限 (秒)，覆盖毫秒级数据库操作到数十秒的推理
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+# 当前请求的阶段耗时 [(阶段, 秒)]，用于 Server-Timing 响应头
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增计数"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set(self, value: float, *label_values):
+        """写入组件自行累计的总数 (由采集函数调用)"""
+        self._values[label_values] = value
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name, _format_labels(self.labels, values), value
+
+
+class Gauge:
+    """可增可减的瞬时值"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name, _format_labels(self.labels, values), value
+
+
+class Histogram:
+    """
+    累积直方图
+
+    observe 只做一次二分查找与两次加法，可在热路径上常开。
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # 标签值 → [各桶计数 (非累积, 最后一个为 +Inf), 总和]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        entry = self._values.get(label_values)
+        if entry is None:
+            entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for values, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labels, values, le),
+                    cumulative
+                )
+            yield f"{self.name}_sum", _format_labels(self.labels, values), total
+            yield f"{self.name}_count", _format_labels(self.labels, values), cumulative
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+
+    进程内指标直接累加；连接池、缓存等已有统计的组件注册采集函数，
+    在抓取时读取当前值，热路径上没有额外开销。输出 Prometheus 文本格式。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help, labels))
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """注册抓取时执行的采集函数 (通常把组件统计写入 Gauge)"""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            # 单个组件统计失败不影响其余指标
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"指标采集失败: {str(e)}")
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "road_stage_duration_seconds", "各处理阶段耗时", ("stage",)
+)
+STAGE_IN_FLIGHT = registry.gauge(
+    "road_stage_in_flight", "各处理阶段正在进行的数量", ("stage",)
+)
+STAGE_ERRORS = registry.counter(
+    "road_stage_errors_total", "各处理阶段抛出异常的次数", ("stage",)
+)
+
+
+# HTTP 请求
+HTTP_DURATION = registry.histogram(
+    "road_http_request_duration_seconds", "HTTP 请求耗时 (至响应头发出)",
+    ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "road_http_requests_in_flight", "正在处理的 HTTP 请求数"
+)
+
+# 由 ServiceContainer.collect_metrics 在抓取时写入
+DB_POOL_SIZE = registry.gauge("road_db_pool_size", "数据库连接池当前连接数")
+DB_POOL_IDLE = registry.gauge("road_db_pool_idle", "数据库连接池空闲连接数")
+DB_POOL_MAX = registry.gauge("road_db_pool_max_size", "数据库连接池最大连接数")
+DB_POOL_UTILIZATION = registry.gauge(
+    "road_db_pool_utilization", "数据库连接池使用率 (使用中 / 最大连接数)"
+)
+CACHE_HITS = registry.counter("road_cache_hits_total", "缓存命中次数", ("cache",))
+CACHE_MISSES = registry.counter("road_cache_misses_total", "缓存未命中次数", ("cache",))
+CACHE_HIT_RATE = registry.gauge("road_cache_hit_rate", "缓存累计命中率", ("cache",))
+INFERENCE_IN_FLIGHT = registry.gauge(
+    "road_inference_in_flight", "推理节点在途请求数", ("endpoint",)
+)
+INFERENCE_BREAKER_OPEN = registry.gauge(
+    "road_inference_breaker_open", "推理节点熔断状态 (非 closed 时为 1)", ("endpoint",)
+)
+INFERENCE_FAILURES = registry.counter(
+    "road_inference_failures_total", "推理节点失败次数", ("endpoint",)
+)
+WRITE_PENDING = registry.gauge("road_write_pending", "后写队列中待写入的条目数")
+WRITE_DEAD_LETTERED = registry.counter(
+    "road_write_dead_lettered_total", "后写重试耗尽转入死信的条目数"
+)
+TRIAGE_EVALUATED = registry.counter("road_triage_evaluated_total", "预筛图片数")
+TRIAGE_SKIPPED = registry.counter("road_triage_skipped_total", "预筛后跳过推理的图片数")
+
+
+@contextmanager
+def stage(name: str):
+    """
+    阶段计时
+
+    记录耗时直方图、进行中数量与异常次数，并追加到当前请求的 Server-Timing。
+    同步与异步代码中均以 with 使用::
+
+        with stage("inference"):
+            result = await llm.ainvoke(messages)
+    """
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+
+    STAGE_IN_FLIGHT.inc(name)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # 取消与客户端断开 (CancelledError / GeneratorExit) 不计为异常
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(name)
+        STAGE_DURATION.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name: str):
+    """以阶段计时包装整个异步函数"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def begin_request_timings() -> List[Tuple[str, float]]:
+    """为当前请求开始收集阶段耗时 (由中间件调用)"""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    生成 Server-Timing 响应头
+
+    同名阶段 (如批量中多次推理) 合并耗时并标注次数。
+    """
+    merged: Dict[str, list] = {}
+    for name, elapsed in timings:
+        entry = merged.setdefault(name, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+
+    parts = []
+    for name, (elapsed, count) in merged.items():
+        part = f"{name};dur={elapsed * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
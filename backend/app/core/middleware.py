@@ -0,0 +1,144 @@
+import json
+import time
+
+from starlette.exceptions import HTTPException
+
+from app.core.metrics import (
+    HTTP_DURATION, HTTP_IN_FLIGHT, begin_request_timings, server_timing_header
+)
+
+
+class BodySizeLimitMiddleware:
+    """
+    请求体大小限制
+
+    按路径前缀限制请求体大小：Content-Length 超限时在解析前直接返回 413 (无法解析时返回 400)；
+    分块传输时边接收边计数，超限立即中止，避免整个请求体先被缓冲到内存或磁盘。
+    """
+
+    def __init__(self, app, limits: dict):
+        """
+        Args:
+            limits: {路径前缀: 最大字节数}，最长前缀优先匹配
+        """
+        self.app = app
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str):
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                length = int(content_length)
+            except ValueError:
+                length = -1
+            if length < 0:
+                await self._reject(send, 400, "无效的 Content-Length")
+                return
+            if length > limit:
+                await self._reject(send, 413, f"请求体超过 {limit} 字节")
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=f"请求体超过 {limit} 字节")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class MetricsMiddleware:
+    """
+    请求耗时与 Server-Timing
+
+    按路由模板 (而非实际路径，避免标签基数膨胀) 记录请求耗时与在途请求数；
+    server_timing 为 True 时把本请求各阶段耗时写入 Server-Timing 响应头。
+    流式响应的响应头先于处理过程发出，只包含发出前已完成的阶段。
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = begin_request_timings()
+        start = time.perf_counter()
+        started = False
+
+        async def timed_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                elapsed = time.perf_counter() - start
+                HTTP_DURATION.observe(
+                    elapsed, scope["method"], _route_of(scope), str(message["status"])
+                )
+                if self.server_timing:
+                    header = server_timing_header(timings, elapsed)
+                    message = {
+                        **message,
+                        "headers": [
+                            *message.get("headers", []),
+                            (b"server-timing", header.encode())
+                        ]
+                    }
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # 未发出响应即抛出异常，由外层返回 500
+            if not started:
+                HTTP_DURATION.observe(
+                    time.perf_counter() - start, scope["method"], _route_of(scope), "500"
+                )
+
+
+def _route_of(scope) -> str:
+    """路由模板；挂载的静态目录取挂载前缀，未匹配的请求归为一类"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        return scope.get("root_path") or "unmatched"
+    return "unmatched"
@@ -1,32 +1,52 @@
 import asyncpg
+from datetime import date
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# damage_items 枚举列的取值，与识别提示词一致；超出范围的值记为 其他/未知
+DAMAGE_TYPES = ("坑槽", "裂缝", "网裂", "沉陷", "滑坡", "坍塌", "其他")
+DAMAGE_SEVERITIES = ("轻微", "中等", "严重", "危险", "未知")
 
-async def init_db():
-    """初始化数据库表结构"""
+# 建表迁移与分区维护共用的 advisory lock，多进程部署时同一时刻只有一个进程执行
+MAINTENANCE_LOCK_KEY = 0x64616D67
+
+
+async def init_db(pool=None):
+    """
+    初始化数据库表结构
+    
+    Args:
+        pool: 应用连接池，提供时复用其中的连接，否则单独建立连接
+    """
+    conn = await pool.acquire() if pool else await asyncpg.connect(settings.DATABASE_URL)
+    locked = False
     try:
-        conn = await asyncpg.connect(settings.DATABASE_URL)
+        # 多个进程同时启动时排队执行，建表、迁移与触发器 DDL 不会并发
+        await conn.execute("SELECT pg_advisory_lock($1)", MAINTENANCE_LOCK_KEY)
+        locked = True
         
         # 创建 pgvector 扩展
         await conn.execute("CREATE EXTENSION IF NOT EXISTS vector;")
         
-        # 创建病害记录表
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS damages (
-                id VARCHAR(36) PRIMARY KEY,
-                image_path TEXT NOT NULL,
-                damage_type VARCHAR(50),
-                severity VARCHAR(20),
-                location VARCHAR(200),
-                ai_result JSONB,
-                user_corrected JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP
-            );
-        """)
+        # 创建病害记录表 (启用分区时按 created_at 按月分区，已有的普通表会被迁移)
+        if settings.DB_PARTITIONING:
+            await _init_partitioned_damages(conn)
+        else:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS damages (
+                    id VARCHAR(36) PRIMARY KEY,
+                    image_path TEXT NOT NULL,
+                    damage_type VARCHAR(50),
+                    severity VARCHAR(20),
+                    location VARCHAR(200),
+                    ai_result JSONB,
+                    user_corrected JSONB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP
+                );
+            """)
         
         # 创建索引
         await conn.execute("""
@@ -39,30 +59,530 @@ async def init_db():
             ON damages(created_at DESC);
         """)
         
-        # 创建修正记录表
+        # 列表接口按 (created_at, id) 键集分页
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_damages_created_id
+            ON damages(created_at DESC, id DESC);
+        """)
+        
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_damages_type_created
+            ON damages(damage_type, created_at DESC, id DESC);
+        """)
+        
+        # 异步任务状态列 (已有记录视为已完成)
+        await conn.execute("""
+            ALTER TABLE damages
+                ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'completed',
+                ADD COLUMN IF NOT EXISTS error TEXT,
+                ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS started_at TIMESTAMP;
+        """)
+        
+        # 图片感知哈希，用于近似重复帧判断
+        await conn.execute("""
+            ALTER TABLE damages ADD COLUMN IF NOT EXISTS phash BIGINT;
+        """)
+        
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_damages_job_queue
+            ON damages(created_at)
+            WHERE status IN ('pending', 'processing');
+        """)
+        
+        # 创建修正记录表 (damages 分区后主键含 created_at，不再设外键)
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS damage_corrections (
                 id SERIAL PRIMARY KEY,
-                damage_id VARCHAR(36) REFERENCES damages(id),
+                damage_id VARCHAR(36) NOT NULL,
                 corrected_data JSONB NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
         
+        # 计数器表，修正总数随写入原子累加，避免 COUNT(*) 全表扫描
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS app_counters (
+                name VARCHAR(50) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0
+            );
+        """)
+        
+        await conn.execute("""
+            INSERT INTO app_counters (name, value)
+            SELECT 'corrections', COUNT(*) FROM damage_corrections
+            ON CONFLICT (name) DO NOTHING;
+        """)
+        
         # 创建图像向量表 (如果需要在 PostgreSQL 中存储)
         await conn.execute("""
             CREATE TABLE IF NOT EXISTS damage_vectors (
                 id SERIAL PRIMARY KEY,
-                damage_id VARCHAR(36) REFERENCES damages(id),
+                damage_id VARCHAR(36) NOT NULL,
                 embedding vector(512),
                 metadata JSONB,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
         
-        await conn.close()
+        # 每条病害记录一个向量，相似查询使用 HNSW 余弦索引
+        await conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_damage_vectors_damage
+            ON damage_vectors(damage_id);
+        """)
+        
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_damage_vectors_embedding
+            ON damage_vectors USING hnsw (embedding vector_cosine_ops);
+        """)
+        
+        # 创建识别结果缓存表
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS detection_cache (
+                cache_key VARCHAR(128) PRIMARY KEY,
+                ai_result JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        # 已归档到冷存储的记录索引 (记录ID → 归档文件)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS damage_archive (
+                damage_id VARCHAR(36) PRIMARY KEY,
+                archive VARCHAR(64) NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                risk_level VARCHAR(50),
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        
+        await _init_statistics(conn)
+        await _init_damage_items(conn)
+        await _init_change_counter(conn)
+        
         logger.info("数据库初始化成功")
         
     except Exception as e:
         logger.error(f"数据库初始化失败: {str(e)}")
         raise
+    finally:
+        try:
+            if locked:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_KEY)
+        finally:
+            if pool:
+                await pool.release(conn)
+            else:
+                await conn.close()
+
+
+async def _init_partitioned_damages(conn):
+    """
+    创建按月分区的 damages 表
+    
+    表不存在时直接创建；已是普通表时在一个事务中迁移：改名为 damages_legacy，
+    建分区表和覆盖历史数据的分区，复制数据后删除旧表 (连同依赖旧表的外键
+    和以旧表行类型为参数的函数)。复制发生在触发器建立之前，统计计数与
+    病害明细不会重复累加。迁移期间持有维护锁，其余进程的启动会等待迁移完成，
+    数据量大时应在维护窗口内开启 DB_PARTITIONING。
+    """
+    # 建立 [from_month, to_month] 范围内缺失的月分区，返回新建数量。
+    # 默认分区中已有该月的记录时 (时间超出预建范围写入的)，先取出再建分区，
+    # 之后重新写入，记录落到对应的月分区
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damage_partitions_ensure(from_month DATE, to_month DATE)
+        RETURNS INTEGER AS $$
+        DECLARE
+            month DATE := date_trunc('month', from_month)::date;
+            next_month DATE;
+            partition_name TEXT;
+            moved INTEGER;
+            created INTEGER := 0;
+        BEGIN
+            WHILE month <= to_month LOOP
+                partition_name := 'damages_' || to_char(month, 'YYYY_MM');
+                next_month := (month + INTERVAL '1 month')::date;
+                IF to_regclass(partition_name) IS NULL THEN
+                    CREATE TEMP TABLE damage_partition_moving ON COMMIT DROP AS
+                        SELECT * FROM damages_default
+                        WHERE created_at >= month AND created_at < next_month;
+                    GET DIAGNOSTICS moved = ROW_COUNT;
+                    IF moved > 0 THEN
+                        DELETE FROM damages_default
+                        WHERE created_at >= month AND created_at < next_month;
+                    END IF;
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF damages FOR VALUES FROM (%L) TO (%L)',
+                        partition_name, month, next_month
+                    );
+                    IF moved > 0 THEN
+                        INSERT INTO damages SELECT * FROM damage_partition_moving;
+                    END IF;
+                    DROP TABLE damage_partition_moving;
+                    created := created + 1;
+                END IF;
+                month := next_month;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    
+    kind = await conn.fetchval(
+        "SELECT relkind::text FROM pg_class WHERE oid = to_regclass('damages')"
+    )
+    if kind == "p":
+        return
+    
+    async with conn.transaction():
+        if kind == "r":
+            logger.info("迁移 damages 为分区表...")
+            await conn.execute("""
+                ALTER TABLE damages
+                    ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'completed',
+                    ADD COLUMN IF NOT EXISTS error TEXT,
+                    ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS started_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS phash BIGINT;
+                ALTER TABLE damages RENAME TO damages_legacy;
+            """)
+        
+        await conn.execute("""
+            CREATE TABLE damages (
+                id VARCHAR(36) NOT NULL,
+                image_path TEXT NOT NULL,
+                damage_type VARCHAR(50),
+                severity VARCHAR(20),
+                location VARCHAR(200),
+                ai_result JSONB,
+                user_corrected JSONB,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP,
+                status VARCHAR(20) NOT NULL DEFAULT 'completed',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                started_at TIMESTAMP,
+                phash BIGINT,
+                CONSTRAINT damages_partitioned_pkey PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+            
+            CREATE TABLE damages_default PARTITION OF damages DEFAULT;
+        """)
+        
+        first_month = None
+        if kind == "r":
+            first_month = await conn.fetchval(
+                "SELECT MIN(created_at)::date FROM damages_legacy"
+            )
+        await conn.execute(
+            "SELECT damage_partitions_ensure($1, $2)",
+            first_month or date.today(),
+            add_months(date.today(), settings.PARTITION_PREMAKE_MONTHS)
+        )
+        
+        if kind == "r":
+            await conn.execute("""
+                INSERT INTO damages (
+                    id, image_path, damage_type, severity, location, ai_result,
+                    user_corrected, created_at, updated_at, status, error,
+                    attempts, started_at, phash
+                )
+                SELECT
+                    id, image_path, damage_type, severity, location, ai_result,
+                    user_corrected, COALESCE(created_at, updated_at, CURRENT_TIMESTAMP),
+                    updated_at, status, error, attempts, started_at, phash
+                FROM damages_legacy;
+                
+                DROP TABLE damages_legacy CASCADE;
+            """)
+            logger.info("damages 分区迁移完成")
+
+
+def add_months(day: date, months: int) -> date:
+    """day 所在月份之后第 months 个月的第一天"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def _init_statistics(conn):
+    """创建统计计数表及维护触发器，首次启用时从历史数据回填"""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS damage_stats (
+            bucket_date DATE NOT NULL,
+            dimension VARCHAR(20) NOT NULL,
+            value VARCHAR(50) NOT NULL,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_date, dimension, value)
+        );
+    """)
+    
+    # 单条记录对各维度计数的增减 (仅统计已完成的识别记录)
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damage_stats_record(rec damages, delta INTEGER)
+        RETURNS VOID AS $$
+        DECLARE
+            day DATE := COALESCE(rec.created_at, CURRENT_TIMESTAMP)::date;
+        BEGIN
+            INSERT INTO damage_stats (bucket_date, dimension, value, count)
+            VALUES
+                (day, 'total', '全部', delta),
+                (day, 'type', COALESCE(rec.damage_type, '未知'), delta),
+                (day, 'severity', COALESCE(rec.severity, '未知'), delta),
+                (day, 'risk_level', LEFT(COALESCE(rec.ai_result->>'riskLevel', '未知'), 50), delta),
+                (day, 'corrected',
+                    CASE WHEN rec.user_corrected IS NULL THEN '否' ELSE '是' END, delta)
+            ON CONFLICT (bucket_date, dimension, value)
+            DO UPDATE SET count = damage_stats.count + EXCLUDED.count;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damage_stats_trigger()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' THEN
+                PERFORM damage_stats_record(OLD, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+                PERFORM damage_stats_record(NEW, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    
+    await conn.execute("""
+        DROP TRIGGER IF EXISTS trg_damage_stats ON damages;
+        CREATE TRIGGER trg_damage_stats
+        AFTER INSERT OR DELETE
+            OR UPDATE OF status, damage_type, severity, ai_result, user_corrected, created_at
+        ON damages
+        FOR EACH ROW EXECUTE FUNCTION damage_stats_trigger();
+    """)
+    
+    # 计数表为空而已有数据时回填一次
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE damage_stats IN EXCLUSIVE MODE")
+        needs_backfill = await conn.fetchval("""
+            SELECT NOT EXISTS (SELECT 1 FROM damage_stats)
+               AND EXISTS (SELECT 1 FROM damages WHERE status = 'completed')
+        """)
+        if needs_backfill:
+            logger.info("回填统计计数...")
+            await conn.execute("""
+                INSERT INTO damage_stats (bucket_date, dimension, value, count)
+                SELECT created_at::date, dimension, value, COUNT(*)
+                FROM damages
+                CROSS JOIN LATERAL (VALUES
+                    ('total', '全部'),
+                    ('type', COALESCE(damage_type, '未知')),
+                    ('severity', COALESCE(severity, '未知')),
+                    ('risk_level', LEFT(COALESCE(ai_result->>'riskLevel', '未知'), 50)),
+                    ('corrected',
+                        CASE WHEN user_corrected IS NULL THEN '否' ELSE '是' END)
+                ) AS dims(dimension, value)
+                WHERE status = 'completed'
+                GROUP BY 1, 2, 3
+            """)
+
+
+async def _init_change_counter(conn):
+    """
+    damages 变更计数
+    
+    已完成的识别记录 (列表接口默认列出的内容) 新增、删除、状态进出 completed
+    或可见字段变化时，写语句把 app_counters 中的 damages_version 加一，
+    列表接口据此生成 ETag，数据未变化时无需执行分页查询。任务领取、失败重试等
+    只涉及排队中记录的状态变化不计数，避免任务运行期间 ETag 不断变化、
+    每次状态变化都更新同一行。计数在写事务提交后才可见，读到的计数
+    不会比随后查到的数据更新。
+    """
+    await conn.execute("""
+        INSERT INTO app_counters (name, value)
+        VALUES ('damages_version', 0)
+        ON CONFLICT (name) DO NOTHING;
+    """)
+    
+    # 语句级触发器，比较转换表判断是否有已完成记录发生可见变化
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damages_version_trigger()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            changed BOOLEAN;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                changed := EXISTS (SELECT 1 FROM new_rows WHERE status = 'completed');
+            ELSIF TG_OP = 'DELETE' THEN
+                changed := EXISTS (SELECT 1 FROM old_rows WHERE status = 'completed');
+            ELSE
+                changed := EXISTS (
+                    SELECT 1
+                    FROM old_rows o
+                    JOIN new_rows n ON n.id = o.id
+                    WHERE (o.status = 'completed' OR n.status = 'completed')
+                      AND (o.status, o.damage_type, o.severity, o.location, o.ai_result,
+                           o.user_corrected, o.created_at, o.updated_at)
+                          IS DISTINCT FROM
+                          (n.status, n.damage_type, n.severity, n.location, n.ai_result,
+                           n.user_corrected, n.created_at, n.updated_at)
+                );
+            END IF;
+            IF changed THEN
+                UPDATE app_counters SET value = value + 1 WHERE name = 'damages_version';
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    
+    # 带转换表的触发器只能对应一种事件，分别创建
+    for event, tables in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        name = f"trg_damages_version_{event.lower()}"
+        await conn.execute(f"""
+            DROP TRIGGER IF EXISTS {name} ON damages;
+            CREATE TRIGGER {name}
+            AFTER {event} ON damages
+            REFERENCING {tables}
+            FOR EACH STATEMENT EXECUTE FUNCTION damages_version_trigger();
+        """)
+
+
+async def _ensure_enum(conn, name: str, values: tuple):
+    """创建枚举类型，已存在时补充新增的取值"""
+    exists = await conn.fetchval("SELECT 1 FROM pg_type WHERE typname = $1", name)
+    if not exists:
+        labels = ", ".join(f"'{value}'" for value in values)
+        await conn.execute(f"CREATE TYPE {name} AS ENUM ({labels})")
+        return
+    for value in values:
+        await conn.execute(f"ALTER TYPE {name} ADD VALUE IF NOT EXISTS '{value}'")
+
+
+async def _init_damage_items(conn):
+    """创建病害明细表 (每处病害一行) 及维护触发器，首次启用时从历史数据回填"""
+    await _ensure_enum(conn, "damage_type_enum", DAMAGE_TYPES)
+    await _ensure_enum(conn, "damage_severity_enum", DAMAGE_SEVERITIES)
+    
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS damage_items (
+            damage_id VARCHAR(36) NOT NULL,
+            item_index SMALLINT NOT NULL,
+            damage_type damage_type_enum NOT NULL,
+            severity damage_severity_enum NOT NULL,
+            raw_type VARCHAR(50),
+            location TEXT,
+            size TEXT,
+            suggest_action TEXT,
+            confidence DOUBLE PRECISION,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (damage_id, item_index)
+        );
+    """)
+    
+    # 按类型 + 严重程度筛选、按时间倒序分页
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_damage_items_type_severity
+        ON damage_items(damage_type, severity, created_at DESC);
+    """)
+    
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_damage_items_severity
+        ON damage_items(severity, created_at DESC);
+    """)
+    
+    # ai_result 任意字段的包含查询 (ai_result @> '{...}')
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_damages_ai_result
+        ON damages USING gin (ai_result jsonb_path_ops);
+    """)
+    
+    # 从识别结果展开病害明细，识别结果格式异常时返回空
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damage_items_extract(result JSONB)
+        RETURNS TABLE (
+            item_index SMALLINT,
+            damage_type damage_type_enum,
+            severity damage_severity_enum,
+            raw_type VARCHAR(50),
+            location TEXT,
+            size TEXT,
+            suggest_action TEXT,
+            confidence DOUBLE PRECISION
+        ) AS $$
+            SELECT
+                (e.ord - 1)::smallint,
+                CASE WHEN e.item->>'type' = ANY(enum_range(NULL::damage_type_enum)::text[])
+                     THEN (e.item->>'type')::damage_type_enum
+                     ELSE '其他'::damage_type_enum END,
+                CASE WHEN e.item->>'severity' = ANY(enum_range(NULL::damage_severity_enum)::text[])
+                     THEN (e.item->>'severity')::damage_severity_enum
+                     ELSE '未知'::damage_severity_enum END,
+                LEFT(e.item->>'type', 50),
+                e.item->>'location',
+                e.item->>'size',
+                e.item->>'suggestAction',
+                CASE WHEN jsonb_typeof(e.item->'confidence') = 'number'
+                     THEN (e.item->>'confidence')::float8 END
+            FROM jsonb_array_elements(
+                CASE WHEN jsonb_typeof(result->'damages') = 'array'
+                     THEN result->'damages' ELSE '[]'::jsonb END
+            ) WITH ORDINALITY AS e(item, ord)
+            WHERE jsonb_typeof(e.item) = 'object';
+        $$ LANGUAGE sql IMMUTABLE;
+    """)
+    
+    # 识别记录写入、完成或删除时同步明细 (仅已完成的记录)
+    await conn.execute("""
+        CREATE OR REPLACE FUNCTION damage_items_trigger()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM damage_items WHERE damage_id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+                INSERT INTO damage_items (
+                    damage_id, item_index, damage_type, severity, raw_type,
+                    location, size, suggest_action, confidence, created_at
+                )
+                SELECT NEW.id, x.*, COALESCE(NEW.created_at, CURRENT_TIMESTAMP)
+                FROM damage_items_extract(NEW.ai_result) x;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    
+    await conn.execute("""
+        DROP TRIGGER IF EXISTS trg_damage_items ON damages;
+        CREATE TRIGGER trg_damage_items
+        AFTER INSERT OR DELETE OR UPDATE OF status, ai_result, created_at
+        ON damages
+        FOR EACH ROW EXECUTE FUNCTION damage_items_trigger();
+    """)
+    
+    # 首次启用时回填历史数据 (以 app_counters 中的标记保证只执行一次)
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE damage_items IN EXCLUSIVE MODE")
+        needs_backfill = await conn.fetchval("""
+            INSERT INTO app_counters (name, value)
+            VALUES ('damage_items_backfilled', 1)
+            ON CONFLICT (name) DO NOTHING
+            RETURNING TRUE
+        """)
+        if needs_backfill:
+            logger.info("回填病害明细...")
+            await conn.execute("""
+                INSERT INTO damage_items (
+                    damage_id, item_index, damage_type, severity, raw_type,
+                    location, size, suggest_action, confidence, created_at
+                )
+                SELECT d.id, x.*, COALESCE(d.created_at, CURRENT_TIMESTAMP)
+                FROM damages d
+                CROSS JOIN LATERAL damage_items_extract(d.ai_result) x
+                WHERE d.status = 'completed'
+            """)
@@ -1,11 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import logging
 
-from app.api import detect, feedback, health
+from app.api import damages, detect, feedback, health, jobs, metrics
 from app.core.config import settings
-from app.db.init_db import init_db
+from app.core.middleware import BodySizeLimitMiddleware, MetricsMiddleware
+from app.services.container import ServiceContainer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,9 +17,12 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info("启动应用...")
-    await init_db()
+    services = ServiceContainer()
+    await services.start()
+    app.state.services = services
     yield
     logger.info("关闭应用...")
+    await services.stop()
 
 
 app = FastAPI(
@@ -27,6 +32,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 上传大小限制 (multipart 边界与表单字段预留 1MB)
+# 先于 CORS 添加，位于其内层，413/400 响应同样带 CORS 头，浏览器能读到错误信息
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/api/detect": settings.MAX_FILE_SIZE + 1024 * 1024,
+        "/api/detect/batch": settings.MAX_BATCH_UPLOAD_SIZE,
+    }
+)
+
 # CORS 配置
 app.add_middleware(
     CORSMiddleware,
@@ -36,10 +51,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求耗时指标 (最后添加，位于最外层，计入其余中间件的耗时)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+
 # 注册路由
 app.include_router(health.router, prefix="/api", tags=["健康检查"])
 app.include_router(detect.router, prefix="/api", tags=["病害检测"])
 app.include_router(feedback.router, prefix="/api", tags=["用户反馈"])
+app.include_router(jobs.router, prefix="/api", tags=["异步任务"])
+app.include_router(damages.router, prefix="/api", tags=["病害查询"])
+
+# Prometheus 抓取地址，不带 /api 前缀
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["监控指标"])
+
+# 上传图片静态访问 (支持 ETag / Last-Modified 条件请求)
+app.mount(
+    "/uploads",
+    StaticFiles(directory=settings.UPLOAD_DIR, check_dir=False),
+    name="uploads"
+)
 
 
 @app.get("/")
@@ -19,6 +19,65 @@ class DamageDetectionResponse(BaseModel):
     image_url: str
     damages: List[DamageInfo]
     risk_level: str
+    deduplicated: bool = False  # 与近期识别的图片近似重复，复用了该记录 (id 为原记录)
+
+
+class DamageItemResponse(BaseModel):
+    """病害明细 (一张图片中的一处病害)"""
+    damage_id: str
+    item_index: int
+    type: str
+    severity: str
+    raw_type: Optional[str] = None  # 模型原始输出的类型 (枚举外的值归为 其他)
+    location: Optional[str] = None
+    size: Optional[str] = None
+    suggestAction: Optional[str] = None
+    confidence: Optional[float] = None
+    risk_level: Optional[str] = None
+    image_url: str
+    archived: bool = False
+    created_at: datetime
+
+
+class DetectionSummary(BaseModel):
+    """识别记录 (列表项)"""
+    id: str
+    image_url: str
+    damage_type: Optional[str] = None
+    severity: Optional[str] = None
+    location: Optional[str] = None
+    risk_level: Optional[str] = None
+    corrected: bool = False
+    status: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    ai_result: Optional[Dict[str, Any]] = None  # 仅 include=ai_result 时返回
+    user_corrected: Optional[Dict[str, Any]] = None  # 仅 include=user_corrected 时返回
+
+
+class DetectionListResponse(BaseModel):
+    """识别记录分页列表"""
+    items: List[DetectionSummary]
+    limit: int
+    next_cursor: Optional[str] = None  # 为空表示没有更多
+
+
+class JobAcceptedResponse(BaseModel):
+    """异步检测任务已受理"""
+    job_id: str
+    status: str
+    status_url: str
+
+
+class JobStatusResponse(BaseModel):
+    """异步检测任务状态"""
+    job_id: str
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    result: Optional[DamageDetectionResponse] = None
 
 
 class DamageCreate(BaseModel):
@@ -26,6 +85,8 @@ class DamageCreate(BaseModel):
     id: str
     image_path: str
     ai_result: Dict[str, Any]
+    created_at: Optional[datetime] = None  # 识别完成时间，为空时取写入时间
+    phash: Optional[int] = None  # 感知哈希 (有符号 64 位)
 
 
 class DamageCorrectedData(BaseModel):
@@ -40,3 +101,8 @@ class DamageFeedback(BaseModel):
     """用户反馈"""
     damage_id: str
     corrected: DamageCorrectedData
+
+
+class DamageFeedbackBatch(BaseModel):
+    """批量用户反馈"""
+    items: List[DamageFeedback]
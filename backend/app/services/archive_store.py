@@ -0,0 +1,93 @@
+import json
+import os
+import uuid
+import zipfile
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+
+
+class ArchiveWriter:
+    """
+    写入中的归档文件
+
+    先写到同目录临时文件，commit 时原子重命名，失败时 discard 删除。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        self._zip = zipfile.ZipFile(self.tmp_path, "w")
+        self.records = 0
+        self.images = 0
+
+    def add(self, records: List[dict]):
+        """追加一批记录及其图片 (图片文件不存在时跳过)"""
+        for record in records:
+            damage_id = record["id"]
+            self._zip.writestr(
+                f"records/{damage_id}.json",
+                json.dumps(record, ensure_ascii=False, default=str),
+                compress_type=zipfile.ZIP_DEFLATED
+            )
+            self.records += 1
+
+            image_path = record.get("image_path")
+            if image_path and os.path.exists(image_path):
+                # JPEG 本身已压缩，直接存储
+                self._zip.write(
+                    image_path, f"images/{damage_id}.jpg", compress_type=zipfile.ZIP_STORED
+                )
+                self.images += 1
+
+    def commit(self):
+        self._zip.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self._zip.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ArchiveStore:
+    """
+    冷存储
+
+    每个归档分区对应一个 zip 文件：records/{id}.json 为完整记录 (压缩)，
+    images/{id}.jpg 为原图。zip 的中央目录支持按记录ID随机读取，
+    无需解压整个归档。所有方法均为同步 IO，调用方放到线程中执行。
+    """
+
+    def __init__(self, root: str = None):
+        self.root = Path(root or settings.ARCHIVE_DIR)
+
+    def path_for(self, archive: str) -> Path:
+        return self.root / f"{archive}.zip"
+
+    def open_writer(self, archive: str) -> ArchiveWriter:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return ArchiveWriter(self.path_for(archive))
+
+    def read_record(self, archive: str, damage_id: str) -> Optional[dict]:
+        """读取归档记录，不存在时返回 None"""
+        data = self._read(archive, f"records/{damage_id}.json")
+        return json.loads(data) if data is not None else None
+
+    def read_image(self, archive: str, damage_id: str) -> Optional[bytes]:
+        """读取归档图片，不存在时返回 None"""
+        return self._read(archive, f"images/{damage_id}.jpg")
+
+    def size_of(self, archive: str) -> int:
+        path = self.path_for(archive)
+        return path.stat().st_size if path.exists() else 0
+
+    def _read(self, archive: str, name: str) -> Optional[bytes]:
+        path = self.path_for(archive)
+        if not path.exists():
+            return None
+        with zipfile.ZipFile(path) as archive_file:
+            try:
+                return archive_file.read(name)
+            except KeyError:
+                return None
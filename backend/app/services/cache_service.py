@@ -0,0 +1,124 @@
+import copy
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    识别结果缓存
+
+    两级结构：进程内 LRU（容量 + TTL 淘汰）+ 可选的 PostgreSQL 持久层。
+    缓存键由图片内容哈希、模型名称和提示词版本共同决定，
+    模型或提示词变更后旧结果自动失效。
+    """
+
+    def __init__(
+        self,
+        storage=None,
+        max_size: int = None,
+        ttl: int = None,
+        persistent: bool = None
+    ):
+        self.storage = storage
+        self.max_size = max_size if max_size is not None else settings.RESULT_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.RESULT_CACHE_TTL
+        self.persistent = (
+            persistent if persistent is not None else settings.RESULT_CACHE_PERSISTENT
+        )
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+        # 命中统计
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        image_bytes: bytes,
+        model: str,
+        prompt_version: str,
+        image_hash: str = None
+    ) -> str:
+        """生成缓存键，已知图片 sha256 时可直接传入避免重复计算"""
+        image_hash = image_hash or hashlib.sha256(image_bytes).hexdigest()
+        return f"{model}:{prompt_version}:{image_hash}"
+
+    async def get(self, key: str) -> Optional[dict]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            识别结果字典，未命中返回 None
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(value)
+            del self._entries[key]
+
+        if self.persistent and self.storage is not None:
+            try:
+                value = await self.storage.get_cached_result(key, self.ttl)
+            except Exception as e:
+                logger.warning(f"读取持久化缓存失败: {str(e)}")
+                value = None
+            if value is not None:
+                self._put(key, value)
+                self.persistent_hits += 1
+                return copy.deepcopy(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict):
+        """写入缓存"""
+        self._put(key, copy.deepcopy(value))
+
+        if self.persistent and self.storage is not None:
+            try:
+                await self.storage.save_cached_result(key, value)
+            except Exception as e:
+                logger.warning(f"写入持久化缓存失败: {str(e)}")
+
+    def _put(self, key: str, value: dict):
+        """写入内存层并按容量淘汰"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空内存层"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        hits = self.memory_hits + self.persistent_hits
+        total = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "persistent": self.persistent,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,89 @@
+import logging
+
+from app.core import metrics
+from app.services.cache_service import ResultCache
+from app.services.dedup_service import NearDuplicateIndex
+from app.services.detection_service import DetectionService
+from app.services.job_queue import JobQueue
+from app.services.retention_service import RetentionService
+from app.services.scheduler import InferenceScheduler
+from app.services.stats_service import StatsService
+from app.services.storage_service import StorageService
+from app.services.write_behind import WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    应用级服务容器
+
+    每个进程只创建一份存储、检测等服务 (一个数据库连接池、一个向量库客户端)，
+    在 lifespan 中启动和关闭，并通过 FastAPI 依赖注入给各路由。
+    """
+
+    def __init__(self):
+        self.storage = StorageService()
+        self.detection = DetectionService(cache=ResultCache(storage=self.storage))
+        self.stats = StatsService(self.storage)
+        self.scheduler = InferenceScheduler()
+        self.dedup = NearDuplicateIndex(self.storage)
+        self.writer = WriteBehindWriter(self.storage, dedup=self.dedup)
+        self.job_queue = JobQueue(self.storage, self.detection, self.writer)
+        self.retention = RetentionService(self.storage)
+
+    async def start(self):
+        """建立连接、初始化表结构并预热"""
+        await self.storage.start()
+        try:
+            await self.dedup.load()
+        except Exception as e:
+            logger.warning(f"加载近似重复索引失败: {str(e)}")
+        await self.writer.start()
+        await self.job_queue.start()
+        await self.retention.start()
+        metrics.registry.add_collector(self.collect_metrics)
+
+    async def stop(self):
+        """按依赖逆序关闭"""
+        metrics.registry.remove_collector(self.collect_metrics)
+        await self.retention.stop()
+        await self.job_queue.stop()
+        await self.writer.stop()
+        await self.storage.close()
+
+    def collect_metrics(self):
+        """抓取 /metrics 时读取各组件的当前统计"""
+        pool = self.storage.db_pool
+        if pool is not None:
+            size, idle, max_size = pool.get_size(), pool.get_idle_size(), pool.get_max_size()
+            metrics.DB_POOL_SIZE.set(size)
+            metrics.DB_POOL_IDLE.set(idle)
+            metrics.DB_POOL_MAX.set(max_size)
+            metrics.DB_POOL_UTILIZATION.set(
+                round((size - idle) / max_size, 4) if max_size else 0.0
+            )
+
+        caches = {
+            "result": self.detection.cache.stats(),
+            "similar": self.storage.similar_cache.stats(),
+            "dedup": self.dedup.stats()
+        }
+        for name, stats in caches.items():
+            metrics.CACHE_HITS.set(stats["hits"], name)
+            metrics.CACHE_MISSES.set(stats["misses"], name)
+            metrics.CACHE_HIT_RATE.set(stats["hit_rate"], name)
+
+        for endpoint in self.detection.llm.status():
+            url = endpoint["base_url"]
+            metrics.INFERENCE_IN_FLIGHT.set(endpoint["in_flight"], url)
+            metrics.INFERENCE_BREAKER_OPEN.set(int(endpoint["state"] != "closed"), url)
+            metrics.INFERENCE_FAILURES.set(endpoint["failures"], url)
+
+        writer = self.writer.stats()
+        metrics.WRITE_PENDING.set(writer["pending"])
+        metrics.WRITE_DEAD_LETTERED.set(writer["dead_lettered"])
+
+        triage = self.detection.triage.stats()
+        metrics.TRIAGE_EVALUATED.set(triage["evaluated"])
+        metrics.TRIAGE_SKIPPED.set(triage["skipped"])
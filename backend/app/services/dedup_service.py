@@ -0,0 +1,312 @@
+import asyncio
+import io
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+
+def dhash(image: Image.Image) -> int:
+    """差值哈希：9x8 灰度图相邻像素比较"""
+    pixels = np.asarray(image.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return _bits_to_int(bits)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT_32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """感知哈希：32x32 灰度图做 DCT，取低频 8x8 与中位数比较"""
+    pixels = np.asarray(image.resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (DCT_32 @ pixels @ DCT_32.T)[:8, :8]
+    median = np.median(low.flatten()[1:])
+    return _bits_to_int((low > median).flatten())
+
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed(value: int) -> int:
+    """64 位无符号哈希转为 BIGINT 可存储的有符号数"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+@dataclass
+class HashEntry:
+    """一次识别对应的图片哈希"""
+    damage_id: str
+    hash: int
+    created: float  # time.time()
+    result: asyncio.Future = field(repr=False)
+    discarded: bool = False
+
+
+class BKTree:
+    """
+    BK 树 (汉明距离)
+
+    查询距离阈值内的所有哈希只需访问少量节点。不支持删除，
+    过期或作废的条目由调用方过滤并定期重建。
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, entry: HashEntry):
+        self.size += 1
+        if self.root is None:
+            self.root = (entry, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(entry.hash, node[0].hash)
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (entry, {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[tuple]:
+        """返回 [(距离, 条目)]"""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            entry, children = stack.pop()
+            distance = hamming(value, entry.hash)
+            if distance <= max_distance:
+                results.append((distance, entry))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+
+class NearDuplicateIndex:
+    """
+    近似重复帧索引
+
+    行车记录仪连续帧几乎相同，内容哈希缓存无法命中。这里对每张图片计算
+    感知哈希，在最近 DEDUP_WINDOW 秒内的识别中查找汉明距离不超过
+    DEDUP_MAX_DISTANCE 的记录，命中则复用其结果、不再推理也不新建记录。
+    正在识别中的相似帧会等待同一个结果；只有已写入数据库的记录才会被复用，
+    返回的ID总能用于相似查询与反馈。
+
+    哈希随识别记录写入 damages.phash 列，启动时加载时间窗口内的记录重建索引。
+    """
+
+    def __init__(self, storage_service):
+        self.storage = storage_service
+        self.enabled = settings.DEDUP_ENABLED
+        self.hash_function = HASH_FUNCTIONS[settings.DEDUP_HASH.lower()]
+        self.max_distance = settings.DEDUP_MAX_DISTANCE
+        self.window = settings.DEDUP_WINDOW
+        self.max_entries = settings.DEDUP_MAX_ENTRIES
+        # 等待识别中的相似帧的最长时间
+        self.wait_timeout = settings.OLLAMA_TIMEOUT
+
+        self._tree = BKTree()
+        self._entries: Dict[str, HashEntry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self):
+        """从数据库加载时间窗口内的哈希 (启动时调用)"""
+        if not self.enabled:
+            return
+        since = datetime.now() - timedelta(seconds=self.window)
+        pool = await self.storage.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, phash, ai_result, created_at
+                FROM damages
+                WHERE phash IS NOT NULL AND status = 'completed' AND created_at >= $1
+                ORDER BY created_at DESC
+                LIMIT $2
+            """, since, self.max_entries)
+
+        loop = asyncio.get_running_loop()
+        for r in reversed(rows):
+            future = loop.create_future()
+            future.set_result(json.loads(r["ai_result"]) if r["ai_result"] else {})
+            self._add(HashEntry(
+                damage_id=r["id"],
+                hash=to_unsigned(r["phash"]),
+                created=r["created_at"].timestamp(),
+                result=future
+            ))
+        logger.info(f"近似重复索引已加载 {len(rows)} 条")
+
+    async def fingerprint(self, image_bytes: bytes) -> Optional[int]:
+        """在线程中计算感知哈希，图片无法解码时返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            return await asyncio.to_thread(self._fingerprint_sync, image_bytes)
+        except Exception as e:
+            logger.warning(f"计算感知哈希失败: {str(e)}")
+            return None
+
+    def _fingerprint_sync(self, image_bytes: bytes) -> int:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("L", (128, 128))
+            return self.hash_function(img.convert("L"))
+
+    def acquire(self, value: Optional[int], damage_id: str) -> Optional[HashEntry]:
+        """
+        查找近似重复的识别
+
+        Returns:
+            命中的条目 (结果可能仍在识别中)；未命中时为 damage_id 登记
+            一个识别中的条目并返回 None；记录入库后须 resolve (由后写队列调用)，
+            识别失败或未入库时须 discard
+        """
+        if value is None:
+            return None
+
+        now = time.time()
+        matches = [
+            (distance, entry)
+            for distance, entry in self._tree.search(value, self.max_distance)
+            if not entry.discarded and now - entry.created <= self.window
+        ]
+        if matches:
+            self.hits += 1
+            return min(matches, key=lambda m: (m[0], -m[1].created))[1]
+
+        self.misses += 1
+        self._register(value, damage_id, now)
+        return None
+
+    async def claim(self, value: Optional[int], damage_id: str) -> Optional[HashEntry]:
+        """
+        查找已完成的近似重复识别
+
+        命中识别中的条目时等待其结果，原识别失败则继续查找，
+        直到没有匹配时为 damage_id 登记新条目。等待超过 wait_timeout
+        (原请求卡住或被取消而未 resolve / discard) 时不再等待，
+        同样登记新条目由调用方自行识别。
+
+        Returns:
+            命中的条目 (result 已完成)，未命中或等待超时时返回 None
+        """
+        while True:
+            entry = self.acquire(value, damage_id)
+            if entry is None:
+                return None
+            try:
+                result = await self.wait(entry)
+            except asyncio.TimeoutError:
+                logger.warning(f"等待近似重复识别 {entry.damage_id} 超时，重新识别")
+                self.hits -= 1
+                self.misses += 1
+                self._register(value, damage_id, time.time())
+                return None
+            if result is not None:
+                return entry
+
+    async def wait(self, entry: HashEntry) -> Optional[dict]:
+        """
+        等待命中条目的识别结果，原识别失败时返回 None
+
+        Raises:
+            asyncio.TimeoutError: 超过 wait_timeout 仍未完成
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry.result), self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            return None
+
+    def resolve(self, damage_id: str, ai_result: dict):
+        """记录已入库，之后的重复帧可复用其ID与结果"""
+        entry = self._entries.get(damage_id)
+        if entry is not None and not entry.result.done():
+            entry.result.set_result(ai_result)
+
+    def discard(self, damage_id: str):
+        """识别失败，作废条目并唤醒等待者"""
+        entry = self._entries.pop(damage_id, None)
+        if entry is None:
+            return
+        entry.discarded = True
+        if not entry.result.done():
+            entry.result.set_exception(RuntimeError("识别失败"))
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            entry.result.exception()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_distance": self.max_distance,
+            "window": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def _register(self, value: int, damage_id: str, now: float):
+        """为 damage_id 登记识别中的条目"""
+        self._add(HashEntry(
+            damage_id=damage_id,
+            hash=value,
+            created=now,
+            result=asyncio.get_running_loop().create_future()
+        ))
+
+    def _add(self, entry: HashEntry):
+        self._entries[entry.damage_id] = entry
+        self._tree.add(entry)
+        # 树中积累过多过期/作废条目时重建
+        if self._tree.size > max(2 * len(self._entries), 1024) \
+                or len(self._entries) > self.max_entries:
+            self._rebuild()
+
+    def _rebuild(self):
+        cutoff = time.time() - self.window
+        live = sorted(
+            (e for e in self._entries.values() if not e.discarded and e.created >= cutoff),
+            key=lambda e: e.created
+        )[-self.max_entries:]
+        self._entries = {e.damage_id: e for e in live}
+        self._tree = BKTree()
+        for entry in live:
+            self._tree.add(entry)
@@ -1,7 +1,20 @@
 import base64
-import json
-from langchain_ollama import ChatOllama
+import hashlib
+import logging
+from langchain_core.messages import HumanMessage
 from app.core.config import settings
+from app.core.metrics import stage
+from app.services.ollama_client import OllamaClientPool, InferenceError
+from app.services.result_parser import (
+    DamageStreamParser, ResultParseError, parse_detection_result
+)
+from app.services.cache_service import ResultCache
+from app.services.image_service import ImagePreprocessor
+from app.services.scheduler import InferenceScheduler
+from app.services.tiling import ImageTiler, TilePlan, merge_tile_results, parse_tile_result
+from app.services.triage import TriageService
+
+logger = logging.getLogger(__name__)
 
 
 ROAD_DAMAGE_PROMPT = """你是专业的道路养护专家。分析图片中的路面病害，返回JSON格式：
@@ -29,52 +42,93 @@ ROAD_DAMAGE_PROMPT = """你是专业的道路养护专家。分析图片中的
 
 只返回JSON，不要其他文字。"""
 
+# 分块识别时追加的说明，要求给出病害在分块中的位置以便合并重叠区
+TILE_PROMPT = ROAD_DAMAGE_PROMPT + """
+
+这张图片是一张大图中的分块。每个病害额外返回 "bbox": [x0, y0, x1, y1]，
+表示病害在本图中的位置 (0~1 的相对坐标，左上角为原点)。"""
+
+# 提示词版本，用于区分缓存结果
+PROMPT_VERSION = hashlib.sha256(ROAD_DAMAGE_PROMPT.encode()).hexdigest()[:12]
+
+TILE_PROMPT_VERSION = hashlib.sha256(TILE_PROMPT.encode()).hexdigest()[:12]
+
 
 class DetectionService:
-    def __init__(self):
-        self.llm = ChatOllama(
-            model=settings.OLLAMA_MODEL,
-            base_url=settings.OLLAMA_BASE_URL,
-            temperature=0.1
-        )
+    def __init__(
+        self,
+        cache: ResultCache = None,
+        preprocessor: ImagePreprocessor = None,
+        tiler: ImageTiler = None,
+        triage: TriageService = None
+    ):
+        self.llm = OllamaClientPool()
+        self.cache = cache if cache is not None else ResultCache()
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.tiler = tiler or ImageTiler()
+        self.triage = triage or TriageService()
+        # 所有分块识别共享的并发上限，单张大图不会占满推理节点
+        self.tile_scheduler = InferenceScheduler(settings.TILE_CONCURRENCY)
     
-    async def detect(self, image_bytes: bytes) -> dict:
+    async def detect(self, image_bytes: bytes, image_hash: str = None) -> dict:
         """
         使用 AI 模型检测道路病害
         
+        长边超过 TILE_TRIGGER_EDGE 的图片分块识别后合并结果；
+        其余图片先经预筛，判为无病害的直接返回，不调用模型。
+        
         Args:
             image_bytes: 图片字节数据
+            image_hash: 图片 sha256 (可选，接收上传时已计算)
             
         Returns:
             识别结果字典
         """
+        tiled = await self.tiler.needs_tiling(image_bytes)
+        prompt_version = (
+            f"{TILE_PROMPT_VERSION}:{self.tiler.signature}" if tiled else PROMPT_VERSION
+        )
+        
+        # 命中缓存则跳过模型调用
+        cache_key = ResultCache.make_key(
+            image_bytes, settings.OLLAMA_MODEL, prompt_version, image_hash
+        )
+        with stage("cache_lookup"):
+            cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        if tiled:
+            with stage("tile_split"):
+                plan = await self.tiler.split(image_bytes)
+            ai_result = await self._detect_tiled(plan)
+            # 部分分块失败的结果不缓存
+            if not ai_result.get("partial"):
+                await self.cache.set(cache_key, ai_result)
+            return ai_result
+        
+        with stage("triage"):
+            triage = await self.triage.evaluate(image_bytes)
+        if triage is not None and triage.skip:
+            return self.triage.clean_result(triage)
+        
         try:
-            # 转换为 base64
-            img_b64 = base64.b64encode(image_bytes).decode()
-            
             # 调用 AI 模型
-            result = await self.llm.ainvoke([
-                {"type": "text", "text": ROAD_DAMAGE_PROMPT},
-                {
-                    "type": "image_url",
-                    "image_url": f"data:image/jpeg;base64,{img_b64}"
-                }
-            ])
+            messages = await self._build_messages(image_bytes)
+            with stage("inference"):
+                result = await self.llm.ainvoke(messages)
             
-            # 解析结果
-            content = result.content.strip()
-            
-            # 清理可能的 markdown 标记
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            
-            ai_result = json.loads(content.strip())
+            # 解析结果 (容忍说明文字、代码块标记和常见格式错误)
+            with stage("parse"):
+                ai_result = parse_detection_result(result.content)
+            self.triage.audit(triage, ai_result)
             
+            # 截断的输出不缓存，下次重新识别
+            if not ai_result.get("truncated"):
+                await self.cache.set(cache_key, ai_result)
             return ai_result
             
-        except json.JSONDecodeError as e:
+        except ResultParseError as e:
             # 如果 JSON 解析失败，返回错误结构
             return {
                 "damages": [],
@@ -82,5 +136,137 @@ class DetectionService:
                 "summary": f"识别失败: {str(e)}",
                 "error": str(e)
             }
+        except InferenceError:
+            raise
+        except Exception as e:
+            raise InferenceError(f"检测失败: {str(e)}") from e
+    
+    async def detect_stream(self, image_bytes: bytes, image_hash: str = None):
+        """
+        流式检测道路病害
+        
+        Args:
+            image_bytes: 图片字节数据
+            image_hash: 图片 sha256 (可选)
+            
+        Yields:
+            (事件, 数据)：("token", 文本片段)、("damage", 单条病害)、
+            ("result", 识别结果字典)，result 总是最后一个
+        """
+        # 分块识别没有逐 token 输出，完成后一次推送
+        if await self.tiler.needs_tiling(image_bytes):
+            ai_result = await self.detect(image_bytes, image_hash)
+            for damage in ai_result.get("damages", []):
+                yield "damage", damage
+            yield "result", ai_result
+            return
+        
+        cache_key = ResultCache.make_key(
+            image_bytes, settings.OLLAMA_MODEL, PROMPT_VERSION, image_hash
+        )
+        with stage("cache_lookup"):
+            cached = await self.cache.get(cache_key)
+        if cached is not None:
+            for damage in cached.get("damages", []):
+                yield "damage", damage
+            yield "result", cached
+            return
+        
+        with stage("triage"):
+            triage = await self.triage.evaluate(image_bytes)
+        if triage is not None and triage.skip:
+            yield "result", self.triage.clean_result(triage)
+            return
+        
+        parser = DamageStreamParser()
+        try:
+            messages = await self._build_messages(image_bytes)
+            # 流式推理的耗时包含向客户端推送的时间
+            with stage("inference"):
+                async for chunk in self.llm.astream(messages):
+                    yield "token", chunk
+                    for damage in parser.feed(chunk):
+                        yield "damage", damage
+        except InferenceError:
+            raise
         except Exception as e:
-            raise Exception(f"检测失败: {str(e)}")
+            raise InferenceError(f"检测失败: {str(e)}") from e
+        
+        try:
+            with stage("parse"):
+                ai_result = parser.result()
+        except ResultParseError as e:
+            yield "result", {
+                "damages": [],
+                "riskLevel": "未知",
+                "summary": f"识别失败: {str(e)}",
+                "error": str(e)
+            }
+            return
+        
+        self.triage.audit(triage, ai_result)
+        if not ai_result.get("truncated"):
+            await self.cache.set(cache_key, ai_result)
+        yield "result", ai_result
+    
+    async def _detect_tiled(self, plan: TilePlan) -> dict:
+        """
+        并发识别各分块并合并结果
+        
+        Raises:
+            InferenceError: 所有待识别分块均失败
+        """
+        async def detect_tile(tile):
+            try:
+                messages = await self._build_messages(tile.image_bytes, TILE_PROMPT)
+                with stage("inference"):
+                    result = await self.llm.ainvoke(messages)
+            except InferenceError:
+                raise
+            except Exception as e:
+                raise InferenceError(f"检测失败: {str(e)}") from e
+            with stage("parse"):
+                return parse_tile_result(result.content, tile)
+        
+        found, risk_levels = [], []
+        failed = 0
+        last_error = None
+        async for tile, result, error in self.tile_scheduler.map_unordered(
+            detect_tile, plan.tiles
+        ):
+            if error is not None:
+                failed += 1
+                last_error = error
+                logger.warning(f"分块 {tile.label} 识别失败: {str(error)}")
+                continue
+            damages, risk_level = result
+            found.extend(damages)
+            risk_levels.append(risk_level)
+        
+        if plan.tiles and failed == len(plan.tiles):
+            if isinstance(last_error, InferenceError):
+                raise last_error
+            raise InferenceError(f"所有分块识别失败: {str(last_error)}")
+        return merge_tile_results(plan, found, risk_levels, failed)
+    
+    async def _build_messages(
+        self,
+        image_bytes: bytes,
+        prompt: str = ROAD_DAMAGE_PROMPT
+    ) -> list:
+        """预处理图片并组装模型输入"""
+        # 缩放、校正方向并重新编码，减小请求体
+        with stage("preprocess"):
+            prepared = await self.preprocessor.process(image_bytes)
+        
+        # 转换为 base64
+        img_b64 = base64.b64encode(prepared.image_bytes).decode()
+        
+        # 文本与图片作为同一条用户消息的多段内容
+        return [HumanMessage(content=[
+            {"type": "text", "text": prompt},
+            {
+                "type": "image_url",
+                "image_url": f"data:image/jpeg;base64,{img_b64}"
+            }
+        ])]
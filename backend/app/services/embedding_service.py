@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# CLIP 图像归一化参数
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+
+class OnnxImageEncoder:
+    """
+    ONNX 图像编码器
+
+    加载 CLIP 视觉塔等导出的 ONNX 模型，在 CPU 上推理，
+    输入 NCHW float32，输出 L2 归一化后的图像向量。
+    """
+
+    def __init__(self, model_path: str, input_size: int = None, threads: int = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or settings.EMBEDDING_THREADS
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_size = input_size or settings.EMBEDDING_INPUT_SIZE
+
+    def preprocess(self, image_bytes: bytes) -> np.ndarray:
+        """缩放短边、中心裁剪并归一化，返回 CHW 数组"""
+        size = self.input_size
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img = img.convert("RGB")
+            scale = size / min(img.size)
+            img = img.resize(
+                (max(size, round(img.width * scale)), max(size, round(img.height * scale))),
+                Image.BICUBIC
+            )
+            left = (img.width - size) // 2
+            top = (img.height - size) // 2
+            img = img.crop((left, top, left + size, top + size))
+            array = np.asarray(img, dtype=np.float32) / 255.0
+
+        array = (array - CLIP_MEAN) / CLIP_STD
+        return array.transpose(2, 0, 1)
+
+    def encode(self, images: List[bytes]) -> np.ndarray:
+        """批量编码，返回 (N, D) 数组"""
+        batch = np.stack([self.preprocess(image) for image in images])
+        output = self.session.run(None, {self.input_name: batch})[0]
+        output = output.reshape(len(images), -1).astype(np.float32)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return output / np.maximum(norms, 1e-12)
+
+
+class EmbeddingService:
+    """
+    图像向量服务
+
+    并发上传的编码请求在短时间窗口内合并为一个批次送入编码器，
+    结果按图片内容哈希缓存。EMBEDDING_BACKEND=onnx 时启动阶段必须能加载编码器
+    (未安装 onnxruntime 或缺少模型文件时启动失败)；单张图片编码失败时 embed
+    返回 None，由向量库以同维度的文本哈希向量补位。
+    """
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder
+        self.enabled = settings.EMBEDDING_BACKEND.lower() == "onnx"
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.batch_wait = settings.EMBEDDING_BATCH_WAIT_MS / 1000
+        self.cache_size = settings.EMBEDDING_CACHE_SIZE
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._load_failed = False
+        self._load_error = None
+
+    def _load_encoder(self):
+        """按需加载编码器，失败后不再重试"""
+        if self.encoder is not None or self._load_failed:
+            return self.encoder
+
+        model_path = settings.EMBEDDING_MODEL_PATH
+        try:
+            if not Path(model_path).exists():
+                raise FileNotFoundError(f"模型文件不存在: {model_path}")
+            encoder = OnnxImageEncoder(model_path)
+            output_dim = encoder.session.get_outputs()[0].shape[-1]
+            if isinstance(output_dim, int) and output_dim != settings.EMBEDDING_DIM:
+                raise ValueError(
+                    f"模型输出维度 {output_dim} 与 EMBEDDING_DIM={settings.EMBEDDING_DIM} 不一致"
+                )
+            self.encoder = encoder
+            logger.info(f"图像编码器已加载: {model_path}")
+        except Exception as e:
+            self._load_failed = True
+            self._load_error = e
+            logger.error(f"图像编码器加载失败: {str(e)}")
+        return self.encoder
+
+    async def load(self):
+        """
+        在线程中预加载编码器 (启动时调用)
+
+        Raises:
+            RuntimeError: EMBEDDING_BACKEND=onnx 但编码器无法加载
+        """
+        if self.enabled and await asyncio.to_thread(self._load_encoder) is None:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND=onnx 但图像编码器无法加载 ({self._load_error})，"
+                f"请放置 ONNX 模型文件或设置 EMBEDDING_BACKEND=text"
+            )
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self._load_encoder() is not None
+
+    async def embed(self, image_bytes: bytes) -> Optional[List[float]]:
+        """
+        生成单张图片向量
+
+        Args:
+            image_bytes: 图片字节数据
+
+        Returns:
+            向量，编码器不可用或编码失败时返回 None
+        """
+        if not self.available:
+            return None
+
+        key = hashlib.sha256(image_bytes).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        if self._batch_task is None or self._batch_task.done():
+            self._queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._batch_loop())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_bytes, future))
+        try:
+            vector = await future
+        except Exception as e:
+            logger.warning(f"图像编码失败: {str(e)}")
+            return None
+
+        self._cache[key] = vector
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    async def embed_many(self, images: List[bytes]) -> List[Optional[List[float]]]:
+        """批量生成图片向量"""
+        return await asyncio.gather(*(self.embed(image) for image in images))
+
+    async def _batch_loop(self):
+        """收集请求并按批编码"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            images = [image for image, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor, self.encoder.encode, images
+                )
+                for (_, future), vector in zip(batch, vectors):
+                    if not future.done():
+                        future.set_result(vector.tolist())
+            except Exception:
+                # 批次失败时逐张重试，避免一张坏图拖累整批
+                for image, future in batch:
+                    try:
+                        vector = (await loop.run_in_executor(
+                            self._executor, self.encoder.encode, [image]
+                        ))[0]
+                        if not future.done():
+                            future.set_result(vector.tolist())
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+
+    async def close(self):
+        """停止批处理任务并关闭线程池"""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            await asyncio.gather(self._batch_task, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
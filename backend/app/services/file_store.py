@@ -0,0 +1,141 @@
+import asyncio
+import errno
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.core.config import settings
+
+
+class SpoolFile:
+    """
+    写入中的临时文件
+
+    上传内容分块追加到临时目录 (不对外提供) 下的文件，完成后原子移入上传目录，
+    失败时丢弃。
+    """
+
+    def __init__(self, store: "FileStore", path: Path, handle):
+        self.store = store
+        self.path = path
+        self._handle = handle
+        self._target = None  # 提交后的正式文件路径
+
+    async def write(self, data: bytes):
+        await self.store._run(self._handle.write, data)
+
+    async def read(self) -> bytes:
+        """读回已写入的内容 (提交前后均可)"""
+        return await self.store._run(self._read)
+
+    async def commit(self, name: str) -> str:
+        """关闭并重命名为正式文件，返回文件路径"""
+        target = self.store.path_for(name)
+        await self.store._run(self._commit, target)
+        return str(target)
+
+    async def discard(self):
+        """关闭并删除临时文件"""
+        await self.store._run(self._discard)
+
+    def _read(self) -> bytes:
+        if not self._handle.closed:
+            self._handle.flush()
+        return (self._target or self.path).read_bytes()
+
+    def _commit(self, target: Path):
+        self._handle.close()
+        try:
+            os.replace(self.path, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # 临时目录与上传目录不在同一文件系统，复制后原子替换
+            self.store._copy_atomic(self.path, target)
+            self.path.unlink()
+        self._target = target
+
+    def _discard(self):
+        if self._target is not None:
+            return
+        if not self._handle.closed:
+            self._handle.close()
+        self.path.unlink(missing_ok=True)
+
+
+class FileStore:
+    """
+    图片文件存储
+
+    所有文件读写在独立线程池中执行，上传目录位于网络存储时也不会阻塞事件循环。
+    写入先落到同目录临时文件再原子重命名，读取方不会看到写了一半的文件。
+    """
+
+    def __init__(self, root: str = None, workers: int = None, spool_dir: str = None):
+        self.root = Path(root or settings.UPLOAD_DIR)
+        self.spool_dir = Path(spool_dir or settings.UPLOAD_SPOOL_DIR or tempfile.gettempdir())
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or settings.FILE_IO_WORKERS,
+            thread_name_prefix="file-io"
+        )
+
+    def ensure_dir(self):
+        """创建上传目录与临时目录 (启动时调用一次)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, name: str) -> Path:
+        """文件名对应的完整路径"""
+        return self.root / name
+
+    async def write(self, name: str, data: bytes) -> str:
+        """原子写入文件，返回文件路径"""
+        path = self.path_for(name)
+        await self._run(self._write_atomic, path, data)
+        return str(path)
+
+    async def spool(self) -> SpoolFile:
+        """创建临时文件用于边接收边写入"""
+        path = self.spool_dir / f"upload.{uuid.uuid4().hex}.tmp"
+        handle = await self._run(open, path, "wb")
+        return SpoolFile(self, path, handle)
+
+    async def read(self, path: str) -> bytes:
+        """读取文件"""
+        return await self._run(Path(path).read_bytes)
+
+    async def delete(self, path: str):
+        """删除文件，不存在时忽略"""
+        await self._run(Path(path).unlink, True)
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _copy_atomic(source: Path, path: Path):
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
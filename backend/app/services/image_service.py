@@ -0,0 +1,160 @@
+import asyncio
+import io
+import logging
+import time
+from dataclasses import dataclass, asdict
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PreprocessResult:
+    """预处理结果"""
+    image_bytes: bytes
+    original_bytes: int
+    processed_bytes: int
+    original_size: tuple
+    processed_size: tuple
+    elapsed_ms: float
+    changed: bool
+
+    def summary(self) -> dict:
+        data = asdict(self)
+        data.pop("image_bytes")
+        return data
+
+
+class ImagePreprocessor:
+    """
+    推理前图片预处理
+
+    解码、按 EXIF 校正方向、将长边缩放到上限并重新编码为 JPEG，
+    以减小发送给 Ollama 的请求体以及视觉模型需要处理的像素量。
+    处理在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, max_edge: int = None, quality: int = None, enabled: bool = None):
+        self.max_edge = max_edge or settings.IMAGE_MAX_EDGE
+        self.quality = quality or settings.IMAGE_JPEG_QUALITY
+        self.enabled = enabled if enabled is not None else settings.IMAGE_PREPROCESS_ENABLED
+
+        # 累计统计
+        self.processed = 0
+        self.total_original_bytes = 0
+        self.total_processed_bytes = 0
+        self.total_original_pixels = 0
+        self.total_processed_pixels = 0
+        self.total_elapsed_ms = 0.0
+
+    async def process(self, image_bytes: bytes) -> PreprocessResult:
+        """异步预处理图片"""
+        if not self.enabled:
+            return PreprocessResult(
+                image_bytes=image_bytes,
+                original_bytes=len(image_bytes),
+                processed_bytes=len(image_bytes),
+                original_size=(0, 0),
+                processed_size=(0, 0),
+                elapsed_ms=0.0,
+                changed=False
+            )
+
+        result = await asyncio.to_thread(self.process_sync, image_bytes)
+        self._record(result)
+        logger.info(
+            f"图片预处理: {result.original_bytes} → {result.processed_bytes} 字节, "
+            f"{result.original_size} → {result.processed_size}, "
+            f"耗时 {result.elapsed_ms:.1f}ms"
+        )
+        return result
+
+    def process_sync(self, image_bytes: bytes) -> PreprocessResult:
+        """同步预处理，解码失败时原样返回"""
+        start = time.perf_counter()
+
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as img:
+                original_size = img.size
+                original_format = img.format
+
+                # EXIF 方向标记 (0x0112)，1 表示无需旋转
+                rotated = img.getexif().get(0x0112, 1) != 1
+                oriented = ImageOps.exif_transpose(img)
+
+                needs_resize = max(oriented.size) > self.max_edge
+                if not needs_resize and not rotated and original_format == "JPEG":
+                    return PreprocessResult(
+                        image_bytes=image_bytes,
+                        original_bytes=len(image_bytes),
+                        processed_bytes=len(image_bytes),
+                        original_size=original_size,
+                        processed_size=original_size,
+                        elapsed_ms=(time.perf_counter() - start) * 1000,
+                        changed=False
+                    )
+
+                if needs_resize:
+                    oriented.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+                if oriented.mode != "RGB":
+                    oriented = oriented.convert("RGB")
+
+                buffer = io.BytesIO()
+                oriented.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+                processed = buffer.getvalue()
+                processed_size = oriented.size
+        except Exception as e:
+            logger.warning(f"图片预处理失败，使用原图: {str(e)}")
+            return PreprocessResult(
+                image_bytes=image_bytes,
+                original_bytes=len(image_bytes),
+                processed_bytes=len(image_bytes),
+                original_size=(0, 0),
+                processed_size=(0, 0),
+                elapsed_ms=(time.perf_counter() - start) * 1000,
+                changed=False
+            )
+
+        # 重新编码反而更大且无需校正时保留原图
+        if len(processed) >= len(image_bytes) and not needs_resize and not rotated:
+            processed = image_bytes
+            processed_size = original_size
+
+        return PreprocessResult(
+            image_bytes=processed,
+            original_bytes=len(image_bytes),
+            processed_bytes=len(processed),
+            original_size=original_size,
+            processed_size=processed_size,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            changed=processed is not image_bytes
+        )
+
+    def _record(self, result: PreprocessResult):
+        self.processed += 1
+        self.total_original_bytes += result.original_bytes
+        self.total_processed_bytes += result.processed_bytes
+        self.total_original_pixels += result.original_size[0] * result.original_size[1]
+        self.total_processed_pixels += result.processed_size[0] * result.processed_size[1]
+        self.total_elapsed_ms += result.elapsed_ms
+
+    def stats(self) -> dict:
+        """预处理累计统计"""
+        return {
+            "enabled": self.enabled,
+            "max_edge": self.max_edge,
+            "quality": self.quality,
+            "processed": self.processed,
+            "original_bytes": self.total_original_bytes,
+            "processed_bytes": self.total_processed_bytes,
+            "saved_bytes": self.total_original_bytes - self.total_processed_bytes,
+            "pixel_ratio": round(
+                self.total_processed_pixels / self.total_original_pixels, 4
+            ) if self.total_original_pixels else 1.0,
+            "avg_elapsed_ms": round(
+                self.total_elapsed_ms / self.processed, 2
+            ) if self.processed else 0.0
+        }
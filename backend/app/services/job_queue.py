@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+from app.schemas.damage import DamageCreate
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class JobQueue:
+    """
+    异步检测任务队列
+
+    任务持久化在 damages 表的 status 列中 (pending → processing → completed/failed)，
+    由进程内的 worker 池通过 FOR UPDATE SKIP LOCKED 领取，多进程部署时不会重复处理。
+    处理中超时的任务 (如进程重启遗留) 会被重新放回队列。
+    任务完成后的图像向量交给后写队列写入，向量库故障不影响任务状态。
+    """
+
+    def __init__(self, storage_service, detection_service, writer, workers: int = None):
+        self.storage = storage_service
+        self.detection = detection_service
+        self.writer = writer
+        self.workers = workers or settings.JOB_WORKERS
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._last_recovery = 0.0
+
+    async def start(self):
+        """启动 worker 池，并恢复上次未完成的任务"""
+        if self._tasks:
+            return
+        await self._recover()
+        self._tasks = [
+            asyncio.create_task(self._worker(i))
+            for i in range(self.workers)
+        ]
+        logger.info(f"任务队列已启动, worker 数: {self.workers}")
+
+    async def stop(self):
+        """停止 worker 池，处理中的任务将在下次启动时恢复"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, damage_id: str, image_path: str):
+        """
+        提交检测任务
+
+        Raises:
+            QueueFullError: 排队任务数达到上限
+        """
+        active = await self.storage.count_active_jobs()
+        if active >= settings.JOB_QUEUE_MAX_PENDING:
+            raise QueueFullError(f"任务队列已满 ({active})")
+
+        await self.storage.enqueue_job(damage_id, image_path)
+        self._wakeup.set()
+
+    async def _recover(self):
+        """重新入队超时的处理中任务"""
+        self._last_recovery = time.monotonic()
+        try:
+            recovered = await self.storage.recover_stale_jobs(
+                settings.JOB_STALE_TIMEOUT, settings.JOB_MAX_ATTEMPTS
+            )
+            if recovered:
+                logger.info(f"已恢复 {recovered} 个中断的任务 (超过重试次数的标记为失败)")
+        except Exception as e:
+            logger.error(f"恢复任务失败: {str(e)}")
+
+    async def _worker(self, index: int):
+        """worker 主循环"""
+        while True:
+            try:
+                if time.monotonic() - self._last_recovery > settings.JOB_STALE_TIMEOUT:
+                    await self._recover()
+
+                job = await self.storage.claim_job()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._wakeup.wait(), settings.JOB_POLL_INTERVAL
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"worker {index} 异常: {str(e)}")
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+
+    async def _process(self, job: dict):
+        """执行单个任务"""
+        damage_id = job["id"]
+        try:
+            image_bytes = await self.storage.load_image(job["image_path"])
+            ai_result = await self.detection.detect(image_bytes)
+            await self.storage.complete_job(damage_id, ai_result)
+        except Exception as e:
+            retry = job["attempts"] < settings.JOB_MAX_ATTEMPTS
+            logger.warning(f"任务 {damage_id} 失败 (第 {job['attempts']} 次): {str(e)}")
+            await self.storage.fail_job(damage_id, str(e), retry)
+            return
+
+        # 任务已完成，向量写入失败由后写队列重试并转入死信，不再改动任务状态
+        await self.writer.submit_vector(
+            DamageCreate(id=damage_id, image_path=job["image_path"], ai_result=ai_result),
+            image_bytes
+        )
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import random
+import time
+from typing import List
+
+import httpx
+from langchain_ollama import ChatOllama
+from ollama import ResponseError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceError(Exception):
+    """模型推理失败"""
+
+
+class InferenceUnavailableError(InferenceError):
+    """所有推理节点不可用 (熔断中)"""
+
+
+class InferenceTimeoutError(InferenceError):
+    """推理超时"""
+
+
+def is_transient(error: Exception) -> bool:
+    """可重试的临时错误：超时、连接失败、服务端 5xx"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code == 429
+    return False
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，冷却期内直接拒绝；冷却结束后放行一个探测请求 (半开)，
+    成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or settings.OLLAMA_BREAKER_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.OLLAMA_BREAKER_RESET
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否允许发起请求"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"推理节点熔断, 连续失败 {self.failures} 次")
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """探测请求未得出结果 (被取消) 时释放探测名额，下一个请求重新探测"""
+        self._probing = False
+
+
+class OllamaEndpoint:
+    """单个 Ollama 节点：长连接客户端 + 在途计数 + 熔断器"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.llm = ChatOllama(
+            model=settings.OLLAMA_MODEL,
+            base_url=base_url,
+            temperature=0.1,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE,
+            format="json" if settings.OLLAMA_JSON_FORMAT else "",
+            client_kwargs={
+                "timeout": httpx.Timeout(
+                    settings.OLLAMA_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT
+                ),
+                "limits": httpx.Limits(
+                    max_connections=settings.OLLAMA_MAX_CONCURRENCY,
+                    max_keepalive_connections=settings.OLLAMA_MAX_CONCURRENCY,
+                    keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY
+                )
+            }
+        )
+        self.breaker = CircuitBreaker()
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def status(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "state": self.breaker.state,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class OllamaClientPool:
+    """
+    Ollama 推理客户端池
+
+    - 多个节点按在途请求数最少路由
+    - 信号量限制进程内同时进行的推理数
+    - 每次调用有截止时间，临时错误带抖动退避重试 (优先换节点)
+    - 节点熔断，全部熔断时立即失败
+    """
+
+    def __init__(self, base_urls: List[str] = None):
+        urls = base_urls or settings.ollama_base_urls
+        self.endpoints = [OllamaEndpoint(url) for url in urls]
+        self.max_retries = settings.OLLAMA_MAX_RETRIES
+        self.timeout = settings.OLLAMA_TIMEOUT
+        self._semaphore = asyncio.Semaphore(settings.OLLAMA_MAX_CONCURRENCY)
+
+    def _pick(self, exclude: set) -> tuple:
+        """
+        选择在途请求最少且未熔断的节点
+
+        Returns:
+            (节点, 是否为半开状态下的探测请求)
+        """
+        candidates = sorted(
+            (e for e in self.endpoints if e.base_url not in exclude),
+            key=lambda e: e.in_flight
+        ) or sorted(self.endpoints, key=lambda e: e.in_flight)
+
+        for endpoint in candidates:
+            probe = endpoint.breaker.state != "closed"
+            if endpoint.breaker.allow():
+                return endpoint, probe
+        raise InferenceUnavailableError("推理服务不可用 (所有节点熔断中)")
+
+    async def ainvoke(self, messages):
+        """
+        调用模型
+
+        Raises:
+            InferenceUnavailableError: 所有节点熔断
+            InferenceTimeoutError: 重试后仍超时
+            InferenceError: 其他推理失败
+        """
+        async with self._semaphore:
+            tried = set()
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    # 全抖动指数退避
+                    backoff = settings.OLLAMA_RETRY_BACKOFF * (2 ** (attempt - 1))
+                    await asyncio.sleep(random.uniform(0, backoff))
+
+                endpoint, probe = self._pick(tried)
+                tried.add(endpoint.base_url)
+                endpoint.in_flight += 1
+                endpoint.requests += 1
+                try:
+                    result = await asyncio.wait_for(
+                        endpoint.llm.ainvoke(messages), timeout=self.timeout
+                    )
+                    endpoint.breaker.record_success()
+                    return result
+                except Exception as e:
+                    last_error = e
+                    if not is_transient(e):
+                        # 节点有响应，只是请求本身无效，不计入熔断
+                        endpoint.breaker.record_success()
+                        raise InferenceError(f"推理失败: {str(e)}") from e
+                    endpoint.failures += 1
+                    endpoint.breaker.record_failure()
+                    logger.warning(
+                        f"推理节点 {endpoint.base_url} 第 {attempt + 1} 次调用失败: "
+                        f"{type(e).__name__} {str(e)}"
+                    )
+                finally:
+                    endpoint.in_flight -= 1
+                    # 取消或客户端断开时没有结果，释放探测名额
+                    if probe:
+                        endpoint.breaker.release_probe()
+
+            if isinstance(last_error, (asyncio.TimeoutError, httpx.TimeoutException)):
+                raise InferenceTimeoutError(f"推理超时 ({self.timeout}s)") from last_error
+            raise InferenceError(f"推理失败: {str(last_error)}") from last_error
+
+    async def astream(self, messages):
+        """
+        流式调用模型，逐块产出文本
+
+        首个分块到达前的临时错误按 ainvoke 的策略换节点重试；
+        已开始输出后出错直接抛出 (调用方已消费部分内容，无法透明重试)。
+        整个流共享同一截止时间。
+
+        Raises:
+            同 ainvoke
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            tried = set()
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    backoff = settings.OLLAMA_RETRY_BACKOFF * (2 ** (attempt - 1))
+                    await asyncio.sleep(random.uniform(0, backoff))
+
+                endpoint, probe = self._pick(tried)
+                tried.add(endpoint.base_url)
+                endpoint.in_flight += 1
+                endpoint.requests += 1
+                deadline = loop.time() + self.timeout
+                started = False
+                stream = endpoint.llm.astream(messages)
+                try:
+                    while True:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        started = True
+                        if chunk.content:
+                            yield chunk.content
+                    endpoint.breaker.record_success()
+                    return
+                except Exception as e:
+                    last_error = e
+                    if not is_transient(e):
+                        endpoint.breaker.record_success()
+                        raise InferenceError(f"推理失败: {str(e)}") from e
+                    endpoint.failures += 1
+                    endpoint.breaker.record_failure()
+                    logger.warning(
+                        f"推理节点 {endpoint.base_url} 第 {attempt + 1} 次流式调用失败: "
+                        f"{type(e).__name__} {str(e)}"
+                    )
+                    if started:
+                        break
+                finally:
+                    endpoint.in_flight -= 1
+                    # 取消或客户端断开时没有结果，释放探测名额
+                    if probe:
+                        endpoint.breaker.release_probe()
+                    await stream.aclose()
+
+            if isinstance(last_error, (asyncio.TimeoutError, httpx.TimeoutException)):
+                raise InferenceTimeoutError(f"推理超时 ({self.timeout}s)") from last_error
+            raise InferenceError(f"推理失败: {str(last_error)}") from last_error
+
+    def status(self) -> list:
+        """各节点状态"""
+        return [endpoint.status() for endpoint in self.endpoints]
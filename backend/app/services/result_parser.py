@@ -0,0 +1,344 @@
+import json
+import logging
+import re
+from typing import Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.schemas.damage import DamageInfo
+
+logger = logging.getLogger(__name__)
+
+# 字符串定界符 → 可接受的结束符 (模型偶尔输出单引号或中文引号)
+QUOTE_PAIRS = {
+    '"': {'"'},
+    "'": {"'"},
+    "“": {"”", "“", '"'},
+    "‘": {"’", "‘", "'"},
+}
+
+# 字符串外的全角结构符号
+FULLWIDTH_PUNCTUATION = {
+    "，": ",",
+    "：": ":",
+    "｛": "{",
+    "｝": "}",
+    "［": "[",
+    "］": "]",
+}
+
+# Python 风格字面量
+LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+BRACKETS = {"{": "}", "[": "]"}
+
+# 数组前的键名，如 "damages": [
+KEY_BEFORE_ARRAY = re.compile(r"""["'“‘”’]\s*(\w+)\s*["'”’“‘]\s*[:：]\s*$""")
+
+
+class ResultParseError(ValueError):
+    """模型输出中找不到可用的识别结果"""
+
+
+class JsonObjectScanner:
+    """
+    增量扫描模型输出，定位第一个括号平衡的 JSON 对象
+
+    按块喂入文本 (流式输出时逐个 token)，跳过对象之前的说明文字，
+    识别字符串边界 (含单引号、中文引号)，对象闭合后 complete 为 True。
+    顶层数组中每闭合一个对象元素，其文本追加到 array_items[键名]，
+    流式输出时据此逐条取出病害。
+    """
+
+    def __init__(self):
+        self.buffer: List[str] = []
+        self.stack: List[str] = []
+        self.complete = False
+        self.array_items: Dict[str, List[str]] = {}
+        self._quote_closers: Optional[set] = None
+        self._escape = False
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+
+    @property
+    def started(self) -> bool:
+        return bool(self.buffer)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        追加一段文本
+
+        Returns:
+            对象是否已闭合
+        """
+        for ch in chunk:
+            if self.complete:
+                break
+            if not self.stack:
+                # 对象开始前的文字全部忽略
+                if ch in ("{", "｛"):
+                    self.stack.append("}")
+                    self.buffer.append(ch)
+                continue
+
+            self.buffer.append(ch)
+            if self._quote_closers is not None:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch in self._quote_closers:
+                    self._quote_closers = None
+                continue
+
+            ch = FULLWIDTH_PUNCTUATION.get(ch, ch)
+            if ch in QUOTE_PAIRS:
+                self._quote_closers = QUOTE_PAIRS[ch]
+            elif ch in BRACKETS:
+                self._open(ch)
+            elif ch in ("}", "]") and self.stack and ch == self.stack[-1]:
+                self._close()
+        return self.complete
+
+    def _open(self, ch: str):
+        depth = len(self.stack)
+        if ch == "[" and depth == 1:
+            # 顶层对象中的数组，记录键名
+            match = KEY_BEFORE_ARRAY.search("".join(self.buffer[-64:-1]))
+            self._array_key = match.group(1) if match else None
+        elif ch == "{" and depth == 2 and self.stack[-1] == "]" and self._array_key:
+            self._item_start = len(self.buffer) - 1
+        self.stack.append(BRACKETS[ch])
+
+    def _close(self):
+        self.stack.pop()
+        depth = len(self.stack)
+        if depth == 2 and self._item_start is not None:
+            item = "".join(self.buffer[self._item_start:])
+            self.array_items.setdefault(self._array_key, []).append(item)
+            self._item_start = None
+        elif depth == 1:
+            self._array_key = None
+        elif depth == 0:
+            self.complete = True
+
+    def text(self, close: bool = False) -> str:
+        """
+        已扫描到的对象文本
+
+        Args:
+            close: 输出被截断时补全未闭合的字符串与括号
+        """
+        text = "".join(self.buffer)
+        if close and not self.complete and self.stack:
+            if self._quote_closers is not None:
+                text += '"'
+            text = text.rstrip().rstrip(",:") + "".join(reversed(self.stack))
+        return text
+
+
+def extract_json_object(text: str) -> str:
+    """
+    从模型输出中提取第一个 JSON 对象
+
+    前后的说明文字、markdown 代码块标记都会被忽略；输出被截断时尽量补全。
+
+    Raises:
+        ResultParseError: 输出中没有 JSON 对象
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if not scanner.started:
+        raise ResultParseError("模型输出中未找到 JSON 对象")
+    return scanner.text(close=True)
+
+
+def repair_json(text: str) -> str:
+    """
+    修复常见的 JSON 格式问题
+
+    - 单引号、中文引号字符串改为双引号
+    - 字符串外的全角逗号、冒号、括号改为半角
+    - 删除对象和数组末尾多余的逗号
+    - True/False/None 改为 JSON 字面量
+
+    字符串内容保持不变 (中文标点在描述文字中是合法的)。
+    """
+    out: List[str] = []
+    closers = None
+    escape = False
+    word: List[str] = []
+
+    def flush_word():
+        if word:
+            token = "".join(word)
+            out.append(LITERALS.get(token, token))
+            word.clear()
+
+    for ch in text:
+        if closers is not None:
+            if escape:
+                out.append(ch)
+                escape = False
+            elif ch == "\\":
+                out.append(ch)
+                escape = True
+            elif ch in closers:
+                out.append('"')
+                closers = None
+            elif ch == '"':
+                # 单引号字符串中的双引号需要转义
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            continue
+
+        if ch.isalpha():
+            word.append(ch)
+            continue
+        flush_word()
+
+        ch = FULLWIDTH_PUNCTUATION.get(ch, ch)
+        if ch in QUOTE_PAIRS:
+            closers = QUOTE_PAIRS[ch]
+            out.append('"')
+        elif ch in ("}", "]"):
+            # 去掉结束括号前多余的逗号
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    flush_word()
+    if closers is not None:
+        out.append('"')
+    return "".join(out)
+
+
+def load_json_object(text: str) -> dict:
+    """
+    宽松解析模型输出为字典
+
+    依次尝试：原样解析 → 提取第一个平衡对象 → 修复格式后解析。
+
+    Raises:
+        ResultParseError: 无法解析
+    """
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except json.JSONDecodeError:
+        pass
+
+    candidate = extract_json_object(text)
+    for attempt in (candidate, repair_json(candidate)):
+        try:
+            data = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    raise ResultParseError(f"无法解析模型输出: {text[:200]}")
+
+
+def validate_damages(items) -> List[dict]:
+    """按 DamageInfo 校验病害列表，丢弃不合格的条目"""
+    if not isinstance(items, list):
+        items = [items] if isinstance(items, dict) else []
+
+    damages = []
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("confidence"), str):
+            # "95%" → 0.95
+            value = item["confidence"].strip()
+            try:
+                confidence = float(value.rstrip("%"))
+                if value.endswith("%"):
+                    confidence /= 100
+                item = {**item, "confidence": confidence}
+            except ValueError:
+                item = {k: v for k, v in item.items() if k != "confidence"}
+        try:
+            damages.append(DamageInfo.model_validate(item).model_dump())
+        except ValidationError as e:
+            logger.warning(f"丢弃不合格的病害条目: {item!r} ({e.error_count()} 处错误)")
+    return damages
+
+
+def parse_detection_result(text: str) -> dict:
+    """
+    解析模型输出为识别结果
+
+    Args:
+        text: 模型原始输出
+
+    Returns:
+        {"damages": [...], "riskLevel": str, "summary": str}，
+        病害条目均通过 DamageInfo 校验；输出被截断时带 "truncated": True
+
+    Raises:
+        ResultParseError: 输出中没有可用的识别结果
+    """
+    data = load_json_object(text)
+    if "damages" not in data and "riskLevel" not in data:
+        raise ResultParseError(f"模型输出缺少 damages 字段: {text[:200]}")
+
+    result = dict(data)
+    result["damages"] = validate_damages(data.get("damages", []))
+    result["riskLevel"] = str(data.get("riskLevel") or "未知")
+    result["summary"] = str(data.get("summary") or "")
+
+    scanner = JsonObjectScanner()
+    if not scanner.feed(text):
+        result["truncated"] = True
+    return result
+
+
+class DamageStreamParser:
+    """
+    流式解析识别结果
+
+    模型边输出边喂入，damages 数组中每闭合一条即校验并返回，
+    输出结束后由 result() 给出完整结果。
+    """
+
+    def __init__(self):
+        self.scanner = JsonObjectScanner()
+        self.chunks: List[str] = []
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        追加模型输出
+
+        Returns:
+            本次新解析出的病害条目 (已通过 DamageInfo 校验)
+        """
+        self.chunks.append(chunk)
+        self.scanner.feed(chunk)
+        items = self.scanner.array_items.get("damages", [])
+        new_items = items[self._emitted:]
+        self._emitted = len(items)
+
+        damages = []
+        for text in new_items:
+            try:
+                damages.extend(validate_damages(load_json_object(text)))
+            except ResultParseError:
+                logger.warning(f"无法解析病害条目: {text[:200]}")
+        return damages
+
+    def result(self) -> dict:
+        """
+        完整识别结果
+
+        Raises:
+            ResultParseError: 输出中没有可用的识别结果
+        """
+        return parse_detection_result("".join(self.chunks))
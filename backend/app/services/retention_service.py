@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import re
+from datetime import date
+
+from app.core.config import settings
+from app.db.init_db import MAINTENANCE_LOCK_KEY, add_months
+from app.services.archive_store import ArchiveStore
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^damages_(\d{4})_(\d{2})$")
+
+# damages 中以 JSON 文本返回的列
+JSON_COLUMNS = ("ai_result", "user_corrected")
+
+
+class RetentionService:
+    """
+    分区维护与数据归档
+
+    定期为 damages 提前创建未来的月分区；启用保留期 (RETENTION_MONTHS) 时，
+    把超期分区的记录和图片打包到本地压缩归档，登记到 damage_archive 后
+    分离并删除分区、清理热存储中的图片。统计计数与病害明细保留，
+    归档记录仍可通过 /api/archive 查询。
+
+    写入时对应月分区尚未建立的记录落在默认分区，维护时建好其所在月的分区并移入；
+    晚于预建范围的记录留在默认分区，直到该月分区被提前创建。
+    """
+
+    def __init__(self, storage_service, archive_store: ArchiveStore = None):
+        self.storage = storage_service
+        self.archive_store = archive_store or ArchiveStore()
+        self._task = None
+
+    async def start(self):
+        """启动后台维护循环 (仅分区模式)"""
+        if not settings.DB_PARTITIONING or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"分区维护失败: {str(e)}")
+            await asyncio.sleep(settings.RETENTION_CHECK_INTERVAL)
+
+    async def run_once(self) -> list:
+        """
+        执行一次分区维护
+
+        Returns:
+            本次归档的分区名列表
+        """
+        pool = await self.storage.get_pool()
+        archived = []
+        async with pool.acquire() as conn:
+            if not await conn.fetchval(
+                "SELECT pg_try_advisory_lock($1)", MAINTENANCE_LOCK_KEY
+            ):
+                return archived
+            try:
+                # 默认分区中早于当前月的记录一并建好月分区移入，之后可按月归档
+                today = date.today()
+                created = await conn.fetchval("""
+                    SELECT damage_partitions_ensure(
+                        LEAST($1, (SELECT MIN(created_at)::date FROM damages_default)), $2
+                    )
+                """,
+                    today,
+                    add_months(today, settings.PARTITION_PREMAKE_MONTHS)
+                )
+                if created:
+                    logger.info(f"新建 {created} 个 damages 分区")
+
+                if settings.RETENTION_MONTHS > 0:
+                    cutoff = add_months(today, -settings.RETENTION_MONTHS)
+                    for name in await self._expired_partitions(conn, cutoff):
+                        await self._archive_partition(conn, name)
+                        archived.append(name)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", MAINTENANCE_LOCK_KEY)
+        return archived
+
+    async def _expired_partitions(self, conn, cutoff: date) -> list:
+        """结束月份早于 cutoff 的月分区，按时间升序"""
+        rows = await conn.fetch("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'damages'::regclass
+        """)
+        expired = []
+        for r in rows:
+            match = PARTITION_NAME.match(r["relname"])
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if add_months(month, 1) <= cutoff:
+                expired.append((month, r["relname"]))
+        return [name for _, name in sorted(expired)]
+
+    async def _archive_partition(self, conn, name: str):
+        """
+        归档单个分区
+
+        整个过程在一个事务中：分区先加 SHARE 锁 (可读不可写)，逐批导出到归档文件，
+        登记归档索引后分离并删除分区。归档文件在提交前已落盘，事务失败时
+        下次重新生成；热存储中的图片在提交后删除。
+        """
+        logger.info(f"归档分区 {name}...")
+        writer = await asyncio.to_thread(self.archive_store.open_writer, name)
+        image_paths = []
+        try:
+            async with conn.transaction():
+                await conn.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+                last = (None, "")
+                while True:
+                    # 按 (created_at, id) 键集分批读取
+                    rows = await conn.fetch(f"""
+                        SELECT * FROM "{name}"
+                        WHERE $1::timestamp IS NULL OR (created_at, id) > ($1, $2)
+                        ORDER BY created_at, id
+                        LIMIT 500
+                    """, *last)
+                    if not rows:
+                        break
+                    last = (rows[-1]["created_at"], rows[-1]["id"])
+                    records = [_to_archive_record(r) for r in rows]
+                    await asyncio.to_thread(writer.add, records)
+                    image_paths.extend(r["image_path"] for r in records if r["image_path"])
+                await asyncio.to_thread(writer.commit)
+
+                await conn.execute(f"""
+                    INSERT INTO damage_archive (damage_id, archive, created_at, risk_level)
+                    SELECT id, $1, created_at, LEFT(ai_result->>'riskLevel', 50)
+                    FROM "{name}"
+                    ON CONFLICT (damage_id) DO UPDATE SET archive = EXCLUDED.archive
+                """, name)
+                await conn.execute(f'ALTER TABLE damages DETACH PARTITION "{name}"')
+                await conn.execute(f'DROP TABLE "{name}"')
+                # 删除分区不触发行变更，手动更新变更计数
+                await conn.execute("""
+                    UPDATE app_counters SET value = value + 1 WHERE name = 'damages_version'
+                """)
+        except BaseException:
+            await asyncio.to_thread(writer.discard)
+            raise
+
+        for path in image_paths:
+            await self.storage.file_store.delete(path)
+        logger.info(
+            f"分区 {name} 已归档: {writer.records} 条记录, {writer.images} 张图片"
+        )
+
+
+def _to_archive_record(row) -> dict:
+    """数据库行转为归档记录 (JSON 列解析为对象)"""
+    record = dict(row)
+    for column in JSON_COLUMNS:
+        if isinstance(record.get(column), str):
+            record[column] = json.loads(record[column])
+    for key, value in record.items():
+        if hasattr(value, "isoformat"):
+            record[key] = value.isoformat()
+    return record
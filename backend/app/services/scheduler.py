@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Tuple
+
+from app.core.config import settings
+
+
+class InferenceScheduler:
+    """
+    推理调度器
+
+    使用信号量限制同时发往 Ollama 的推理请求数量，
+    使模型保持忙碌但不会被压垮。同一进程内所有批量任务共享该上限。
+    """
+
+    def __init__(self, concurrency: int = None):
+        self.concurrency = concurrency or settings.INFERENCE_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.in_flight = 0
+
+    async def submit(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """在并发上限内执行单个任务"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await func(*args)
+            finally:
+                self.in_flight -= 1
+
+    async def map_unordered(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        items: Iterable[Any]
+    ) -> AsyncIterator[Tuple[Any, Any, Exception]]:
+        """
+        并发处理一组任务，按完成顺序产出结果
+
+        Args:
+            func: 处理单个元素的协程函数
+            items: 待处理元素
+
+        Yields:
+            (元素, 结果, 异常) 三元组，成功时异常为 None
+        """
+        async def run(item):
+            try:
+                return item, await self.submit(func, item), None
+            except Exception as e:
+                return item, None, e
+
+        tasks = [asyncio.create_task(run(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 客户端断开时取消尚未完成的任务
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from datetime import date
+from typing import Optional
+
+from app.core.config import settings
+
+# 支持的统计维度与时间粒度
+STAT_DIMENSIONS = ("total", "type", "severity", "risk_level", "corrected")
+STAT_BUCKETS = ("day", "week", "month")
+
+
+class StatsService:
+    """
+    统计数据服务
+
+    计数由 damages 表上的触发器在插入、完成、修正时增量维护到 damage_stats
+    (按天 × 维度 × 取值)，查询只需聚合该小表，不再扫描 damages。
+    汇总结果在内存中缓存 STATS_CACHE_TTL 秒，并发请求共享同一次刷新。
+    """
+
+    def __init__(self, storage_service, ttl: float = None):
+        self.storage = storage_service
+        self.ttl = ttl if ttl is not None else settings.STATS_CACHE_TTL
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_statistics(self) -> dict:
+        """获取统计汇总 (内存快照)"""
+        if self._snapshot is not None and time.monotonic() < self._expires_at:
+            return self._snapshot
+
+        async with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._expires_at:
+                self._snapshot = await self._load_snapshot()
+                self._expires_at = time.monotonic() + self.ttl
+        return self._snapshot
+
+    def invalidate(self):
+        """使快照失效，下次请求重新加载"""
+        self._expires_at = 0.0
+
+    async def _load_snapshot(self) -> dict:
+        pool = await self.storage.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT dimension, value, SUM(count)::bigint AS count
+                FROM damage_stats
+                GROUP BY dimension, value
+                HAVING SUM(count) <> 0
+            """)
+
+        counters = {dimension: {} for dimension in STAT_DIMENSIONS}
+        for r in rows:
+            counters.setdefault(r["dimension"], {})[r["value"]] = r["count"]
+
+        return {
+            "total_detections": sum(counters["total"].values()),
+            "total_corrections": counters["corrected"].get("是", 0),
+            "by_type": counters["type"],
+            "by_severity": counters["severity"],
+            "by_risk_level": counters["risk_level"]
+        }
+
+    async def get_timeseries(
+        self,
+        dimension: str = "total",
+        bucket: str = "day",
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> list:
+        """
+        按时间粒度分桶的统计
+
+        Args:
+            dimension: 统计维度 (total/type/severity/risk_level/corrected)
+            bucket: 时间粒度 (day/week/month)
+            start: 起始日期 (含)
+            end: 截止日期 (不含)
+
+        Returns:
+            [{"bucket": 日期, "counts": {取值: 数量}}] 按时间升序
+        """
+        if dimension not in STAT_DIMENSIONS:
+            raise ValueError(f"不支持的统计维度: {dimension}")
+        if bucket not in STAT_BUCKETS:
+            raise ValueError(f"不支持的时间粒度: {bucket}")
+
+        pool = await self.storage.get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT date_trunc($1, bucket_date)::date AS bucket,
+                       value,
+                       SUM(count)::bigint AS count
+                FROM damage_stats
+                WHERE dimension = $2
+                  AND ($3::date IS NULL OR bucket_date >= $3)
+                  AND ($4::date IS NULL OR bucket_date < $4)
+                GROUP BY 1, 2
+                HAVING SUM(count) <> 0
+                ORDER BY 1
+            """,
+                bucket,
+                dimension,
+                start,
+                end
+            )
+
+        series = {}
+        for r in rows:
+            series.setdefault(r["bucket"], {})[r["value"]] = r["count"]
+        return [
+            {"bucket": bucket_date, "counts": counts}
+            for bucket_date, counts in series.items()
+        ]
@@ -1,177 +1,609 @@
 import os
 import json
+import logging
 from datetime import datetime
-from pathlib import Path
 import asyncpg
-from chromadb import HttpClient
 from app.core.config import settings
+from app.core.metrics import stage
+from app.db.init_db import init_db
+from app.services.file_store import FileStore
+from app.services.vector_store import (
+    VectorItem, SimilarityFilter, VectorStoreError, create_vector_store
+)
+from app.services.embedding_service import EmbeddingService
+from app.services.cache_service import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+def _primary_damage(ai_result: dict) -> dict:
+    """取识别结果中的第一处病害，无病害时返回空字典"""
+    return (ai_result.get("damages") or [{}])[0]
+
+
+def _primary_columns(ai_result: dict) -> tuple:
+    """
+    主病害的 (damage_type, severity, location) 列值
+
+    按列宽截断，避免模型输出的超长字段导致写入失败
+    """
+    damage = _primary_damage(ai_result)
+    return (
+        str(damage.get("type", "未知"))[:50],
+        str(damage.get("severity", "未知"))[:20],
+        str(damage.get("location", ""))[:200]
+    )
 
 
 class StorageService:
     def __init__(self):
         self.db_pool = None
-        self.chroma_client = HttpClient(
-            host=settings.CHROMA_HOST,
-            port=settings.CHROMA_PORT
+        self.vector_store = create_vector_store(self)
+        self.embedding_service = EmbeddingService()
+        # 热点记录的相似查询结果，新记录入库或修正时整体失效
+        self.similar_cache = ResultCache(
+            max_size=settings.SIMILAR_CACHE_SIZE,
+            ttl=settings.SIMILAR_CACHE_TTL,
+            persistent=False
         )
-        self.collection = None
+        self.file_store = FileStore()
     
-    async def init_db(self):
-        """初始化数据库连接池"""
+    async def start(self):
+        """
+        创建连接池、初始化表结构并预热
+        
+        在应用启动时调用一次，之后所有方法共享同一个连接池。
+        """
+        self.file_store.ensure_dir()
+        
         if not self.db_pool:
             self.db_pool = await asyncpg.create_pool(
                 settings.DATABASE_URL,
-                min_size=2,
-                max_size=10
+                min_size=settings.DB_POOL_MIN_SIZE,
+                max_size=settings.DB_POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=settings.DB_POOL_MAX_IDLE
             )
+        await init_db(self.db_pool)
         
-        # 初始化 ChromaDB collection
-        if not self.collection:
-            self.collection = self.chroma_client.get_or_create_collection(
-                name=settings.CHROMA_COLLECTION
-            )
+        await self.embedding_service.load()
+        try:
+            await self.vector_store.init()
+        except VectorStoreError as e:
+            # 向量库暂不可用时不阻止启动，首次使用时重连
+            logger.warning(f"向量库预热失败: {str(e)}")
+    
+    async def close(self):
+        """关闭连接池与后台资源"""
+        await self.vector_store.close()
+        await self.embedding_service.close()
+        self.file_store.shutdown()
+        if self.db_pool:
+            await self.db_pool.close()
+            self.db_pool = None
+    
+    async def get_pool(self):
+        """获取数据库连接池"""
+        return self.db_pool
     
     async def save_image(self, image_id: str, image_bytes: bytes) -> str:
         """保存图片文件"""
-        upload_dir = Path(settings.UPLOAD_DIR)
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        image_path = upload_dir / f"{image_id}.jpg"
-        with open(image_path, "wb") as f:
-            f.write(image_bytes)
-        
-        return str(image_path)
+        with stage("save_image"):
+            return await self.file_store.write(f"{image_id}.jpg", image_bytes)
+    
+    async def load_image(self, image_path: str) -> bytes:
+        """读取图片文件"""
+        return await self.file_store.read(image_path)
     
     async def save_detection(self, damage_record):
         """保存检测记录到 PostgreSQL"""
-        await self.init_db()
+        await self.save_detections([damage_record])
+    
+    async def save_embedding(self, damage_id: str, image_bytes: bytes, ai_result: dict):
+        """保存图像向量"""
+        await self.save_embeddings([(damage_id, image_bytes, ai_result)])
+    
+    async def save_detections(self, damage_records: list):
+        """
+        批量保存检测记录到 PostgreSQL
         
-        async with self.db_pool.acquire() as conn:
-            await conn.execute("""
-                INSERT INTO damages (
-                    id, image_path, damage_type, severity, 
-                    location, ai_result, created_at
-                )
-                VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ON CONFLICT (id) DO NOTHING
-            """,
-                damage_record.id,
-                damage_record.image_path,
-                damage_record.ai_result.get("damages", [{}])[0].get("type", "未知"),
-                damage_record.ai_result.get("damages", [{}])[0].get("severity", "未知"),
-                damage_record.ai_result.get("damages", [{}])[0].get("location", ""),
-                json.dumps(damage_record.ai_result, ensure_ascii=False),
-                datetime.now()
+        整批通过 unnest 展开为一条多行 INSERT，一次往返写入。
+        """
+        if not damage_records:
+            return
+        
+        now = datetime.now()
+        columns = ([], [], [], [], [], [], [], [])
+        for record in damage_records:
+            row = (
+                record.id,
+                record.image_path,
+                *_primary_columns(record.ai_result),
+                json.dumps(record.ai_result, ensure_ascii=False),
+                record.created_at or now,
+                record.phash
             )
+            for column, value in zip(columns, row):
+                column.append(value)
+        
+        with stage("db_write"):
+            async with self.db_pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO damages (
+                        id, image_path, damage_type, severity, 
+                        location, ai_result, created_at, phash
+                    )
+                    SELECT * FROM unnest(
+                        $1::varchar[], $2::text[], $3::varchar[], $4::varchar[],
+                        $5::varchar[], $6::jsonb[], $7::timestamp[], $8::bigint[]
+                    )
+                    ON CONFLICT DO NOTHING
+                """, *columns)
     
-    async def save_embedding(self, damage_id: str, image_bytes: bytes, ai_result: dict):
-        """保存图像向量到 ChromaDB"""
-        await self.init_db()
-        
-        # 这里简化处理，实际应该用 CLIP 模型生成 embedding
-        # 当前使用文本描述作为向量
-        text_desc = json.dumps(ai_result, ensure_ascii=False)
-        
-        self.collection.add(
-            documents=[text_desc],
-            metadatas=[{
-                "damage_id": damage_id,
-                "type": ai_result.get("damages", [{}])[0].get("type", "未知"),
-                "severity": ai_result.get("damages", [{}])[0].get("severity", "未知"),
-                "created_at": datetime.now().isoformat()
-            }],
-            ids=[damage_id]
-        )
+    async def save_embeddings(self, items: list):
+        """
+        批量保存图像向量
+        
+        Args:
+            items: (damage_id, image_bytes, ai_result) 列表
+        """
+        if not items:
+            return
+        
+        # 图像向量模式下由本地编码器生成，未生成的条目由向量库补位
+        with stage("embedding"):
+            embeddings = await self.embedding_service.embed_many(
+                [image_bytes for _, image_bytes, _ in items]
+            )
+        
+        now = datetime.now()
+        vector_items = []
+        for (damage_id, _, ai_result), embedding in zip(items, embeddings):
+            damage = _primary_damage(ai_result)
+            vector_items.append(VectorItem(
+                id=damage_id,
+                document=json.dumps(ai_result, ensure_ascii=False),
+                metadata={
+                    "damage_id": damage_id,
+                    "type": damage.get("type", "未知"),
+                    "severity": damage.get("severity", "未知"),
+                    "created_at": now.isoformat(),
+                    "created_ts": now.timestamp()
+                },
+                embedding=embedding
+            ))
+        
+        with stage("vector_add"):
+            await self.vector_store.add(vector_items)
+        self.similar_cache.clear()
     
-    async def find_similar(self, damage_id: str, limit: int = 5) -> list:
+    async def find_similar(
+        self,
+        damage_id: str,
+        limit: int = 5,
+        offset: int = 0,
+        filters: SimilarityFilter = None
+    ) -> list:
         """查找相似病害"""
-        await self.init_db()
-        
-        # 从 ChromaDB 获取原始记录
-        result = self.collection.get(ids=[damage_id])
-        if not result["documents"]:
-            return []
-        
-        # 相似度搜索
-        query_text = result["documents"][0]
-        similar = self.collection.query(
-            query_texts=[query_text],
-            n_results=limit + 1  # +1 因为会包含自己
-        )
+        cache_key = f"{damage_id}:{limit}:{offset}:{filters!r}"
+        cached = await self.similar_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        result = await self._find_similar(damage_id, limit, offset, filters)
+        await self.similar_cache.set(cache_key, result)
+        return result
+    
+    async def _find_similar(
+        self,
+        damage_id: str,
+        limit: int,
+        offset: int,
+        filters: SimilarityFilter
+    ) -> list:
+        with stage("vector_query"):
+            similar = await self.vector_store.find_similar(damage_id, limit, offset, filters)
+        if self.vector_store.joins_details:
+            return similar
+        
+        # 从 PostgreSQL 获取详细信息，保持相似度顺序
+        similar_ids = [item["id"] for item in similar]
+        with stage("db_read"):
+            async with self.db_pool.acquire() as conn:
+                records = await conn.fetch(
+                    "SELECT * FROM damages WHERE id = ANY($1)",
+                    similar_ids
+                )
+        
+        by_id = {r["id"]: dict(r) for r in records}
+        return [
+            {**by_id[item["id"]], "distance": item["distance"]}
+            for item in similar
+            if item["id"] in by_id
+        ]
+    
+    async def query_damage_items(
+        self,
+        damage_types: list = None,
+        severities: list = None,
+        start: datetime = None,
+        end: datetime = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> list:
+        """
+        按类型、严重程度、时间查询病害明细
         
-        # 过滤掉自己
-        similar_ids = [
-            id for id in similar["ids"][0] 
-            if id != damage_id
-        ][:limit]
+        走 damage_items 的 (damage_type, severity, created_at) 索引，
+        每处病害一行，按识别时间倒序。
+        
+        Args:
+            damage_types: 病害类型列表 (为空不过滤)
+            severities: 严重程度列表 (为空不过滤)
+            start: 起始时间 (含)
+            end: 截止时间 (不含)
+            limit: 返回数量
+            offset: 跳过数量
+        """
+        # 只拼接实际使用的条件，让计划器对每种组合选用合适的索引
+        conditions, params = [], []
+        if damage_types:
+            params.append(damage_types)
+            conditions.append(f"i.damage_type = ANY(${len(params)}::damage_type_enum[])")
+        if severities:
+            params.append(severities)
+            conditions.append(f"i.severity = ANY(${len(params)}::damage_severity_enum[])")
+        if start:
+            params.append(start)
+            conditions.append(f"i.created_at >= ${len(params)}")
+        if end:
+            params.append(end)
+            conditions.append(f"i.created_at < ${len(params)}")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params += [limit, offset]
         
-        # 从 PostgreSQL 获取详细信息
         async with self.db_pool.acquire() as conn:
-            records = await conn.fetch(
-                "SELECT * FROM damages WHERE id = ANY($1)",
-                similar_ids
+            records = await conn.fetch(f"""
+                SELECT
+                    i.damage_id, i.item_index, i.damage_type::text AS type,
+                    i.severity::text AS severity, i.raw_type, i.location, i.size,
+                    i.suggest_action, i.confidence, i.created_at,
+                    COALESCE(d.ai_result->>'riskLevel', a.risk_level) AS risk_level,
+                    a.archive
+                FROM damage_items i
+                LEFT JOIN damages d ON d.id = i.damage_id
+                LEFT JOIN damage_archive a ON a.damage_id = i.damage_id
+                {where}
+                ORDER BY i.created_at DESC, i.damage_id, i.item_index
+                LIMIT ${len(params) - 1} OFFSET ${len(params)}
+            """, *params)
+        return [dict(r) for r in records]
+    
+    async def list_detections(
+        self,
+        filters: dict = None,
+        cursor: tuple = None,
+        limit: int = 20,
+        include: tuple = ()
+    ) -> list:
+        """
+        键集分页查询识别记录
+        
+        按 (created_at, id) 倒序，cursor 为上一页最后一条的 (created_at, id)。
+        默认不读取 ai_result / user_corrected 大字段，需要时通过 include 指定。
+        
+        Args:
+            filters: damage_type / severity / risk_level / corrected / status
+            cursor: 上一页最后一条记录的 (created_at, id)
+            limit: 返回数量
+            include: 额外读取的 JSONB 列
+            
+        Returns:
+            记录列表 (最多 limit 条)
+        """
+        filters = filters or {}
+        conditions, params = [], []
+        
+        def bind(value) -> str:
+            params.append(value)
+            return f"${len(params)}"
+        
+        for column in ("damage_type", "severity", "status"):
+            if filters.get(column):
+                conditions.append(f"{column} = {bind(filters[column])}")
+        if filters.get("risk_level"):
+            # 包含查询走 ai_result 的 GIN 索引
+            conditions.append(
+                f"ai_result @> jsonb_build_object('riskLevel', {bind(filters['risk_level'])}::text)"
+            )
+        if filters.get("corrected") is not None:
+            conditions.append(
+                "user_corrected IS NOT NULL" if filters["corrected"] else "user_corrected IS NULL"
             )
+        if cursor:
+            created_at, last_id = cursor
+            conditions.append(f"(created_at, id) < ({bind(created_at)}, {bind(last_id)})")
         
+        columns = [
+            "id", "image_path", "damage_type", "severity", "location",
+            "ai_result->>'riskLevel' AS risk_level",
+            "user_corrected IS NOT NULL AS corrected",
+            "status", "created_at", "updated_at"
+        ]
+        columns += [column for column in ("ai_result", "user_corrected") if column in include]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        async with self.db_pool.acquire() as conn:
+            records = await conn.fetch(f"""
+                SELECT {', '.join(columns)}
+                FROM damages
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT {bind(limit)}
+            """, *params)
+        
+        results = []
+        for r in records:
+            row = dict(r)
+            for column in ("ai_result", "user_corrected"):
+                if isinstance(row.get(column), str):
+                    row[column] = json.loads(row[column])
+            results.append(row)
+        return results
+    
+    async def get_archive_entry(self, damage_id: str):
+        """查询记录所在的归档，未归档时返回 None"""
+        async with self.db_pool.acquire() as conn:
+            record = await conn.fetchrow("""
+                SELECT damage_id, archive, created_at, risk_level, archived_at
+                FROM damage_archive
+                WHERE damage_id = $1
+            """, damage_id)
+        return dict(record) if record else None
+    
+    async def list_archives(self) -> list:
+        """各归档的记录数与时间范围"""
+        async with self.db_pool.acquire() as conn:
+            records = await conn.fetch("""
+                SELECT archive, COUNT(*) AS records,
+                       MIN(created_at) AS first_created_at,
+                       MAX(created_at) AS last_created_at,
+                       MAX(archived_at) AS archived_at
+                FROM damage_archive
+                GROUP BY archive
+                ORDER BY archive
+            """)
         return [dict(r) for r in records]
     
     async def save_correction(self, damage_id: str, corrected_data: dict):
-        """保存用户修正数据"""
-        await self.init_db()
+        """
+        保存用户修正数据
         
+        Returns:
+            保存后的修正总数，记录不存在时返回 None
+        """
+        total, saved_ids = await self.save_corrections([(damage_id, corrected_data)])
+        return total if saved_ids else None
+    
+    async def save_corrections(self, items: list) -> tuple:
+        """
+        批量保存用户修正数据
+        
+        更新 damages、写入修正历史、累加修正计数在同一条语句中完成 (单次往返、原子)。
+        同一记录在批次中出现多次时以最后一条为准，历史表保留全部。
+        
+        Args:
+            items: (damage_id, corrected_data) 列表
+            
+        Returns:
+            (保存后的修正总数, 成功保存的记录ID列表)
+        """
+        with stage("db_write"):
+            async with self.db_pool.acquire() as conn:
+                record = await conn.fetchrow("""
+                    WITH input AS (
+                        SELECT damage_id, corrected_data, ord
+                        FROM unnest($1::varchar[], $2::jsonb[])
+                            WITH ORDINALITY AS t(damage_id, corrected_data, ord)
+                    ),
+                    latest AS (
+                        SELECT DISTINCT ON (damage_id) damage_id, corrected_data
+                        FROM input
+                        ORDER BY damage_id, ord DESC
+                    ),
+                    updated AS (
+                        UPDATE damages d
+                        SET user_corrected = l.corrected_data, updated_at = $3
+                        FROM latest l
+                        WHERE d.id = l.damage_id
+                        RETURNING d.id
+                    ),
+                    inserted AS (
+                        INSERT INTO damage_corrections (damage_id, corrected_data, created_at)
+                        SELECT i.damage_id, i.corrected_data, $3
+                        FROM input i
+                        JOIN updated u ON u.id = i.damage_id
+                        ORDER BY i.ord
+                        RETURNING damage_id
+                    ),
+                    counter AS (
+                        UPDATE app_counters
+                        SET value = value + (SELECT COUNT(*) FROM inserted)
+                        WHERE name = 'corrections'
+                        RETURNING value
+                    )
+                    SELECT (SELECT value FROM counter) AS total,
+                           ARRAY(SELECT DISTINCT damage_id FROM inserted) AS saved_ids
+                """,
+                    [damage_id for damage_id, _ in items],
+                    [json.dumps(data, ensure_ascii=False) for _, data in items],
+                    datetime.now()
+                )
+        
+        self.similar_cache.clear()
+        return record["total"], list(record["saved_ids"])
+    
+    async def get_correction_count(self) -> int:
+        """获取修正数据数量 (读取计数行)"""
+        async with self.db_pool.acquire() as conn:
+            count = await conn.fetchval(
+                "SELECT value FROM app_counters WHERE name = 'corrections'"
+            )
+        return count or 0
+    
+    async def get_damages_version(self) -> int:
+        """damages 变更计数 (任一记录写入、修改或删除后增加)"""
+        async with self.db_pool.acquire() as conn:
+            version = await conn.fetchval(
+                "SELECT value FROM app_counters WHERE name = 'damages_version'"
+            )
+        return version or 0
+    
+    async def enqueue_job(self, damage_id: str, image_path: str):
+        """创建待处理的异步检测任务"""
         async with self.db_pool.acquire() as conn:
             await conn.execute("""
-                UPDATE damages 
-                SET user_corrected = $1, updated_at = $2
-                WHERE id = $3
+                INSERT INTO damages (id, image_path, status, created_at)
+                VALUES ($1, $2, 'pending', $3)
             """,
-                json.dumps(corrected_data, ensure_ascii=False),
+                damage_id,
+                image_path,
+                datetime.now()
+            )
+    
+    async def claim_job(self):
+        """领取一个待处理任务，无任务时返回 None"""
+        async with self.db_pool.acquire() as conn:
+            record = await conn.fetchrow("""
+                UPDATE damages
+                SET status = 'processing',
+                    started_at = $1,
+                    attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM damages
+                    WHERE status = 'pending'
+                    ORDER BY created_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, image_path, attempts
+            """,
+                datetime.now()
+            )
+        return dict(record) if record else None
+    
+    async def complete_job(self, damage_id: str, ai_result: dict):
+        """写入任务识别结果并标记完成"""
+        damage_type, severity, location = _primary_columns(ai_result)
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE damages
+                SET status = 'completed',
+                    damage_type = $1,
+                    severity = $2,
+                    location = $3,
+                    ai_result = $4,
+                    error = NULL,
+                    updated_at = $5
+                WHERE id = $6
+            """,
+                damage_type,
+                severity,
+                location,
+                json.dumps(ai_result, ensure_ascii=False),
                 datetime.now(),
                 damage_id
             )
-            
-            # 记录到修正历史表
+    
+    async def fail_job(self, damage_id: str, error: str, retry: bool):
+        """记录任务失败，可重试时放回队列"""
+        async with self.db_pool.acquire() as conn:
             await conn.execute("""
-                INSERT INTO damage_corrections (
-                    damage_id, corrected_data, created_at
-                )
-                VALUES ($1, $2, $3)
+                UPDATE damages
+                SET status = $1, error = $2, updated_at = $3
+                WHERE id = $4
             """,
-                damage_id,
-                json.dumps(corrected_data, ensure_ascii=False),
-                datetime.now()
+                "pending" if retry else "failed",
+                error,
+                datetime.now(),
+                damage_id
             )
     
-    async def get_correction_count(self) -> int:
-        """获取修正数据数量"""
-        await self.init_db()
+    async def recover_stale_jobs(self, timeout: int, max_attempts: int) -> int:
+        """
+        将超时未完成的任务放回队列 (如进程重启时遗留的任务)
+        
+        已领取 max_attempts 次的任务标记为失败，避免每次都使 worker 崩溃的任务无限重试。
         
+        Returns:
+            处理的任务数
+        """
         async with self.db_pool.acquire() as conn:
-            count = await conn.fetchval(
-                "SELECT COUNT(*) FROM damage_corrections"
+            result = await conn.execute("""
+                UPDATE damages
+                SET status = CASE WHEN attempts >= $2 THEN 'failed' ELSE 'pending' END,
+                    error = CASE WHEN attempts >= $2 THEN '任务多次中断未完成' ELSE error END,
+                    updated_at = CASE WHEN attempts >= $2 THEN $3 ELSE updated_at END
+                WHERE status = 'processing'
+                  AND started_at < NOW() - make_interval(secs => $1)
+            """,
+                float(timeout),
+                max_attempts,
+                datetime.now()
             )
+        return int(result.split()[-1])
+    
+    async def count_active_jobs(self) -> int:
+        """统计排队中与处理中的任务数"""
+        async with self.db_pool.acquire() as conn:
+            count = await conn.fetchval("""
+                SELECT COUNT(*) FROM damages
+                WHERE status IN ('pending', 'processing')
+            """)
         return count
     
-    async def get_statistics(self) -> dict:
-        """获取统计数据"""
-        await self.init_db()
-        
+    async def get_job(self, damage_id: str):
+        """查询任务状态与结果"""
         async with self.db_pool.acquire() as conn:
-            total = await conn.fetchval("SELECT COUNT(*) FROM damages")
-            corrected = await conn.fetchval(
-                "SELECT COUNT(*) FROM damages WHERE user_corrected IS NOT NULL"
+            record = await conn.fetchrow("""
+                SELECT id, status, error, attempts, ai_result,
+                       created_at, started_at, updated_at
+                FROM damages
+                WHERE id = $1
+            """,
+                damage_id
             )
-            by_type = await conn.fetch("""
-                SELECT damage_type, COUNT(*) as count 
-                FROM damages 
-                GROUP BY damage_type
-            """)
+        if not record:
+            return None
         
-        return {
-            "total_detections": total,
-            "total_corrections": corrected,
-            "by_type": {r["damage_type"]: r["count"] for r in by_type}
-        }
-
-
-# 全局实例
-storage_service = StorageService()
+        job = dict(record)
+        if job["ai_result"] is not None:
+            job["ai_result"] = json.loads(job["ai_result"])
+        return job
+    
+    async def get_cached_result(self, cache_key: str, ttl: int):
+        """读取持久化的识别结果缓存"""
+        async with self.db_pool.acquire() as conn:
+            value = await conn.fetchval("""
+                SELECT ai_result FROM detection_cache
+                WHERE cache_key = $1
+                  AND created_at > NOW() - make_interval(secs => $2)
+            """,
+                cache_key,
+                float(ttl)
+            )
+        return json.loads(value) if value is not None else None
+    
+    async def save_cached_result(self, cache_key: str, ai_result: dict):
+        """写入持久化的识别结果缓存"""
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO detection_cache (cache_key, ai_result, created_at)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (cache_key) DO UPDATE
+                SET ai_result = EXCLUDED.ai_result,
+                    created_at = EXCLUDED.created_at
+            """,
+                cache_key,
+                json.dumps(ai_result, ensure_ascii=False),
+                datetime.now()
+            )
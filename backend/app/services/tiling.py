@@ -0,0 +1,356 @@
+import asyncio
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from PIL import Image, ImageOps, ImageStat
+
+from app.core.config import settings
+from app.services.result_parser import (
+    ResultParseError, load_json_object, validate_damages
+)
+
+logger = logging.getLogger(__name__)
+
+# 风险等级从低到高，合并分块结果时取最高
+RISK_LEVELS = ["低", "中", "高", "紧急"]
+
+SEVERITY_LEVELS = ["轻微", "中等", "严重", "危险"]
+
+# 方差检查前把分块缩到的边长
+VARIANCE_SAMPLE_EDGE = 64
+
+
+@dataclass
+class Tile:
+    """大图中的一个分块"""
+    row: int
+    col: int
+    box: Tuple[int, int, int, int]  # 原图像素坐标 (x0, y0, x1, y1)
+    image_bytes: bytes
+    variance: float
+
+    @property
+    def label(self) -> str:
+        return f"r{self.row}c{self.col}"
+
+
+@dataclass
+class TilePlan:
+    """分块结果"""
+    size: Tuple[int, int]  # 原图尺寸 (方向校正后)
+    grid: Tuple[int, int]  # (行数, 列数)
+    tiles: List[Tile]  # 需要识别的分块
+    skipped: int  # 空白而跳过的分块数
+
+
+@dataclass
+class TileDamage:
+    """分块中识别出的病害"""
+    tile: Tile
+    damage: dict
+    box: Optional[Tuple[int, int, int, int]]  # 原图像素坐标，模型未给出时为 None
+
+
+class ImageTiler:
+    """
+    高分辨率图片分块
+
+    线扫、无人机图片长边可达 8000 像素以上，整图发给视觉模型会被缩小，
+    细裂缝随之消失。长边超过 TILE_TRIGGER_EDGE 的图片按 TILE_SIZE 切成
+    相互重叠 TILE_OVERLAP 像素的分块，灰度方差低于 TILE_MIN_VARIANCE 的
+    空白分块 (天空、黑边、均匀路面) 直接跳过。解码与切分在线程池中执行。
+    """
+
+    def __init__(
+        self,
+        tile_size: int = None,
+        overlap: int = None,
+        trigger_edge: int = None,
+        min_variance: float = None,
+        quality: int = None,
+        enabled: bool = None
+    ):
+        self.tile_size = tile_size or settings.TILE_SIZE
+        self.overlap = overlap if overlap is not None else settings.TILE_OVERLAP
+        self.trigger_edge = trigger_edge or settings.TILE_TRIGGER_EDGE
+        self.min_variance = min_variance if min_variance is not None \
+            else settings.TILE_MIN_VARIANCE
+        self.quality = quality or settings.IMAGE_JPEG_QUALITY
+        self.enabled = enabled if enabled is not None else settings.TILING_ENABLED
+
+        if not 0 <= self.overlap < self.tile_size:
+            raise ValueError("TILE_OVERLAP 必须小于 TILE_SIZE")
+
+        # 累计统计
+        self.images = 0
+        self.total_tiles = 0
+        self.skipped_tiles = 0
+
+    @property
+    def signature(self) -> str:
+        """分块参数，用于区分缓存结果"""
+        return f"tile{self.tile_size}o{self.overlap}v{self.min_variance:g}"
+
+    async def needs_tiling(self, image_bytes: bytes) -> bool:
+        """只读取文件头判断是否需要分块，无法解码时返回 False"""
+        if not self.enabled:
+            return False
+        try:
+            size = await asyncio.to_thread(_read_size, image_bytes)
+        except Exception:
+            return False
+        return max(size) > self.trigger_edge
+
+    async def split(self, image_bytes: bytes) -> TilePlan:
+        """异步切分图片"""
+        plan = await asyncio.to_thread(self.split_sync, image_bytes)
+        self.images += 1
+        self.total_tiles += len(plan.tiles) + plan.skipped
+        self.skipped_tiles += plan.skipped
+        logger.info(
+            f"图片分块: {plan.size} → {plan.grid[0]}x{plan.grid[1]} 块, "
+            f"跳过空白 {plan.skipped} 块"
+        )
+        return plan
+
+    def split_sync(self, image_bytes: bytes) -> TilePlan:
+        """
+        同步切分图片
+
+        Raises:
+            PIL.UnidentifiedImageError: 图片无法解码
+        """
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image = ImageOps.exif_transpose(img)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.load()
+
+        width, height = image.size
+        xs = self.axis_starts(width)
+        ys = self.axis_starts(height)
+        tiles = []
+        skipped = 0
+        for row, y in enumerate(ys):
+            for col, x in enumerate(xs):
+                box = (x, y, min(x + self.tile_size, width), min(y + self.tile_size, height))
+                crop = image.crop(box)
+                variance = _gray_variance(crop)
+                if variance < self.min_variance:
+                    skipped += 1
+                    continue
+                buffer = io.BytesIO()
+                crop.save(buffer, format="JPEG", quality=self.quality)
+                tiles.append(Tile(row, col, box, buffer.getvalue(), variance))
+        return TilePlan(
+            size=(width, height),
+            grid=(len(ys), len(xs)),
+            tiles=tiles,
+            skipped=skipped
+        )
+
+    def axis_starts(self, length: int) -> List[int]:
+        """
+        一个方向上各分块的起点
+
+        取保证重叠不小于 TILE_OVERLAP 的最少分块数，起点均匀分布，
+        首尾分块与边缘对齐。
+        """
+        if length <= self.tile_size:
+            return [0]
+        step = self.tile_size - self.overlap
+        count = math.ceil((length - self.overlap) / step)
+        span = length - self.tile_size
+        return [round(i * span / (count - 1)) for i in range(count)]
+
+    def stats(self) -> dict:
+        """分块累计统计"""
+        return {
+            "enabled": self.enabled,
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "trigger_edge": self.trigger_edge,
+            "min_variance": self.min_variance,
+            "images": self.images,
+            "tiles": self.total_tiles,
+            "skipped_tiles": self.skipped_tiles,
+            "skip_rate": round(
+                self.skipped_tiles / self.total_tiles, 4
+            ) if self.total_tiles else 0.0
+        }
+
+
+def _read_size(image_bytes: bytes) -> Tuple[int, int]:
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # EXIF 方向为 5~8 时宽高互换
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            return img.size[1], img.size[0]
+        return img.size
+
+
+def _gray_variance(image: Image.Image) -> float:
+    """缩小后的灰度方差，衡量分块是否有纹理"""
+    sample = image.convert("L")
+    sample.thumbnail((VARIANCE_SAMPLE_EDGE, VARIANCE_SAMPLE_EDGE))
+    return ImageStat.Stat(sample).var[0]
+
+
+def parse_tile_result(text: str, tile: Tile) -> Tuple[List[TileDamage], str]:
+    """
+    解析单个分块的模型输出
+
+    Returns:
+        (病害列表, 风险等级)
+
+    Raises:
+        ResultParseError: 输出中没有可用的识别结果
+    """
+    data = load_json_object(text)
+    if "damages" not in data and "riskLevel" not in data:
+        raise ResultParseError(f"模型输出缺少 damages 字段: {text[:200]}")
+
+    items = data.get("damages") or []
+    if not isinstance(items, list):
+        items = [items]
+
+    found = []
+    for item in items:
+        validated = validate_damages([item])
+        if not validated:
+            continue
+        bbox = item.get("bbox") if isinstance(item, dict) else None
+        found.append(TileDamage(tile, validated[0], _to_image_box(bbox, tile.box)))
+    return found, str(data.get("riskLevel") or "未知")
+
+
+def _to_image_box(bbox, tile_box) -> Optional[Tuple[int, int, int, int]]:
+    """分块内 0~1 相对坐标转为原图像素坐标，格式不对时返回 None"""
+    if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+        return None
+    try:
+        x0, y0, x1, y1 = (min(max(float(v), 0.0), 1.0) for v in bbox)
+    except (TypeError, ValueError):
+        return None
+    if x1 <= x0 or y1 <= y0:
+        return None
+    left, top, right, bottom = tile_box
+    width, height = right - left, bottom - top
+    return (
+        round(left + x0 * width),
+        round(top + y0 * height),
+        round(left + x1 * width),
+        round(top + y1 * height)
+    )
+
+
+def _overlap_ratio(a: tuple, b: tuple) -> float:
+    """交集面积占较小框面积的比例 (被分块切开的病害只有一部分重叠)"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller if smaller else 0.0
+
+
+def _is_duplicate(a: TileDamage, b: TileDamage, min_overlap: float) -> bool:
+    """重叠区内同一病害被相邻两个分块各识别一次"""
+    if a.damage["type"] != b.damage["type"] or a.tile is b.tile:
+        return False
+    if abs(a.tile.row - b.tile.row) > 1 or abs(a.tile.col - b.tile.col) > 1:
+        return False
+    if a.box is not None and b.box is not None:
+        return _overlap_ratio(a.box, b.box) >= min_overlap
+    # 没有坐标时只合并严重程度与尺寸都相同的
+    return a.damage["severity"] == b.damage["severity"] \
+        and a.damage["size"].strip() == b.damage["size"].strip()
+
+
+def _union(a: Optional[tuple], b: Optional[tuple]) -> Optional[tuple]:
+    if a is None or b is None:
+        return a or b
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def _max_level(levels, order: List[str]) -> Optional[str]:
+    ranked = [order.index(level) for level in levels if level in order]
+    return order[max(ranked)] if ranked else None
+
+
+def merge_tile_damages(found: List[TileDamage], min_overlap: float = None) -> List[dict]:
+    """
+    合并各分块的病害并去重
+
+    相邻分块中同类型且位置重叠的病害视为同一个，保留置信度较高的条目，
+    严重程度取较高者、位置取两者外接框。location 追加分块编号和原图像素范围。
+    """
+    min_overlap = min_overlap if min_overlap is not None else settings.TILE_MERGE_OVERLAP
+    merged: List[Tuple[TileDamage, List[TileDamage]]] = []
+    for item in sorted(found, key=lambda d: -d.damage.get("confidence", 0.0)):
+        for kept, members in merged:
+            # 只与保留条目比较，避免沿相邻分块链式合并
+            if _is_duplicate(item, kept, min_overlap):
+                members.append(item)
+                kept.box = _union(kept.box, item.box)
+                break
+        else:
+            merged.append((TileDamage(item.tile, dict(item.damage), item.box), [item]))
+
+    damages = []
+    for kept, members in merged:
+        damage = kept.damage
+        severity = _max_level((m.damage["severity"] for m in members), SEVERITY_LEVELS)
+        if severity:
+            damage["severity"] = severity
+        labels = "/".join(sorted({m.tile.label for m in members}))
+        box = kept.box or kept.tile.box
+        damage["location"] = (
+            f"{damage['location']} (分块 {labels}, 原图像素 "
+            f"{box[0]},{box[1]}-{box[2]},{box[3]})"
+        )
+        damages.append(damage)
+    return damages
+
+
+def merge_tile_results(
+    plan: TilePlan,
+    found: List[TileDamage],
+    risk_levels: List[str],
+    failed: int
+) -> dict:
+    """
+    汇总分块识别结果
+
+    Returns:
+        与整图识别相同结构的结果，附带 "tiling" 分块信息；
+        有分块识别失败时带 "partial": True
+    """
+    damages = merge_tile_damages(found)
+    risk_level = _max_level(risk_levels, RISK_LEVELS) or ("低" if not damages else "未知")
+    inferred = len(plan.tiles) - failed
+
+    if damages:
+        summary = f"分块识别 {inferred} 块，发现 {len(damages)} 处病害"
+    else:
+        summary = f"分块识别 {inferred} 块，未发现病害"
+    if failed:
+        summary += f" ({failed} 块识别失败)"
+
+    result = {
+        "damages": damages,
+        "riskLevel": risk_level,
+        "summary": summary,
+        "tiling": {
+            "image_size": list(plan.size),
+            "grid": list(plan.grid),
+            "inferred": inferred,
+            "skipped": plan.skipped,
+            "failed": failed
+        }
+    }
+    if failed:
+        result["partial"] = True
+    return result
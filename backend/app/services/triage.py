@@ -0,0 +1,284 @@
+import asyncio
+import io
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = "off"
+MODE_SHADOW = "shadow"  # 只计算并与模型结果对比，不跳过推理
+MODE_ON = "on"
+
+# 启发式特征的满分参考值：边缘密度、暗细线比例达到该值时得分为 1
+EDGE_DENSITY_REF = 0.02
+DARK_LINE_REF = 0.01
+
+# 启发式分析的图片长边
+HEURISTIC_EDGE = 256
+
+# ImageNet 归一化参数
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+@dataclass
+class TriageDecision:
+    """预筛结果"""
+    score: float  # 存在病害的可能性 0~1
+    clean: bool  # 得分低于阈值，判定为无病害
+    backend: str
+    elapsed_ms: float
+    skip: bool = False  # 跳过模型推理 (clean 且未被抽中复核)
+    features: dict = field(default_factory=dict)
+
+
+class EdgeTextureTriage:
+    """
+    边缘/纹理启发式
+
+    取画面下部的路面区域缩小为灰度图，计算两个特征：
+    - 边缘密度：Sobel 梯度幅值超过阈值的像素比例 (坑槽边缘、网裂)
+    - 暗细线比例：比局部均值暗出一定幅度的像素比例 (裂缝)
+    两者分别按参考值归一化后取较大者作为病害得分。
+    """
+
+    name = "edge"
+
+    def __init__(self, roi_top: float = None):
+        self.roi_top = roi_top if roi_top is not None else settings.TRIAGE_ROI_TOP
+
+    def score(self, image_bytes: bytes) -> tuple:
+        """
+        Returns:
+            (得分, 特征字典)
+        """
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("L", (HEURISTIC_EDGE * 2, HEURISTIC_EDGE * 2))
+            gray = img.convert("L")
+        gray.thumbnail((HEURISTIC_EDGE, HEURISTIC_EDGE))
+        top = int(gray.height * self.roi_top)
+        road = gray.crop((0, top, gray.width, gray.height))
+
+        pixels = np.asarray(road, dtype=np.float32)
+        gx = np.zeros_like(pixels)
+        gy = np.zeros_like(pixels)
+        gx[1:-1, 1:-1] = (
+            pixels[:-2, 2:] + 2 * pixels[1:-1, 2:] + pixels[2:, 2:]
+            - pixels[:-2, :-2] - 2 * pixels[1:-1, :-2] - pixels[2:, :-2]
+        )
+        gy[1:-1, 1:-1] = (
+            pixels[2:, :-2] + 2 * pixels[2:, 1:-1] + pixels[2:, 2:]
+            - pixels[:-2, :-2] - 2 * pixels[:-2, 1:-1] - pixels[:-2, 2:]
+        )
+        magnitude = np.hypot(gx, gy)
+        edge_density = float((magnitude > 160).mean())
+
+        local_mean = np.asarray(road.filter(ImageFilter.BoxBlur(4)), dtype=np.float32)
+        dark_ratio = float((local_mean - pixels > 25).mean())
+
+        score = min(1.0, max(edge_density / EDGE_DENSITY_REF, dark_ratio / DARK_LINE_REF))
+        return score, {
+            "edge_density": round(edge_density, 4),
+            "dark_ratio": round(dark_ratio, 4)
+        }
+
+
+class OnnxTriageClassifier:
+    """
+    ONNX 二分类模型 (无病害/有病害)
+
+    输入 NCHW float32 (ImageNet 归一化)，输出单个 logit 或两类 logits，
+    取有病害的概率作为得分。
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, input_size: int = None, threads: int = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or settings.TRIAGE_THREADS
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_size = input_size or settings.TRIAGE_INPUT_SIZE
+
+    def score(self, image_bytes: bytes) -> tuple:
+        size = self.input_size
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.draft("RGB", (size * 2, size * 2))
+            array = np.asarray(
+                img.convert("RGB").resize((size, size), Image.BILINEAR), dtype=np.float32
+            ) / 255.0
+        array = ((array - IMAGENET_MEAN) / IMAGENET_STD).transpose(2, 0, 1)[None]
+        logits = self.session.run(None, {self.input_name: array})[0].reshape(-1)
+
+        if logits.size == 1:
+            score = 1.0 / (1.0 + np.exp(-logits[0]))
+        else:
+            exp = np.exp(logits - logits.max())
+            score = exp[1] / exp.sum()
+        return float(score), {}
+
+
+class TriageService:
+    """
+    推理前预筛
+
+    巡检画面大多是完好路面。TRIAGE_MODE=on 时得分低于 TRIAGE_CLEAN_THRESHOLD
+    的图片直接返回 "无病害"，不调用 Ollama；其中按 TRIAGE_AUDIT_RATE 抽样的
+    图片仍走模型，用于估计预筛漏检率。shadow 模式只计算得分并与每次模型
+    结果对比，用于上线前校准阈值。
+
+    预筛后端可插拔：edge 为边缘/纹理启发式，onnx 为 CPU 上的轻量二分类模型
+    (未安装 onnxruntime 或缺少模型文件时退回 edge)。
+    """
+
+    def __init__(self, classifier=None):
+        self.mode = settings.TRIAGE_MODE.lower()
+        self.threshold = settings.TRIAGE_CLEAN_THRESHOLD
+        self.audit_rate = settings.TRIAGE_AUDIT_RATE
+        self.classifier = classifier or self._load_classifier()
+
+        # 累计统计
+        self.evaluated = 0
+        self.predicted_clean = 0
+        self.skipped = 0
+        self.total_elapsed_ms = 0.0
+        # 与模型结果对比 (以模型为准)
+        self.agree_clean = 0
+        self.agree_damage = 0
+        self.missed = 0  # 预筛判无病害，模型发现病害
+        self.false_alarms = 0  # 预筛判有病害，模型未发现
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in (MODE_SHADOW, MODE_ON)
+
+    def _load_classifier(self):
+        if settings.TRIAGE_BACKEND.lower() == "onnx":
+            model_path = settings.TRIAGE_MODEL_PATH
+            try:
+                if not Path(model_path).exists():
+                    raise FileNotFoundError(model_path)
+                classifier = OnnxTriageClassifier(model_path)
+                logger.info(f"预筛模型已加载: {model_path}")
+                return classifier
+            except Exception as e:
+                logger.warning(f"预筛模型不可用，退回边缘/纹理启发式: {str(e)}")
+        return EdgeTextureTriage()
+
+    async def evaluate(self, image_bytes: bytes) -> Optional[TriageDecision]:
+        """
+        计算预筛结果
+
+        Returns:
+            预筛结果，未启用或图片无法解码时返回 None
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        try:
+            score, features = await asyncio.to_thread(self.classifier.score, image_bytes)
+        except Exception as e:
+            logger.warning(f"预筛失败: {str(e)}")
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        clean = score < self.threshold
+        decision = TriageDecision(
+            score=round(score, 4),
+            clean=clean,
+            backend=self.classifier.name,
+            elapsed_ms=round(elapsed_ms, 2),
+            features=features
+        )
+        # 判为无病害的图片按比例抽样复核，其余直接跳过推理
+        decision.skip = (
+            self.mode == MODE_ON and clean and random.random() >= self.audit_rate
+        )
+
+        self.evaluated += 1
+        self.total_elapsed_ms += elapsed_ms
+        if clean:
+            self.predicted_clean += 1
+        if decision.skip:
+            self.skipped += 1
+        return decision
+
+    def clean_result(self, decision: TriageDecision) -> dict:
+        """跳过推理时返回的识别结果"""
+        return {
+            "damages": [],
+            "riskLevel": "低",
+            "summary": "无病害",
+            "triage": {
+                "backend": decision.backend,
+                "score": decision.score,
+                "threshold": self.threshold
+            }
+        }
+
+    def audit(self, decision: Optional[TriageDecision], ai_result: dict):
+        """记录预筛与模型结果是否一致 (模型输出无法解析时不计)"""
+        if decision is None or decision.skip or ai_result.get("error"):
+            return
+
+        model_clean = not ai_result.get("damages")
+        if decision.clean and model_clean:
+            self.agree_clean += 1
+        elif decision.clean:
+            self.missed += 1
+            logger.info(
+                f"预筛漏检: 得分 {decision.score} < {self.threshold}, "
+                f"模型发现 {len(ai_result['damages'])} 处病害"
+            )
+        elif model_clean:
+            self.false_alarms += 1
+        else:
+            self.agree_damage += 1
+
+    def stats(self) -> dict:
+        """预筛累计统计"""
+        audited = self.agree_clean + self.agree_damage + self.missed + self.false_alarms
+        audited_clean = self.agree_clean + self.missed
+        return {
+            "mode": self.mode,
+            "backend": self.classifier.name,
+            "threshold": self.threshold,
+            "audit_rate": self.audit_rate,
+            "evaluated": self.evaluated,
+            "predicted_clean": self.predicted_clean,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / self.evaluated, 4) if self.evaluated else 0.0,
+            "avg_elapsed_ms": round(
+                self.total_elapsed_ms / self.evaluated, 2
+            ) if self.evaluated else 0.0,
+            "audit": {
+                "audited": audited,
+                "agree_clean": self.agree_clean,
+                "agree_damage": self.agree_damage,
+                "missed": self.missed,
+                "false_alarms": self.false_alarms,
+                "disagreement_rate": round(
+                    (self.missed + self.false_alarms) / audited, 4
+                ) if audited else 0.0,
+                # 判为无病害的图片中模型实际发现病害的比例
+                "miss_rate": round(
+                    self.missed / audited_clean, 4
+                ) if audited_clean else 0.0
+            }
+        }
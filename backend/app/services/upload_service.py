@@ -0,0 +1,129 @@
+import hashlib
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.core.metrics import stage, timed
+from app.services.file_store import FileStore, SpoolFile
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制"""
+
+
+class UnsupportedImageError(Exception):
+    """文件内容不是支持的图片格式"""
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """根据文件头魔数识别图片类型，不依赖客户端声明的 content_type"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"BM"):
+        return "image/bmp"
+    return None
+
+
+# 识别图片类型所需的文件头长度
+HEADER_SIZE = 12
+
+
+@dataclass
+class IngestedUpload:
+    """已接收并校验的上传图片"""
+    size: int
+    sha256: str
+    mime: str
+    spool: Optional[SpoolFile] = None
+    content: Optional[bytes] = None  # 未落盘时的文件内容
+
+    async def read(self) -> bytes:
+        """文件内容，已落盘时从临时文件读回"""
+        if self.spool is not None:
+            return await self.spool.read()
+        return self.content
+
+    async def save_as(self, image_id: str) -> str:
+        """将落盘的临时文件重命名为正式图片文件"""
+        with stage("save_image"):
+            return await self.spool.commit(f"{image_id}.jpg")
+
+    async def discard(self):
+        if self.spool is not None:
+            await self.spool.discard()
+
+
+@timed("upload_read")
+async def ingest_upload(
+    file: UploadFile,
+    file_store: FileStore = None,
+    max_size: int = None
+) -> IngestedUpload:
+    """
+    分块读取上传图片
+
+    边读边校验大小、识别文件头、计算哈希；提供 file_store 时写入临时文件，
+    内存中只保留文件头，需要内容时再通过 read() 读回；否则在内存中累积。
+    超限或格式不符时立即中止并清理。
+
+    Args:
+        file: 上传文件
+        file_store: 文件存储，为 None 时不落盘
+        max_size: 最大字节数，默认 MAX_FILE_SIZE
+
+    Raises:
+        UploadTooLargeError: 文件超过大小限制
+        UnsupportedImageError: 文件不是支持的图片格式
+    """
+    max_size = max_size or settings.MAX_FILE_SIZE
+    spool = await file_store.spool() if file_store is not None else None
+
+    memory = io.BytesIO() if spool is None else None
+    header = b""
+    size = 0
+    digest = hashlib.sha256()
+    mime = None
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(f"文件超过 {max_size} 字节限制")
+
+            if mime is None:
+                header += chunk[:HEADER_SIZE - len(header)]
+                if len(header) >= HEADER_SIZE:
+                    mime = sniff_image_type(header)
+                    if mime is None:
+                        raise UnsupportedImageError("只支持 JPEG/PNG/WebP/BMP 图片")
+
+            digest.update(chunk)
+            if spool is not None:
+                await spool.write(chunk)
+            else:
+                memory.write(chunk)
+
+        if mime is None:
+            raise UnsupportedImageError("只支持 JPEG/PNG/WebP/BMP 图片")
+    except BaseException:
+        if spool is not None:
+            await spool.discard()
+        raise
+
+    return IngestedUpload(
+        size=size,
+        sha256=digest.hexdigest(),
+        mime=mime,
+        spool=spool,
+        content=memory.getvalue() if memory is not None else None
+    )
@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from chromadb import HttpClient
+
+from app.core.config import settings
+
+# HNSW 索引扫描只返回约 ef_search 个候选，分页深度受此上限 (pgvector 允许的最大值) 约束
+HNSW_MAX_EF_SEARCH = 1000
+
+
+class VectorStoreError(Exception):
+    """向量库访问失败或超时"""
+
+
+@dataclass
+class VectorItem:
+    """待写入的向量记录"""
+    id: str
+    document: str
+    metadata: dict = field(default_factory=dict)
+    embedding: Optional[List[float]] = None
+
+
+@dataclass(frozen=True)
+class SimilarityFilter:
+    """相似查询的元数据过滤条件，由向量库在查询时下推执行"""
+    damage_type: Optional[str] = None
+    severity: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+def hash_embedding(text: str, dim: int = None) -> List[float]:
+    """
+    文本特征哈希向量
+
+    将字符二元组哈希到固定维度并归一化，
+    用于后端需要显式向量而调用方未提供时的兜底。
+    """
+    dim = dim or settings.EMBEDDING_DIM
+    vector = [0.0] * dim
+    for i in range(len(text) - 1):
+        digest = hashlib.md5(text[i:i + 2].encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def image_vectors_enabled() -> bool:
+    """是否写入本地图像编码器生成的向量 (否则使用向量库的文本向量)"""
+    return settings.EMBEDDING_BACKEND.lower() == "onnx"
+
+
+def chroma_collection_name() -> str:
+    """
+    Chroma collection 名称
+
+    图像向量 (EMBEDDING_DIM 维) 与 Chroma 默认文本向量 (384 维) 维度不同，
+    不能写入同一个 collection：图像向量使用带编码方式和维度后缀的 collection，
+    文本向量沿用 CHROMA_COLLECTION。
+    """
+    if image_vectors_enabled():
+        return f"{settings.CHROMA_COLLECTION}_image{settings.EMBEDDING_DIM}"
+    return settings.CHROMA_COLLECTION
+
+
+class VectorStore:
+    """
+    向量库接口
+
+    find_similar 返回按相似度排序的字典列表 (不含查询记录本身)，至少包含 id 与 distance。
+    joins_details 为 True 的实现直接返回 damages 表的完整行，
+    调用方无需再回表查询。
+    """
+
+    joins_details = False
+
+    async def init(self):
+        """建立连接 (启动时预热)"""
+        pass
+
+    async def add(self, items: List[VectorItem]):
+        raise NotImplementedError
+
+    async def find_similar(
+        self,
+        damage_id: str,
+        limit: int,
+        offset: int = 0,
+        filters: SimilarityFilter = None
+    ) -> List[dict]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    ChromaDB 异步适配器
+
+    chromadb 的 HttpClient 是同步客户端，所有调用放到专用线程池执行，
+    复用同一个客户端 (及其 HTTP 连接)。每次调用有超时，并用信号量限制
+    同时进行中的请求数，向量库变慢时不会拖住事件循环或耗尽线程。
+    """
+
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        collection_name: str = None,
+        timeout: float = None,
+        max_in_flight: int = None
+    ):
+        self.host = host or settings.CHROMA_HOST
+        self.port = port or settings.CHROMA_PORT
+        self.collection_name = collection_name or chroma_collection_name()
+        self.image_vectors = image_vectors_enabled()
+        self.timeout = timeout or settings.VECTOR_TIMEOUT
+        self.max_in_flight = max_in_flight or settings.CHROMA_MAX_IN_FLIGHT
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight,
+            thread_name_prefix="chroma"
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._init_lock = asyncio.Lock()
+        self.client = None
+        self.collection = None
+
+    async def init(self):
+        """建立连接并获取 collection (只执行一次)"""
+        if self.collection is not None:
+            return
+        async with self._init_lock:
+            if self.collection is None:
+                self.collection = await self._call(self._connect)
+
+    def _connect(self):
+        self.client = HttpClient(host=self.host, port=self.port)
+        return self.client.get_or_create_collection(name=self.collection_name)
+
+    async def add(self, items: List[VectorItem]):
+        """
+        写入向量记录
+
+        图像向量模式下逐条使用图像向量，个别图片编码失败时以同维度的文本哈希向量
+        补位，整批维度一致；文本向量模式下由 Chroma 对文档编码。
+        """
+        if not items:
+            return
+        await self.init()
+
+        kwargs = {
+            "ids": [item.id for item in items],
+            "documents": [item.document for item in items],
+            "metadatas": [item.metadata for item in items]
+        }
+        if self.image_vectors:
+            kwargs["embeddings"] = [
+                item.embedding if item.embedding is not None
+                else hash_embedding(item.document)
+                for item in items
+            ]
+        await self._call(self.collection.add, **kwargs)
+
+    async def find_similar(
+        self,
+        damage_id: str,
+        limit: int,
+        offset: int = 0,
+        filters: SimilarityFilter = None
+    ) -> List[dict]:
+        """查找相似记录 ID"""
+        await self.init()
+
+        # 直接使用已存储的向量查询，无需重新编码
+        result = await self._call(
+            self.collection.get, ids=[damage_id], include=["embeddings"]
+        )
+        if result["embeddings"] is None or len(result["embeddings"]) == 0:
+            return []
+
+        # Chroma 不支持 offset，多取 offset 条后截掉
+        similar = await self._call(
+            self.collection.query,
+            query_embeddings=[result["embeddings"][0]],
+            n_results=offset + limit,
+            where=self._build_where(damage_id, filters)
+        )
+        return [
+            {"id": id, "distance": distance}
+            for id, distance in zip(similar["ids"][0], similar["distances"][0])
+        ][offset:offset + limit]
+
+    @staticmethod
+    def _build_where(damage_id: str, filters: Optional[SimilarityFilter]) -> dict:
+        """构造元数据过滤条件 (时间按 created_ts 数值比较)"""
+        conditions = [{"damage_id": {"$ne": damage_id}}]
+        if filters is not None:
+            if filters.damage_type:
+                conditions.append({"type": filters.damage_type})
+            if filters.severity:
+                conditions.append({"severity": filters.severity})
+            if filters.start:
+                conditions.append({"created_ts": {"$gte": filters.start.timestamp()}})
+            if filters.end:
+                conditions.append({"created_ts": {"$lt": filters.end.timestamp()}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    async def close(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _call(self, func, *args, **kwargs):
+        """在线程池中执行同步调用，带超时与并发限制"""
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self._executor, lambda: func(*args, **kwargs)
+                    ),
+                    timeout=self.timeout
+                )
+        except asyncio.TimeoutError:
+            raise VectorStoreError(f"向量库请求超时 ({self.timeout}s)")
+        except VectorStoreError:
+            raise
+        except Exception as e:
+            raise VectorStoreError(f"向量库请求失败: {str(e)}")
+
+
+class PgVectorStore(VectorStore):
+    """
+    pgvector 向量库
+
+    向量写入 damage_vectors 表，与 damages 行同库存放。
+    相似查询走 HNSW 索引，并在同一条 SQL 中关联 damages 取回详情。
+    """
+
+    joins_details = True
+
+    def __init__(self, get_pool, timeout: float = None):
+        """
+        Args:
+            get_pool: 返回 asyncpg 连接池的协程函数
+        """
+        self._get_pool = get_pool
+        self.timeout = timeout or settings.VECTOR_TIMEOUT
+
+    @staticmethod
+    def _to_vector(embedding: List[float]) -> str:
+        return "[" + ",".join(f"{v:.6g}" for v in embedding) + "]"
+
+    async def add(self, items: List[VectorItem]):
+        """写入向量记录，未提供向量时使用文本哈希向量"""
+        if not items:
+            return
+        pool = await self._get_pool()
+
+        rows = [
+            (
+                item.id,
+                self._to_vector(
+                    item.embedding if item.embedding is not None
+                    else hash_embedding(item.document)
+                ),
+                json.dumps(item.metadata, ensure_ascii=False)
+            )
+            for item in items
+        ]
+        try:
+            async with pool.acquire() as conn:
+                await conn.executemany("""
+                    INSERT INTO damage_vectors (damage_id, embedding, metadata)
+                    VALUES ($1, $2::vector, $3)
+                    ON CONFLICT (damage_id) DO UPDATE
+                    SET embedding = EXCLUDED.embedding,
+                        metadata = EXCLUDED.metadata
+                """, rows, timeout=self.timeout)
+        except Exception as e:
+            raise VectorStoreError(f"向量库请求失败: {str(e)}")
+
+    async def find_similar(
+        self,
+        damage_id: str,
+        limit: int,
+        offset: int = 0,
+        filters: SimilarityFilter = None
+    ) -> List[dict]:
+        """
+        查找相似病害，直接返回 damages 详情
+
+        HNSW 索引扫描只产出 hnsw.ef_search 个候选，查询前按 offset + limit
+        (加上被排除的查询记录本身) 在事务内调大 (最多 HNSW_MAX_EF_SEARCH)，
+        深分页不会返回不足一页。
+        附加过滤条件在候选之后执行，过滤较严时结果仍可能少于 limit。
+        """
+        pool = await self._get_pool()
+        ef_search = min(max(40, offset + limit + 1), HNSW_MAX_EF_SEARCH)
+
+        # 查询向量作为标量子查询只计算一次，排序表达式可走 HNSW 索引
+        query_vector = "(SELECT embedding FROM damage_vectors WHERE damage_id = $1)"
+        conditions = ["v.damage_id <> $1", f"{query_vector} IS NOT NULL"]
+        params = [damage_id, limit, offset]
+        if filters is not None:
+            for column, op, value in (
+                ("d.damage_type", "=", filters.damage_type),
+                ("d.severity", "=", filters.severity),
+                ("d.created_at", ">=", filters.start),
+                ("d.created_at", "<", filters.end),
+            ):
+                if value:
+                    params.append(value)
+                    conditions.append(f"{column} {op} ${len(params)}")
+
+        try:
+            async with pool.acquire() as conn, conn.transaction():
+                await conn.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+                records = await conn.fetch(f"""
+                    SELECT d.*, v.embedding <=> {query_vector} AS distance
+                    FROM damage_vectors v
+                    JOIN damages d ON d.id = v.damage_id
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY v.embedding <=> {query_vector}
+                    LIMIT $2 OFFSET $3
+                """, *params, timeout=self.timeout)
+        except Exception as e:
+            raise VectorStoreError(f"向量库请求失败: {str(e)}")
+
+        return [dict(r) for r in records]
+
+
+def create_vector_store(storage_service) -> VectorStore:
+    """按配置创建向量库实现"""
+    backend = settings.VECTOR_BACKEND.lower()
+    if backend == "pgvector":
+        return PgVectorStore(storage_service.get_pool)
+    if backend == "chroma":
+        return ChromaVectorStore()
+    raise ValueError(f"不支持的向量库类型: {settings.VECTOR_BACKEND}")
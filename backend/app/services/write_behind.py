@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import timed
+from app.schemas.damage import DamageCreate
+
+logger = logging.getLogger(__name__)
+
+STAGE_DATABASE = "database"
+STAGE_VECTOR = "vector"
+
+
+@dataclass
+class PendingWrite:
+    """待写入的识别结果"""
+    record: DamageCreate
+    image_bytes: Optional[bytes] = None  # 为空时从 image_path 读取
+    stage: str = STAGE_DATABASE  # database: 记录与向量都未写入; vector: 只差向量
+    settled: bool = False  # 已写完或已转入死信
+
+
+class WriteBehindWriter:
+    """
+    识别结果后写
+
+    接口在识别完成后立即返回，数据库记录与图像向量由后台 worker 写入：
+    有界队列缓冲 (满时提交方等待，形成背压)，按批合并为一条多行 INSERT
+    和一次向量库 add。写入失败带退避重试，整批仍失败时拆成单条定位坏记录，
+    最终失败的条目追加到死信文件，下次启动时重放。
+
+    提供近似重复索引时，记录写入数据库后才 resolve 对应条目 (之后的重复帧
+    才会复用该记录ID)，记录未能入库时作废条目。
+    """
+
+    def __init__(self, storage_service, dead_letter_path: str = None, dedup=None):
+        self.storage = storage_service
+        self.dedup = dedup
+        self.enabled = settings.WRITE_BEHIND_ENABLED
+        self.batch_size = settings.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = settings.WRITE_BEHIND_FLUSH_MS / 1000
+        self.max_attempts = settings.WRITE_BEHIND_MAX_ATTEMPTS
+        self.dead_letter_path = Path(dead_letter_path or settings.DEAD_LETTER_PATH)
+
+        self._queue = asyncio.Queue(maxsize=settings.WRITE_BEHIND_MAX_PENDING)
+        self._task = None
+        self._written = 0
+        self._retries = 0
+        self._dead_lettered = 0
+        self._batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """启动后台 worker 并重放死信"""
+        if not self.enabled or self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        await self._replay_dead_letters()
+        logger.info("识别结果后写已启动")
+
+    async def stop(self):
+        """写完队列中的剩余条目后停止，超时未写完的转入死信"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), settings.WRITE_BEHIND_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("后写队列未在超时内写完, 未写入的条目转入死信")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if remaining:
+            await self._dead_letter(remaining, "进程关闭时未写入")
+
+    @timed("write_submit")
+    async def submit(self, record: DamageCreate, image_bytes: bytes = None):
+        """
+        提交识别结果
+
+        后写未启用时直接同步写入；队列已满时等待空位。
+        """
+        if record.created_at is None:
+            record.created_at = datetime.now()
+
+        if not self.running:
+            try:
+                await self.storage.save_detection(record)
+            except BaseException:
+                self._dropped([record])
+                raise
+            self._persisted([record])
+            await self.storage.save_embedding(record.id, image_bytes, record.ai_result)
+            return
+
+        await self._queue.put(PendingWrite(record=record, image_bytes=image_bytes))
+
+    async def submit_vector(self, record: DamageCreate, image_bytes: bytes = None):
+        """
+        提交只差图像向量的记录 (数据库记录已由调用方写入)
+
+        与 submit 共用重试与死信；后写未启用时直接写入，失败只记录日志。
+        """
+        if not self.running:
+            try:
+                await self.storage.save_embedding(record.id, image_bytes, record.ai_result)
+            except Exception as e:
+                logger.error(f"记录 {record.id} 向量写入失败: {str(e)}")
+            return
+
+        await self._queue.put(
+            PendingWrite(record=record, image_bytes=image_bytes, stage=STAGE_VECTOR)
+        )
+
+    async def flush(self):
+        """等待已提交的条目全部处理完"""
+        if self.running:
+            await self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "written": self._written,
+            "batches": self._batches,
+            "retries": self._retries,
+            "dead_lettered": self._dead_lettered
+        }
+
+    async def _run(self):
+        """worker 主循环：凑批后写入"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._write(batch)
+            except asyncio.CancelledError:
+                # 关闭时排空超时被取消，已取出未处理完的条目转入死信 (按已完成的阶段重放)
+                unsettled = [item for item in batch if not item.settled]
+                if unsettled:
+                    await self._dead_letter(unsettled, "进程关闭时未写入")
+                raise
+            except Exception as e:
+                logger.error(f"后写批次异常: {str(e)}")
+                # 已写完或已转入死信的条目不再重复处理
+                unsettled = [item for item in batch if not item.settled]
+                if unsettled:
+                    await self._dead_letter(unsettled, str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[PendingWrite]):
+        """写入一批：先数据库记录，成功后再写向量"""
+        self._batches += 1
+
+        to_insert = [item for item in batch if item.stage == STAGE_DATABASE]
+        saved = [item for item in batch if item.stage == STAGE_VECTOR]
+        if to_insert:
+            saved += await self._write_stage(
+                to_insert, self._insert_records, STAGE_DATABASE
+            )
+
+        for item in saved:
+            item.stage = STAGE_VECTOR
+        if saved:
+            indexed = await self._write_stage(saved, self._index_vectors, STAGE_VECTOR)
+            self._written += len(indexed)
+            for item in indexed:
+                item.settled = True
+
+    async def _write_stage(self, items: List[PendingWrite], write, stage: str) -> list:
+        """
+        带重试地写入一个阶段
+
+        Returns:
+            写入成功的条目
+        """
+        error = await self._with_retry(write, items)
+        if error is None:
+            return items
+
+        # 整批失败时逐条重试一次，只把坏记录转入死信
+        if len(items) == 1:
+            await self._dead_letter(items, f"{stage}: {error}")
+            return []
+
+        succeeded = []
+        for item in items:
+            try:
+                await write([item])
+                succeeded.append(item)
+            except Exception as e:
+                await self._dead_letter([item], f"{stage}: {str(e)}")
+        return succeeded
+
+    async def _with_retry(self, write, items: List[PendingWrite]) -> Optional[str]:
+        """重试写入，成功返回 None，否则返回最后一次的错误信息"""
+        error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._retries += 1
+                backoff = settings.WRITE_BEHIND_RETRY_BACKOFF * (2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, backoff))
+            try:
+                await write(items)
+                return None
+            except Exception as e:
+                error = str(e)
+                logger.warning(
+                    f"后写第 {attempt + 1} 次失败 ({len(items)} 条): {error}"
+                )
+        return error
+
+    async def _insert_records(self, items: List[PendingWrite]):
+        await self.storage.save_detections([item.record for item in items])
+        self._persisted([item.record for item in items])
+
+    async def _index_vectors(self, items: List[PendingWrite]):
+        for item in items:
+            if item.image_bytes is None:
+                item.image_bytes = await self.storage.load_image(item.record.image_path)
+        await self.storage.save_embeddings([
+            (item.record.id, item.image_bytes, item.record.ai_result)
+            for item in items
+        ])
+
+    async def _dead_letter(self, items: List[PendingWrite], error: str):
+        """追加到死信文件 (图片已落盘，只记录元数据)"""
+        failed_at = datetime.now().isoformat()
+        lines = [
+            json.dumps({
+                **item.record.model_dump(mode="json"),
+                "stage": item.stage,
+                "error": error,
+                "failed_at": failed_at
+            }, ensure_ascii=False) + "\n"
+            for item in items
+        ]
+        try:
+            await asyncio.to_thread(self._append_lines, lines)
+            for item in items:
+                item.settled = True
+            self._dead_lettered += len(items)
+            logger.error(f"{len(items)} 条识别结果写入失败, 已转入死信: {error}")
+        except Exception as e:
+            logger.error(f"写入死信失败, 丢弃 {len(items)} 条: {str(e)}")
+        finally:
+            # 记录未入库，重复帧不能复用其ID
+            self._dropped([item.record for item in items if item.stage == STAGE_DATABASE])
+
+    def _persisted(self, records: List[DamageCreate]):
+        if self.dedup is not None:
+            for record in records:
+                self.dedup.resolve(record.id, record.ai_result)
+
+    def _dropped(self, records: List[DamageCreate]):
+        if self.dedup is not None:
+            for record in records:
+                self.dedup.discard(record.id)
+
+    def _append_lines(self, lines: List[str]):
+        self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def _replay_dead_letters(self):
+        """启动时重新提交死信中的条目"""
+        replay_path = self.dead_letter_path.with_name(self.dead_letter_path.name + ".replay")
+        try:
+            if self.dead_letter_path.exists():
+                await asyncio.to_thread(self.dead_letter_path.replace, replay_path)
+            if not replay_path.exists():
+                return
+            content = await asyncio.to_thread(replay_path.read_text, "utf-8")
+        except OSError as e:
+            logger.error(f"读取死信失败: {str(e)}")
+            return
+
+        count = 0
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                record = DamageCreate.model_validate({
+                    name: entry[name]
+                    for name in DamageCreate.model_fields
+                    if name in entry
+                })
+            except ValueError as e:
+                logger.warning(f"跳过无法解析的死信: {str(e)}")
+                continue
+            stage = entry.get("stage", STAGE_DATABASE)
+            await self._queue.put(PendingWrite(record=record, stage=stage))
+            count += 1
+
+        await asyncio.to_thread(replay_path.unlink, True)
+        if count:
+            logger.info(f"重放 {count} 条死信")
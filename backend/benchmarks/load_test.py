@@ -0,0 +1,553 @@
+"""
+离线压测
+
+不依赖 GPU 和外网，在本机启动整套服务做吞吐与延迟回归：
+- 模拟 Ollama：本地 HTTP 服务实现 /api/chat (流式 NDJSON)，延迟、并行槽位、
+  输出内容与失败率可配置，应用经真实的 ChatOllama 客户端访问
+- 进程内 Chroma：chromadb.EphemeralClient，文档向量使用本地文本哈希向量，
+  不下载编码模型；也可用 --vector pgvector
+- Postgres：--database-url 指定已有库 (会写入数据，请使用测试库)，
+  未指定时用 pgserver 在临时目录启动一个实例
+
+应用经 uvicorn 在本机端口上运行，多个并发 worker 按权重混合请求
+/api/detect、/api/similar、/api/feedback、/api/stats，结束后输出各接口的
+p50/p95/p99 延迟、吞吐，以及服务内部各阶段的耗时分布，写入 JSON 文件。
+
+用法 (在 backend 目录下):
+    python -m benchmarks.load_test --duration 30 --concurrency 16
+    python -m benchmarks.load_test --requests 500 --mix detect=1 --output detect.json
+    python -m benchmarks.load_test --database-url postgresql://postgres@localhost/bench
+"""
+
+import argparse
+import asyncio
+import functools
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_OLLAMA_RESULT = {
+    "damages": [{
+        "type": "坑槽",
+        "severity": "中等",
+        "location": "右侧车道中部",
+        "size": "40x30x6",
+        "suggestAction": "铣刨后热补",
+        "confidence": 0.87
+    }],
+    "riskLevel": "中",
+    "summary": "右侧车道存在中等坑槽"
+}
+
+CLEAN_OLLAMA_RESULT = {"damages": [], "riskLevel": "低", "summary": "路面完好"}
+
+ENDPOINTS = ("detect", "similar", "feedback", "stats")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """线性插值分位数 (输入已排序)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+def summarize(samples: list, elapsed: float = None) -> dict:
+    """延迟样本 (秒) 汇总为毫秒统计"""
+    values = sorted(samples)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(len(values) / elapsed, 2)
+    return summary
+
+
+# ---------------------------------------------------------------- 模拟 Ollama
+
+class FakeOllama:
+    """
+    模拟 Ollama 服务
+
+    /api/chat 先等待 latency ± jitter 毫秒 (最多 slots 个请求同时"推理")，
+    再把结果 JSON 分成若干片段按流式 NDJSON 返回。
+    """
+
+    def __init__(self, args):
+        self.latency = args.ollama_latency_ms / 1000
+        self.jitter = args.ollama_jitter_ms / 1000
+        self.error_rate = args.ollama_error_rate
+        self.damage_rate = args.damage_rate
+        self.chunks = args.ollama_chunks
+        self.slots = asyncio.Semaphore(args.ollama_slots)
+        self.result = DEFAULT_OLLAMA_RESULT
+        if args.ollama_output:
+            with open(args.ollama_output, encoding="utf-8") as f:
+                self.result = json.load(f)
+        self.requests = 0
+        self.errors = 0
+        self.service_times = []
+
+    def build_app(self):
+        from fastapi import FastAPI
+        from fastapi.responses import JSONResponse, StreamingResponse
+
+        app = FastAPI()
+
+        @app.get("/api/version")
+        async def version():
+            return {"version": "0.0.0-fake"}
+
+        @app.post("/api/chat")
+        async def chat(body: dict):
+            self.requests += 1
+            start = time.perf_counter()
+            async with self.slots:
+                await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+            self.service_times.append(time.perf_counter() - start)
+
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return JSONResponse({"error": "模拟推理失败"}, status_code=500)
+
+            result = self.result if random.random() < self.damage_rate else CLEAN_OLLAMA_RESULT
+            content = "```json\n" + json.dumps(result, ensure_ascii=False) + "\n```"
+            model = body.get("model", "fake")
+
+            if not body.get("stream", True):
+                return self._message(model, content, done=True)
+
+            async def stream():
+                size = max(1, len(content) // self.chunks)
+                for i in range(0, len(content), size):
+                    yield json.dumps(
+                        self._message(model, content[i:i + size], done=False),
+                        ensure_ascii=False
+                    ) + "\n"
+                    await asyncio.sleep(0)
+                yield json.dumps(self._message(model, "", done=True)) + "\n"
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        return app
+
+    @staticmethod
+    def _message(model: str, content: str, done: bool) -> dict:
+        message = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": content},
+            "done": done
+        }
+        if done:
+            message.update({
+                "done_reason": "stop",
+                "total_duration": 0,
+                "eval_count": 0,
+                "prompt_eval_count": 0
+            })
+        return message
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "service_time": summarize(self.service_times)
+        }
+
+
+# ---------------------------------------------------------------- 进程内 Chroma
+
+def in_process_chroma_store():
+    """ChromaVectorStore 改用进程内客户端，文档向量用本地文本哈希"""
+    import chromadb
+    from chromadb.api.types import EmbeddingFunction
+
+    from app.services.vector_store import ChromaVectorStore, hash_embedding
+
+    class HashEmbeddingFunction(EmbeddingFunction):
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            return [hash_embedding(text) for text in input]
+
+    class InProcessChromaStore(ChromaVectorStore):
+        def _connect(self):
+            self.client = chromadb.EphemeralClient()
+            return self.client.get_or_create_collection(
+                name=self.collection_name,
+                embedding_function=HashEmbeddingFunction()
+            )
+
+    return InProcessChromaStore()
+
+
+# ---------------------------------------------------------------- 阶段耗时
+
+class StageRecorder:
+    """
+    包装服务实例的方法，记录服务内部各阶段耗时
+
+    只替换本进程中容器实例上的属性，不修改应用代码。
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, obj, attr: str):
+        original = getattr(obj, attr)
+
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+
+        setattr(obj, attr, timed)
+
+    def instrument(self, services):
+        detection = services.detection
+        storage = services.storage
+        self.wrap("dedup_fingerprint", services.dedup, "fingerprint")
+        self.wrap("triage", detection.triage, "evaluate")
+        self.wrap("preprocess", detection.preprocessor, "process")
+        self.wrap("inference", detection.llm, "ainvoke")
+        self.wrap("detect_total", detection, "detect")
+        self.wrap("write_behind_submit", services.writer, "submit")
+        self.wrap("db_write", storage, "save_detections")
+        self.wrap("embedding", storage.embedding_service, "embed_many")
+        self.wrap("vector_write", storage.vector_store, "add")
+        self.wrap("similar_query", storage, "find_similar")
+        self.wrap("correction_write", storage, "save_correction")
+        self.wrap("stats_query", services.stats, "get_statistics")
+
+    def report(self) -> dict:
+        return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+# ---------------------------------------------------------------- 负载
+
+class Workload:
+    """按权重混合请求的闭环负载"""
+
+    def __init__(self, client, args, images: list):
+        self.client = client
+        self.args = args
+        self.images = images
+        self.mix = args.mix
+        self.latencies = defaultdict(list)
+        self.status_counts = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.detected = []  # (完成时间, 记录ID)
+        self._image_index = 0
+        self._issued = 0
+
+    def _pick_endpoint(self) -> str:
+        names = list(self.mix)
+        endpoint = random.choices(names, weights=[self.mix[n] for n in names])[0]
+        # 后写有短暂延迟，相似查询与反馈只使用已写入一段时间的记录
+        if endpoint in ("similar", "feedback") and not self._settled_id():
+            return "detect" if "detect" in self.mix else "stats"
+        return endpoint
+
+    def _settled_id(self):
+        cutoff = time.monotonic() - self.args.settle_seconds
+        settled = [damage_id for done_at, damage_id in self.detected if done_at <= cutoff]
+        return random.choice(settled) if settled else None
+
+    def _next_image(self) -> bytes:
+        image = self.images[self._image_index % len(self.images)]
+        self._image_index += 1
+        return image
+
+    async def _request(self, endpoint: str):
+        if endpoint == "detect":
+            files = {"file": ("frame.jpg", self._next_image(), "image/jpeg")}
+            return await self.client.post("/api/detect", files=files)
+        if endpoint == "similar":
+            return await self.client.get(f"/api/similar/{self._settled_id()}")
+        if endpoint == "feedback":
+            return await self.client.post("/api/feedback", json={
+                "damage_id": self._settled_id(),
+                "corrected": {"type": random.choice(["坑槽", "裂缝", "网裂"])}
+            })
+        return await self.client.get("/api/stats")
+
+    async def run_one(self, record: bool):
+        endpoint = self._pick_endpoint()
+        start = time.perf_counter()
+        try:
+            response = await self._request(endpoint)
+        except Exception as e:
+            if record:
+                self.errors[endpoint] += 1
+                self.status_counts[endpoint][type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - start
+
+        if endpoint == "detect" and response.status_code == 200:
+            self.detected.append((time.monotonic(), response.json()["id"]))
+        if not record:
+            return
+        self.latencies[endpoint].append(elapsed)
+        self.status_counts[endpoint][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+
+    async def run(self) -> float:
+        """预热后执行负载，返回计时阶段的耗时 (秒)"""
+        for _ in range(self.args.warmup):
+            await self.run_one(record=False)
+
+        deadline = time.monotonic() + self.args.duration if self.args.duration else None
+
+        async def worker():
+            while True:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                if self.args.requests and self._issued >= self.args.requests:
+                    return
+                self._issued += 1
+                await self.run_one(record=True)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint in self.mix:
+            summary = summarize(self.latencies[endpoint], elapsed)
+            summary["errors"] = self.errors[endpoint]
+            summary["status"] = dict(self.status_counts[endpoint])
+            endpoints[endpoint] = summary
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        overall = summarize(all_latencies, elapsed)
+        overall["errors"] = sum(self.errors.values())
+        return {"overall": overall, "endpoints": endpoints}
+
+
+def make_frames(count: int, width: int, height: int, seed: int) -> list:
+    """生成互不相同的合成路面帧 (避免命中结果缓存与近似重复抑制)"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        coarse = rng.normal(110, 30, (height // 16 + 1, width // 16 + 1)).clip(0, 255)
+        image = Image.fromarray(coarse.astype(np.uint8)).resize((width, height))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+# ---------------------------------------------------------------- 启动
+
+def configure_environment(args, workdir: str, ollama_url: str):
+    """在导入应用前设置配置 (Settings 在导入时读取环境变量)"""
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "OLLAMA_BASE_URL": ollama_url,
+        "OLLAMA_BASE_URLS": ollama_url,
+        "VECTOR_BACKEND": args.vector,
+        "CHROMA_COLLECTION": f"bench-{int(time.time())}",
+        "EMBEDDING_BACKEND": "none",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "DEAD_LETTER_PATH": os.path.join(workdir, "dead_letter.jsonl"),
+        "RESULT_CACHE_PERSISTENT": "false",
+    })
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        os.environ[key] = value
+
+
+async def serve(app, port: int):
+    """在当前事件循环中启动 uvicorn，返回 (server, task)"""
+    import uvicorn
+
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"
+    )
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("服务启动失败")
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def main(args):
+    import httpx
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="road-bench-")
+    postgres = None
+    if not args.database_url:
+        try:
+            import pgserver
+        except ImportError:
+            sys.exit("未指定 --database-url，且未安装 pgserver (pip install pgserver)")
+        postgres = pgserver.get_server(os.path.join(workdir, "pgdata"), cleanup_mode="delete")
+        args.database_url = postgres.get_uri()
+
+    fake_ollama = FakeOllama(args)
+    ollama_port = free_port()
+    ollama_server, ollama_task = await serve(fake_ollama.build_app(), ollama_port)
+    configure_environment(args, workdir, f"http://127.0.0.1:{ollama_port}")
+
+    from app.main import app
+    from app.services.container import ServiceContainer
+
+    recorder = StageRecorder()
+
+    @asynccontextmanager
+    async def bench_lifespan(app_):
+        # 与 app.main.lifespan 相同，只是在启动前替换向量库
+        services = ServiceContainer()
+        if args.vector == "chroma":
+            services.storage.vector_store = in_process_chroma_store()
+        await services.start()
+        recorder.instrument(services)
+        app_.state.services = services
+        yield
+        await services.stop()
+
+    app.router.lifespan_context = bench_lifespan
+
+    app_port = free_port()
+    app_server, app_task = await serve(app, app_port)
+    print(f"服务已启动: app :{app_port}, 模拟 Ollama :{ollama_port}, 数据库 {args.database_url}")
+
+    images = make_frames(args.images, args.width, args.height, args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", timeout=args.timeout, limits=limits
+        ) as client:
+            workload = Workload(client, args, images)
+            elapsed = await workload.run()
+            app_stats = {}
+            for name in ("cache", "dedup", "triage", "persistence", "preprocess"):
+                response = await client.get(f"/api/{name}/stats")
+                if response.status_code == 200:
+                    app_stats[name] = response.json()
+    finally:
+        app_server.should_exit = True
+        await app_task
+        ollama_server.should_exit = True
+        await ollama_task
+        if postgres is not None:
+            postgres.cleanup()
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("database_url",)
+        },
+        "elapsed_s": round(elapsed, 3),
+        **workload.report(elapsed),
+        "stages": recorder.report(),
+        "fake_ollama": fake_ollama.stats(),
+        "app_stats": app_stats
+    }
+
+    overall = report["overall"]
+    print(
+        f"{overall['count']} 个请求, {elapsed:.1f}s, {overall['throughput_rps']} req/s, "
+        f"p50 {overall['p50_ms']}ms, p95 {overall['p95_ms']}ms, p99 {overall['p99_ms']}ms, "
+        f"错误 {overall['errors']}"
+    )
+    for endpoint, summary in report["endpoints"].items():
+        print(
+            f"  {endpoint:<9} n={summary['count']:<5} p50 {summary['p50_ms']}ms "
+            f"p95 {summary['p95_ms']}ms p99 {summary['p99_ms']}ms 错误 {summary['errors']}"
+        )
+    for stage, summary in report["stages"].items():
+        print(f"  [{stage}] n={summary['count']} p50 {summary['p50_ms']}ms "
+              f"p95 {summary['p95_ms']}ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"未知接口: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="离线压测")
+    parser.add_argument("--duration", type=float, default=20.0,
+                        help="计时阶段时长 (秒)，为 0 时只按 --requests 计数")
+    parser.add_argument("--requests", type=int, default=0, help="计时阶段的请求总数上限")
+    parser.add_argument("--warmup", type=int, default=10, help="预热请求数 (不计入结果)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("detect=4,similar=2,feedback=1,stats=2"),
+                        help="请求权重，如 detect=4,similar=2,feedback=1,stats=2")
+    parser.add_argument("--settle-seconds", type=float, default=0.5,
+                        help="识别完成多久后的记录才用于相似查询与反馈")
+    parser.add_argument("--images", type=int, default=200, help="合成帧数量，用完后循环")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时 (秒)")
+    parser.add_argument("--database-url", help="Postgres 地址，未指定时用 pgserver 临时实例")
+    parser.add_argument("--vector", choices=("chroma", "pgvector"), default="chroma")
+    parser.add_argument("--ollama-latency-ms", type=float, default=800.0)
+    parser.add_argument("--ollama-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--ollama-slots", type=int, default=4, help="模拟 Ollama 并行推理数")
+    parser.add_argument("--ollama-chunks", type=int, default=8, help="流式输出分片数")
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-output", help="模拟输出的 JSON 文件")
+    parser.add_argument("--damage-rate", type=float, default=0.7,
+                        help="模拟输出中含病害的比例，其余返回无病害")
+    parser.add_argument("--env", action="append", default=[],
+                        help="额外的应用配置，如 --env TRIAGE_MODE=off (可重复)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_report.json")
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error("--duration 与 --requests 至少指定一个")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
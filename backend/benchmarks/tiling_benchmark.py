@@ -0,0 +1,189 @@
+"""
+分块识别吞吐基准
+
+对比同一批高分辨率图片整图识别与分块识别的耗时和吞吐。默认使用模拟模型
+(按收到的像素量计算延迟，并限制服务端并行槽位)，不依赖 Ollama；
+加 --ollama 时调用配置中的真实推理节点。
+
+用法 (在 backend 目录下):
+    python -m benchmarks.tiling_benchmark
+    python -m benchmarks.tiling_benchmark --images 8 --width 8192 --height 2048
+    python -m benchmarks.tiling_benchmark --ollama --images 2
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.services.cache_service import ResultCache
+from app.services.detection_service import DetectionService
+from app.services.tiling import ImageTiler
+
+
+class FakeReply:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeVisionModel:
+    """
+    模拟视觉模型
+
+    延迟 = 固定开销 + 每百万像素耗时 × 收到的像素量，同时最多处理
+    slots 个请求 (与 Ollama 的 OLLAMA_NUM_PARALLEL 对应)。
+    """
+
+    def __init__(self, base_ms: float, per_mpix_ms: float, slots: int):
+        self.base_ms = base_ms
+        self.per_mpix_ms = per_mpix_ms
+        self._slots = asyncio.Semaphore(slots)
+        self.calls = 0
+        self.pixels = 0
+
+    async def ainvoke(self, messages):
+        text_part, image_part = messages[0].content
+        prompt = text_part["text"]
+        data_url = image_part["image_url"]
+        image_bytes = base64.b64decode(data_url.split(",", 1)[1])
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            width, height = img.size
+
+        async with self._slots:
+            self.calls += 1
+            self.pixels += width * height
+            delay = self.base_ms + self.per_mpix_ms * width * height / 1e6
+            await asyncio.sleep(delay / 1000)
+
+        damages = []
+        if random.random() < 0.3:
+            damage = {
+                "type": "裂缝",
+                "severity": "中等",
+                "location": "路面中部",
+                "size": "120x0.5x1",
+                "suggestAction": "灌缝处理",
+                "confidence": round(random.uniform(0.6, 0.95), 2)
+            }
+            if "bbox" in prompt:
+                damage["bbox"] = [0.2, 0.3, 0.6, 0.5]
+            damages.append(damage)
+        return FakeReply(json.dumps({
+            "damages": damages,
+            "riskLevel": "中" if damages else "低",
+            "summary": "模拟结果"
+        }, ensure_ascii=False))
+
+
+def make_road_image(width: int, height: int, blank_ratio: float, seed: int) -> bytes:
+    """生成带纹理的合成路面图，上方 blank_ratio 比例为均匀区域 (模拟天空/黑边)"""
+    rng = np.random.default_rng(seed)
+    texture = rng.normal(110, 25, (height // 8 + 1, width // 8 + 1)).clip(0, 255)
+    image = Image.fromarray(texture.astype(np.uint8)).resize((width, height))
+    pixels = np.asarray(image).copy()
+    pixels[: int(height * blank_ratio)] = 200
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def run_mode(service: DetectionService, images: list, concurrency: int) -> dict:
+    """以给定并发识别全部图片，返回耗时统计"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    damages = 0
+
+    async def one(image_bytes):
+        nonlocal damages
+        async with semaphore:
+            start = time.perf_counter()
+            result = await service.detect(image_bytes)
+            latencies.append(time.perf_counter() - start)
+            damages += len(result.get("damages", []))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(image) for image in images))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "images": len(images),
+        "elapsed_s": round(elapsed, 3),
+        "images_per_s": round(len(images) / elapsed, 3),
+        "latency_p50_s": round(statistics.median(latencies), 3),
+        "latency_max_s": round(latencies[-1], 3),
+        "damages": damages
+    }
+
+
+def build_service(tiling: bool, args) -> DetectionService:
+    service = DetectionService(
+        cache=ResultCache(max_size=0, persistent=False),
+        tiler=ImageTiler(
+            tile_size=args.tile_size,
+            overlap=args.overlap,
+            enabled=tiling
+        )
+    )
+    if not args.ollama:
+        service.llm = FakeVisionModel(args.base_ms, args.per_mpix_ms, args.slots)
+    return service
+
+
+async def main(args):
+    random.seed(args.seed)
+    images = [
+        make_road_image(args.width, args.height, args.blank_ratio, args.seed + i)
+        for i in range(args.images)
+    ]
+    print(f"{len(images)} 张 {args.width}x{args.height} 图片, "
+          f"平均 {sum(map(len, images)) / len(images) / 1e6:.1f} MB")
+
+    report = {}
+    for mode, tiling in (("whole", False), ("tiled", True)):
+        service = build_service(tiling, args)
+        result = await run_mode(service, images, args.concurrency)
+        if not args.ollama:
+            result["model_calls"] = service.llm.calls
+            result["model_mpix"] = round(service.llm.pixels / 1e6, 1)
+        if tiling:
+            result["tiling"] = service.tiler.stats()
+        report[mode] = result
+        print(f"[{mode}] {json.dumps(result, ensure_ascii=False)}")
+
+    whole, tiled = report["whole"], report["tiled"]
+    print(f"分块/整图 耗时比: {tiled['elapsed_s'] / whole['elapsed_s']:.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="分块识别吞吐基准")
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--width", type=int, default=8192)
+    parser.add_argument("--height", type=int, default=2048)
+    parser.add_argument("--blank-ratio", type=float, default=0.5,
+                        help="图片上方均匀区域比例，用于验证空白分块跳过")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时识别的图片数")
+    parser.add_argument("--tile-size", type=int, default=None)
+    parser.add_argument("--overlap", type=int, default=None)
+    parser.add_argument("--ollama", action="store_true", help="使用真实推理节点")
+    parser.add_argument("--base-ms", type=float, default=300.0, help="模拟模型固定开销")
+    parser.add_argument("--per-mpix-ms", type=float, default=800.0,
+                        help="模拟模型每百万像素耗时")
+    parser.add_argument("--slots", type=int, default=4, help="模拟模型并行槽位")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
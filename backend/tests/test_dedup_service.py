@@ -0,0 +1,245 @@
+"""
+近似重复帧索引测试
+
+在 backend 目录下运行: python -m pytest tests
+"""
+
+import asyncio
+import io
+import random
+import time
+
+import pytest
+from PIL import Image
+
+from app.services.dedup_service import (
+    BKTree,
+    HashEntry,
+    NearDuplicateIndex,
+    hamming,
+    to_signed,
+    to_unsigned,
+)
+
+
+def make_entry(damage_id: str, value: int, created: float = None) -> HashEntry:
+    return HashEntry(
+        damage_id=damage_id,
+        hash=value,
+        created=created if created is not None else time.time(),
+        result=None
+    )
+
+
+def make_index(**overrides) -> NearDuplicateIndex:
+    index = NearDuplicateIndex(storage_service=None)
+    index.enabled = True
+    index.max_distance = 4
+    index.window = 60
+    index.max_entries = 1000
+    for name, value in overrides.items():
+        setattr(index, name, value)
+    return index
+
+
+def jpeg(color, size=(320, 240)) -> bytes:
+    image = Image.new("RGB", size, color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+# 哈希工具
+
+def test_hamming():
+    assert hamming(0b1011, 0b1011) == 0
+    assert hamming(0b1011, 0b0010) == 2
+    assert hamming(0, (1 << 64) - 1) == 64
+
+
+def test_signed_roundtrip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert to_unsigned(signed) == value
+
+
+# BK 树
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(1)
+    base = [rng.getrandbits(64) for _ in range(50)]
+    # 每个基准哈希附近再生成几个翻转了少量位的哈希
+    values = base + [
+        value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+        for value in base for _ in range(4)
+    ]
+    tree = BKTree()
+    entries = [make_entry(str(i), value) for i, value in enumerate(values)]
+    for entry in entries:
+        tree.add(entry)
+    assert tree.size == len(entries)
+
+    for query in values[:30] + [rng.getrandbits(64) for _ in range(10)]:
+        for max_distance in (0, 2, 6):
+            found = {(d, e.damage_id) for d, e in tree.search(query, max_distance)}
+            expected = {
+                (hamming(query, e.hash), e.damage_id)
+                for e in entries if hamming(query, e.hash) <= max_distance
+            }
+            assert found == expected
+
+
+def test_bktree_empty():
+    assert BKTree().search(123, 10) == []
+
+
+# 感知哈希
+
+def test_fingerprint_same_image_same_hash():
+    index = make_index()
+    first = asyncio.run(index.fingerprint(jpeg((120, 100, 90))))
+    resized = asyncio.run(index.fingerprint(jpeg((120, 100, 90), (640, 480))))
+    assert first is not None
+    assert hamming(first, resized) <= index.max_distance
+
+
+def test_fingerprint_invalid_image():
+    index = make_index()
+    assert asyncio.run(index.fingerprint(b"not an image")) is None
+
+
+def test_fingerprint_disabled():
+    index = make_index(enabled=False)
+    assert asyncio.run(index.fingerprint(jpeg((1, 2, 3)))) is None
+
+
+# acquire / claim / resolve / discard
+
+def test_acquire_registers_miss_then_hits():
+    async def run():
+        index = make_index()
+        assert index.acquire(0b1111, "a") is None
+        entry = index.acquire(0b0111, "b")
+        assert entry.damage_id == "a"
+        assert index.acquire((1 << 40) - 1, "c") is None
+        assert (index.hits, index.misses) == (1, 2)
+
+    asyncio.run(run())
+
+
+def test_acquire_without_hash():
+    async def run():
+        index = make_index()
+        assert index.acquire(None, "a") is None
+        assert index.stats()["entries"] == 0
+
+    asyncio.run(run())
+
+
+def test_acquire_ignores_expired_entries():
+    async def run():
+        index = make_index(window=10)
+        assert index.acquire(42, "old") is None
+        index._entries["old"].created -= 11
+        assert index.acquire(42, "new") is None
+
+    asyncio.run(run())
+
+
+def test_claim_waits_for_resolve():
+    async def run():
+        index = make_index()
+        assert await index.claim(7, "owner") is None
+
+        waiter = asyncio.create_task(index.claim(7, "dup"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        index.resolve("owner", {"riskLevel": "高"})
+        entry = await waiter
+        assert entry.damage_id == "owner"
+        assert entry.result.result() == {"riskLevel": "高"}
+
+    asyncio.run(run())
+
+
+def test_claim_after_discard_registers_new_entry():
+    async def run():
+        index = make_index()
+        assert await index.claim(7, "owner") is None
+
+        waiter = asyncio.create_task(index.claim(7, "dup"))
+        await asyncio.sleep(0)
+        index.discard("owner")
+
+        # 原识别失败，等待者登记自己的条目并自行识别
+        assert await waiter is None
+        assert "owner" not in index._entries
+        assert "dup" in index._entries
+
+        third = asyncio.create_task(index.claim(7, "third"))
+        await asyncio.sleep(0)
+        index.resolve("dup", {"riskLevel": "低"})
+        assert (await third).damage_id == "dup"
+
+    asyncio.run(run())
+
+
+def test_claim_times_out_on_stuck_owner():
+    async def run():
+        index = make_index(wait_timeout=0.05)
+        assert await index.claim(7, "owner") is None
+
+        # 原请求既不 resolve 也不 discard
+        assert await index.claim(7, "dup") is None
+        assert "dup" in index._entries
+        assert (index.hits, index.misses) == (0, 2)
+
+        # 之后的重复帧等待最新登记的条目
+        later = asyncio.create_task(index.claim(7, "later"))
+        await asyncio.sleep(0)
+        index.resolve("dup", {"riskLevel": "中"})
+        assert (await later).damage_id == "dup"
+
+    asyncio.run(run())
+
+
+def test_resolve_and_discard_unknown_ids_are_ignored():
+    async def run():
+        index = make_index()
+        index.resolve("missing", {})
+        index.discard("missing")
+        assert index.acquire(1, "a") is None
+        index.resolve("a", {"riskLevel": "低"})
+        # 已完成的条目不会被再次 resolve 覆盖
+        index.resolve("a", {"riskLevel": "高"})
+        assert index._entries["a"].result.result() == {"riskLevel": "低"}
+
+    asyncio.run(run())
+
+
+def test_rebuild_drops_discarded_and_caps_entries():
+    async def run():
+        index = make_index(max_entries=5, max_distance=0)
+        for i in range(8):
+            assert index.acquire(1 << i, str(i)) is None
+        index.discard("7")
+        index._rebuild()
+        assert len(index._entries) <= 5
+        assert "7" not in index._entries
+        assert index.acquire(1 << 7, "again") is None
+
+    asyncio.run(run())
+
+
+def test_stats():
+    async def run():
+        index = make_index()
+        index.acquire(3, "a")
+        index.acquire(3, "b")
+        stats = index.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == pytest.approx(0.5)
+
+    asyncio.run(run())
@@ -0,0 +1,274 @@
+"""
+推理客户端熔断与重试测试
+
+在 backend 目录下运行: python -m pytest tests
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services.ollama_client import (
+    CircuitBreaker,
+    InferenceError,
+    InferenceTimeoutError,
+    InferenceUnavailableError,
+    OllamaClientPool,
+)
+
+
+class FakeLLM:
+    """按顺序返回或抛出预设结果的模型替身"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def ainvoke(self, messages):
+        outcome = self._next()
+        if outcome == "hang":
+            await asyncio.sleep(3600)
+        return outcome
+
+    async def astream(self, messages):
+        outcome = self._next()
+        for part in outcome.split(" "):
+            yield SimpleNamespace(content=part)
+
+
+class BrokenStreamLLM:
+    """输出一个分块后连接断开"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def astream(self, messages):
+        self.calls += 1
+        yield SimpleNamespace(content="部分")
+        raise httpx.ReadError("connection reset")
+
+
+def cool_down(breaker: CircuitBreaker):
+    """让熔断器的冷却期立即结束"""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def make_pool(monkeypatch, *llms, max_retries=2) -> OllamaClientPool:
+    monkeypatch.setattr(settings, "OLLAMA_RETRY_BACKOFF", 0.0)
+    pool = OllamaClientPool([f"http://node{i}" for i in range(len(llms))])
+    pool.max_retries = max_retries
+    pool.timeout = 0.05
+    for endpoint, llm in zip(pool.endpoints, llms):
+        endpoint.llm = llm
+        endpoint.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    return pool
+
+
+# 熔断器状态转换
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_admits_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    cool_down(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    # 探测进行中，其余请求仍被拒绝
+    assert not breaker.allow()
+
+
+def test_breaker_probe_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    cool_down(breaker)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_probe_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    cool_down(breaker)
+    assert breaker.allow()
+    breaker.record_failure()
+    # 重新计时冷却期
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_release_probe_allows_next_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    cool_down(breaker)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+# 客户端池重试
+
+def test_ainvoke_fails_over_to_other_node(monkeypatch):
+    first = FakeLLM(httpx.ConnectError("refused"))
+    second = FakeLLM("结果")
+    pool = make_pool(monkeypatch, first, second)
+    assert asyncio.run(pool.ainvoke([])) == "结果"
+    assert (first.calls, second.calls) == (1, 1)
+    assert pool.endpoints[0].failures == 1
+    assert pool.endpoints[0].breaker.failures == 1
+    assert pool.endpoints[1].breaker.failures == 0
+
+
+def test_ainvoke_retry_exhaustion_raises_inference_error(monkeypatch):
+    llm = FakeLLM(*[httpx.ConnectError("refused")] * 5)
+    pool = make_pool(monkeypatch, llm, max_retries=2)
+    pool.endpoints[0].breaker.failure_threshold = 10
+    with pytest.raises(InferenceError) as info:
+        asyncio.run(pool.ainvoke([]))
+    assert type(info.value) is InferenceError
+    assert isinstance(info.value.__cause__, httpx.ConnectError)
+    assert llm.calls == 3
+    assert pool.endpoints[0].in_flight == 0
+
+
+def test_ainvoke_breaker_opens_during_retries(monkeypatch):
+    llm = FakeLLM(*[httpx.ConnectError("refused")] * 5)
+    pool = make_pool(monkeypatch, llm, max_retries=2)
+    # 只有一个节点：两次失败后熔断，第三次尝试直接被拒绝
+    with pytest.raises(InferenceUnavailableError):
+        asyncio.run(pool.ainvoke([]))
+    assert llm.calls == 2
+    assert pool.endpoints[0].breaker.state == "open"
+
+
+def test_ainvoke_retry_exhaustion_on_timeout(monkeypatch):
+    first = FakeLLM("hang", "hang")
+    second = FakeLLM("hang", "hang")
+    pool = make_pool(monkeypatch, first, second, max_retries=2)
+    with pytest.raises(InferenceTimeoutError):
+        asyncio.run(pool.ainvoke([]))
+    assert first.calls + second.calls == 3
+    assert all(endpoint.in_flight == 0 for endpoint in pool.endpoints)
+
+
+def test_ainvoke_non_transient_error_is_not_retried(monkeypatch):
+    llm = FakeLLM(*[ValueError("bad request")] * 3)
+    pool = make_pool(monkeypatch, llm)
+    for _ in range(3):
+        with pytest.raises(InferenceError):
+            asyncio.run(pool.ainvoke([]))
+    # 每次只调用一次，且不计入熔断
+    assert llm.calls == 3
+    assert pool.endpoints[0].breaker.state == "closed"
+    assert pool.endpoints[0].failures == 0
+
+
+def test_ainvoke_all_nodes_open(monkeypatch):
+    first, second = FakeLLM(), FakeLLM()
+    pool = make_pool(monkeypatch, first, second)
+    for endpoint in pool.endpoints:
+        endpoint.breaker.record_failure()
+        endpoint.breaker.record_failure()
+    with pytest.raises(InferenceUnavailableError):
+        asyncio.run(pool.ainvoke([]))
+    assert first.calls == second.calls == 0
+
+
+def test_ainvoke_half_open_probe_closes_breaker(monkeypatch):
+    llm = FakeLLM("恢复")
+    pool = make_pool(monkeypatch, llm)
+    breaker = pool.endpoints[0].breaker
+    breaker.record_failure()
+    breaker.record_failure()
+    cool_down(breaker)
+    assert asyncio.run(pool.ainvoke([])) == "恢复"
+    assert breaker.state == "closed"
+
+
+def test_ainvoke_cancelled_probe_is_released(monkeypatch):
+    async def run():
+        llm = FakeLLM("hang")
+        pool = make_pool(monkeypatch, llm)
+        pool.timeout = 60
+        breaker = pool.endpoints[0].breaker
+        breaker.record_failure()
+        breaker.record_failure()
+        cool_down(breaker)
+
+        task = asyncio.create_task(pool.ainvoke([]))
+        await asyncio.sleep(0.01)
+        assert not breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # 探测名额已释放，下一个请求可以继续探测
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+
+    asyncio.run(run())
+
+
+# 流式调用
+
+def collect(pool: OllamaClientPool) -> list:
+    async def run():
+        return [part async for part in pool.astream([])]
+
+    return asyncio.run(run())
+
+
+def test_astream_retries_before_first_chunk(monkeypatch):
+    first = FakeLLM(httpx.ConnectError("refused"))
+    second = FakeLLM("裂缝 轻度")
+    pool = make_pool(monkeypatch, first, second)
+    assert collect(pool) == ["裂缝", "轻度"]
+    assert pool.endpoints[0].breaker.failures == 1
+
+
+def test_astream_error_after_first_chunk_is_not_retried(monkeypatch):
+    llm = BrokenStreamLLM()
+    other = FakeLLM("不应调用")
+    pool = make_pool(monkeypatch, llm, other)
+    parts = []
+
+    async def run():
+        async for part in pool.astream([]):
+            parts.append(part)
+
+    with pytest.raises(InferenceError):
+        asyncio.run(run())
+    assert parts == ["部分"]
+    assert llm.calls == 1 and other.calls == 0
@@ -0,0 +1,202 @@
+"""
+模型输出解析测试
+
+在 backend 目录下运行: python -m pytest tests
+"""
+
+import json
+
+import pytest
+
+from app.services.result_parser import (
+    DamageStreamParser,
+    ResultParseError,
+    extract_json_object,
+    load_json_object,
+    parse_detection_result,
+    repair_json,
+)
+
+
+DAMAGE = {
+    "type": "坑槽",
+    "severity": "严重",
+    "location": "左侧车道",
+    "size": "30x20x6",
+    "suggestAction": "挖补修复",
+    "confidence": 0.9,
+}
+
+
+def make_output(damages=None, risk_level="高") -> str:
+    return json.dumps({
+        "damages": damages if damages is not None else [DAMAGE],
+        "riskLevel": risk_level,
+        "summary": "发现病害",
+    }, ensure_ascii=False)
+
+
+# extract_json_object
+
+def test_extract_skips_preamble_and_trailing_text():
+    text = f"好的，以下是分析结果：\n{make_output()}\n以上结果仅供参考。"
+    assert json.loads(extract_json_object(text)) == json.loads(make_output())
+
+
+def test_extract_from_markdown_code_block():
+    text = f"```json\n{make_output()}\n```"
+    assert json.loads(extract_json_object(text))["riskLevel"] == "高"
+
+
+def test_extract_ignores_braces_inside_strings():
+    text = '说明 {"summary": "位置 {左侧} 有 } 符号", "damages": []} 结尾 }'
+    assert json.loads(extract_json_object(text))["summary"] == "位置 {左侧} 有 } 符号"
+
+
+def test_extract_without_object_raises():
+    with pytest.raises(ResultParseError):
+        extract_json_object("图片中没有发现病害。")
+
+
+def test_extract_closes_truncated_object():
+    text = '{"damages": [{"type": "裂缝", "location": "中部'
+    data = json.loads(extract_json_object(text))
+    assert data["damages"][0]["location"] == "中部"
+
+
+# repair_json
+
+def test_repair_trailing_commas():
+    assert json.loads(repair_json('{"a": [1, 2, ], "b": 3, }')) == {"a": [1, 2], "b": 3}
+
+
+def test_repair_single_quotes():
+    assert json.loads(repair_json("{'type': '裂缝', 'note': 'say \"hi\"'}")) == {
+        "type": "裂缝",
+        "note": 'say "hi"',
+    }
+
+
+def test_repair_chinese_quotes():
+    assert json.loads(repair_json("{“type”: “坑槽”, ‘severity’: ‘严重’}")) == {
+        "type": "坑槽",
+        "severity": "严重",
+    }
+
+
+def test_repair_fullwidth_punctuation_outside_strings():
+    text = '｛"type"："裂缝"，"location"："路面中部，靠近路肩"｝'
+    assert json.loads(repair_json(text)) == {
+        "type": "裂缝",
+        # 字符串内的全角逗号保持不变
+        "location": "路面中部，靠近路肩",
+    }
+
+
+def test_repair_python_literals():
+    assert json.loads(repair_json('{"a": True, "b": False, "c": None}')) == {
+        "a": True,
+        "b": False,
+        "c": None,
+    }
+
+
+def test_load_json_object_combines_extract_and_repair():
+    text = "结果如下：{'damages': [], 'riskLevel': '低',} 谢谢"
+    assert load_json_object(text) == {"damages": [], "riskLevel": "低"}
+
+
+# parse_detection_result
+
+def test_parse_valid_output():
+    result = parse_detection_result(make_output())
+    assert result["damages"] == [DAMAGE]
+    assert result["riskLevel"] == "高"
+    assert "truncated" not in result
+
+
+def test_parse_drops_invalid_damage_items():
+    output = make_output([DAMAGE, {"type": "裂缝"}])
+    assert parse_detection_result(output)["damages"] == [DAMAGE]
+
+
+def test_parse_percentage_confidence():
+    output = make_output([{**DAMAGE, "confidence": "85%"}])
+    assert parse_detection_result(output)["damages"][0]["confidence"] == pytest.approx(0.85)
+
+
+def test_parse_truncated_output_keeps_complete_items():
+    output = make_output([DAMAGE, DAMAGE])
+    truncated = output[:output.rindex('"suggestAction"')]
+    result = parse_detection_result(truncated)
+    assert result["truncated"] is True
+    assert result["damages"] == [DAMAGE]
+
+
+def test_parse_output_without_damages_raises():
+    with pytest.raises(ResultParseError):
+        parse_detection_result('{"answer": "无法判断"}')
+
+
+def test_parse_non_json_output_raises():
+    with pytest.raises(ResultParseError):
+        parse_detection_result("抱歉，我无法分析这张图片。")
+
+
+# DamageStreamParser
+
+def feed_in_chunks(parser: DamageStreamParser, text: str, size: int) -> list:
+    """按固定长度切块喂入，记录每块产出的病害"""
+    emitted = []
+    for start in range(0, len(text), size):
+        emitted.append(parser.feed(text[start:start + size]))
+    return emitted
+
+
+def test_stream_emits_each_damage_once_when_closed():
+    second = {**DAMAGE, "type": "裂缝", "severity": "中等"}
+    output = "分析如下：" + make_output([DAMAGE, second])
+    parser = DamageStreamParser()
+    emitted = feed_in_chunks(parser, output, 7)
+
+    flat = [damage for batch in emitted for damage in batch]
+    assert flat == [DAMAGE, second]
+
+    # 第一条在第二条开始之前就已产出
+    first_at = next(i for i, batch in enumerate(emitted) if batch)
+    second_item_start = output.index('"裂缝"') // 7
+    assert first_at <= second_item_start
+
+
+def test_stream_single_character_chunks():
+    parser = DamageStreamParser()
+    flat = [d for batch in feed_in_chunks(parser, make_output(), 1) for d in batch]
+    assert flat == [DAMAGE]
+    assert parser.result()["damages"] == [DAMAGE]
+
+
+def test_stream_skips_invalid_items():
+    parser = DamageStreamParser()
+    output = make_output([{"type": "裂缝"}, DAMAGE])
+    flat = [d for batch in feed_in_chunks(parser, output, 5) for d in batch]
+    assert flat == [DAMAGE]
+
+
+def test_stream_ignores_objects_outside_damages():
+    output = json.dumps({
+        "meta": [{"type": "坑槽"}],
+        "damages": [DAMAGE],
+        "riskLevel": "高",
+    }, ensure_ascii=False)
+    parser = DamageStreamParser()
+    flat = [d for batch in feed_in_chunks(parser, output, 4) for d in batch]
+    assert flat == [DAMAGE]
+
+
+def test_stream_truncated_result():
+    output = make_output([DAMAGE, DAMAGE])
+    parser = DamageStreamParser()
+    feed_in_chunks(parser, output[:output.rindex('"suggestAction"')], 6)
+    result = parser.result()
+    assert result["truncated"] is True
+    assert result["damages"] == [DAMAGE]
@@ -0,0 +1,259 @@
+"""
+高分辨率图片分块测试
+
+在 backend 目录下运行: python -m pytest tests
+"""
+
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from app.services.tiling import (
+    ImageTiler,
+    Tile,
+    TileDamage,
+    TilePlan,
+    merge_tile_damages,
+    merge_tile_results,
+    parse_tile_result,
+)
+
+
+def make_tiler(**overrides) -> ImageTiler:
+    options = dict(
+        tile_size=1024, overlap=128, trigger_edge=3000, min_variance=25.0, enabled=True
+    )
+    options.update(overrides)
+    return ImageTiler(**options)
+
+
+def make_tile(row: int, col: int, box=(0, 0, 1024, 1024)) -> Tile:
+    return Tile(row, col, box, b"", 100.0)
+
+
+def make_damage(
+    tile: Tile,
+    box=None,
+    type_="裂缝",
+    severity="轻微",
+    size="长约 1m",
+    confidence=0.8,
+    action="灌缝"
+) -> TileDamage:
+    damage = {
+        "type": type_,
+        "severity": severity,
+        "location": "路面中部",
+        "size": size,
+        "suggestAction": action,
+        "confidence": confidence
+    }
+    return TileDamage(tile, damage, box)
+
+
+def noise_jpeg(size, blank_right: int = 0) -> bytes:
+    """随机纹理图片，右侧 blank_right 像素为纯灰色"""
+    rng = random.Random(3)
+    width, height = size
+    image = Image.frombytes("L", size, bytes(rng.randrange(256) for _ in range(width * height)))
+    if blank_right:
+        image.paste(128, (width - blank_right, 0, width, height))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+# 分块起点
+
+def test_axis_starts_smaller_than_one_tile():
+    tiler = make_tiler()
+    assert tiler.axis_starts(1) == [0]
+    assert tiler.axis_starts(500) == [0]
+    assert tiler.axis_starts(1024) == [0]
+
+
+def test_axis_starts_just_over_one_tile():
+    tiler = make_tiler()
+    # 两块几乎完全重叠，末块与边缘对齐
+    assert tiler.axis_starts(1025) == [0, 1]
+
+
+def test_axis_starts_edges_aligned():
+    tiler = make_tiler()
+    assert tiler.axis_starts(3000) == [0, 659, 1317, 1976]
+
+
+@pytest.mark.parametrize("tile_size,overlap", [(1024, 128), (512, 64), (1000, 0), (256, 255)])
+def test_axis_starts_cover_with_min_overlap(tile_size, overlap):
+    tiler = make_tiler(tile_size=tile_size, overlap=overlap)
+    step = tile_size - overlap
+    for length in list(range(tile_size - 2, tile_size + 3)) + [2 * step + overlap, 3000, 8191]:
+        starts = tiler.axis_starts(length)
+        assert starts[0] == 0
+        assert starts == sorted(set(starts))
+        # 末块右边缘与图片边缘对齐，不越界
+        assert min(starts[-1] + tile_size, length) == length
+        assert starts[-1] + tile_size <= max(length, tile_size)
+        # 相邻分块重叠不小于 overlap
+        for a, b in zip(starts, starts[1:]):
+            assert a + tile_size - b >= overlap, (length, starts)
+        # 少一块就无法在保证重叠的前提下覆盖
+        if len(starts) > 1:
+            assert (len(starts) - 1) * step + overlap < length
+
+
+def test_axis_starts_exact_fit_without_overlap():
+    tiler = make_tiler(tile_size=1000, overlap=0)
+    assert tiler.axis_starts(3000) == [0, 1000, 2000]
+
+
+def test_overlap_must_be_smaller_than_tile():
+    with pytest.raises(ValueError):
+        make_tiler(tile_size=512, overlap=512)
+
+
+# 切分
+
+def test_split_small_image_single_tile():
+    tiler = make_tiler()
+    plan = tiler.split_sync(noise_jpeg((300, 200)))
+    assert plan.size == (300, 200)
+    assert plan.grid == (1, 1)
+    assert plan.skipped == 0
+    assert [tile.box for tile in plan.tiles] == [(0, 0, 300, 200)]
+
+
+def test_split_covers_image_and_skips_blank_tiles():
+    tiler = make_tiler(tile_size=256, overlap=32)
+    width, height = 1000, 300
+    plan = tiler.split_sync(noise_jpeg((width, height), blank_right=300))
+    xs, ys = tiler.axis_starts(width), tiler.axis_starts(height)
+    assert plan.grid == (len(ys), len(xs))
+
+    # 最右一列完全落在空白区内被跳过
+    assert plan.skipped == len(ys)
+    assert len(plan.tiles) + plan.skipped == len(xs) * len(ys)
+    assert all(tile.box[2] <= width and tile.box[3] <= height for tile in plan.tiles)
+    assert max(tile.box[3] for tile in plan.tiles) == height
+
+    for tile in plan.tiles:
+        with Image.open(io.BytesIO(tile.image_bytes)) as img:
+            assert img.size == (tile.box[2] - tile.box[0], tile.box[3] - tile.box[1])
+
+
+# 分块结果解析
+
+def test_parse_tile_result_maps_bbox_to_image_pixels():
+    tile = make_tile(0, 1, (659, 0, 1683, 1024))
+    text = (
+        '{"damages": [{"type": "裂缝", "severity": "轻微", "location": "左侧", '
+        '"size": "1m", "suggestAction": "灌缝", "confidence": 0.9, '
+        '"bbox": [0.0, 0.5, 0.25, 1.5]}, '
+        '{"type": "坑槽", "severity": "中等", "location": "中部", "size": "0.5m", '
+        '"suggestAction": "修补", "bbox": [0.6, 0.2, 0.4, 0.3]}], "riskLevel": "中"}'
+    )
+    found, risk = parse_tile_result(text, tile)
+    assert risk == "中"
+    # 超出 0~1 的坐标被截断到分块范围内
+    assert found[0].box == (659, 512, 915, 1024)
+    # 左右颠倒的框无法使用
+    assert found[1].box is None
+
+
+# 跨分块合并
+
+def test_merge_duplicate_across_tile_boundary():
+    left = make_tile(0, 0, (0, 0, 1024, 1024))
+    right = make_tile(0, 1, (896, 0, 1920, 1024))
+    first = make_damage(left, (900, 100, 1024, 300), severity="轻微", confidence=0.9)
+    second = make_damage(
+        right, (896, 120, 1100, 320), severity="严重", confidence=0.7, action="铣刨重铺"
+    )
+
+    damages = merge_tile_damages([second, first], min_overlap=0.3)
+    assert len(damages) == 1
+    damage = damages[0]
+    # 保留置信度较高的条目，严重程度取较高者
+    assert damage["confidence"] == 0.9
+    assert damage["suggestAction"] == "灌缝"
+    assert damage["severity"] == "严重"
+    assert damage["location"] == "路面中部 (分块 r0c0/r0c1, 原图像素 896,100-1100,320)"
+    # 输入条目不被修改
+    assert first.damage["location"] == "路面中部"
+    assert first.box == (900, 100, 1024, 300)
+
+
+def test_merge_keeps_separate_damages():
+    left = make_tile(0, 0)
+    right = make_tile(0, 1, (896, 0, 1920, 1024))
+    far = make_tile(0, 3, (2688, 0, 3712, 1024))
+    found = [
+        # 类型不同
+        make_damage(left, (900, 100, 1000, 200), type_="裂缝"),
+        make_damage(right, (900, 100, 1000, 200), type_="坑槽"),
+        # 重叠太少
+        make_damage(left, (0, 500, 1000, 600), type_="龟裂"),
+        make_damage(right, (990, 590, 1500, 700), type_="龟裂"),
+        # 不相邻的分块 (坐标即使重叠也不合并)
+        make_damage(far, (0, 0, 100, 100), type_="车辙"),
+        make_damage(left, (0, 0, 100, 100), type_="车辙"),
+    ]
+    assert len(merge_tile_damages(found, min_overlap=0.3)) == 6
+
+
+def test_merge_same_tile_not_deduplicated():
+    tile = make_tile(0, 0)
+    found = [
+        make_damage(tile, (100, 100, 200, 200)),
+        make_damage(tile, (120, 120, 220, 220)),
+    ]
+    assert len(merge_tile_damages(found, min_overlap=0.3)) == 2
+
+
+def test_merge_without_boxes_requires_same_severity_and_size():
+    left = make_tile(0, 0)
+    below = make_tile(1, 0, (0, 896, 1024, 1920))
+    right = make_tile(0, 1, (896, 0, 1920, 1024))
+    found = [
+        make_damage(left, size="长约 1m ", confidence=0.9),
+        make_damage(below, size="长约 1m"),
+        make_damage(right, size="长约 3m"),
+    ]
+    damages = merge_tile_damages(found, min_overlap=0.3)
+    assert len(damages) == 2
+    # 没有坐标时使用保留条目所在分块的范围
+    assert damages[0]["location"] == "路面中部 (分块 r0c0/r1c0, 原图像素 0,0-1024,1024)"
+
+
+def test_merge_does_not_chain_across_tiles():
+    tiles = [make_tile(0, col, (col * 896, 0, col * 896 + 1024, 1024)) for col in range(3)]
+    # 一条长裂缝穿过三个分块，两两在重叠区相接
+    found = [
+        make_damage(tiles[0], (800, 100, 1024, 200), confidence=0.9),
+        make_damage(tiles[1], (896, 100, 1920, 200), confidence=0.8),
+        make_damage(tiles[2], (1792, 100, 2000, 200), confidence=0.7),
+    ]
+    damages = merge_tile_damages(found, min_overlap=0.3)
+    # r0c2 与保留的 r0c0 条目不相邻，不会经 r0c1 链式并入
+    assert len(damages) == 2
+    assert "r0c0/r0c1" in damages[0]["location"]
+    assert "分块 r0c2" in damages[1]["location"]
+
+
+def test_merge_tile_results_summary():
+    tile = make_tile(0, 0)
+    plan = TilePlan(size=(3000, 1024), grid=(1, 4), tiles=[tile] * 3, skipped=1)
+    found = [make_damage(tile, (0, 0, 10, 10))]
+
+    result = merge_tile_results(plan, found, ["低", "高", "未知"], failed=1)
+    assert result["riskLevel"] == "高"
+    assert result["partial"] is True
+    assert result["tiling"] == {
+        "image_size": [3000, 1024], "grid": [1, 4], "inferred": 2, "skipped": 1, "failed": 1
+    }
+
+    empty = merge_tile_results(plan, [], [], failed=0)
+    assert empty["riskLevel"] == "低"
+    assert "partial" not in empty
@@ -0,0 +1,102 @@
+"""
+pgvector 相似查询测试
+
+需要安装了 pgvector 扩展的 PostgreSQL，通过 TEST_DATABASE_URL 指定，未设置时跳过。
+测试在临时 schema 中建表，结束后删除。
+"""
+
+import asyncio
+import os
+import random
+import uuid
+
+import pytest
+
+from app.services.vector_store import PgVectorStore
+
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="未设置 TEST_DATABASE_URL")
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DIM = 512
+CANDIDATES = 300
+
+
+def random_vector(rng: random.Random) -> str:
+    return "[" + ",".join(f"{rng.uniform(-1, 1):.4f}" for _ in range(DIM)) + "]"
+
+
+async def with_store(check):
+    """在临时 schema 中准备候选向量 (强制走 HNSW 索引) 后执行 check(store)"""
+    schema = f"test_vectors_{uuid.uuid4().hex[:8]}"
+    admin = await asyncpg.connect(DATABASE_URL)
+    await admin.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    await admin.execute(f"CREATE SCHEMA {schema}")
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=1,
+        max_size=2,
+        server_settings={"search_path": f"{schema},public", "enable_seqscan": "off"}
+    )
+    try:
+        rng = random.Random(7)
+        async with pool.acquire() as conn:
+            await conn.execute(f"""
+                CREATE TABLE damages (
+                    id VARCHAR(36) PRIMARY KEY,
+                    damage_type VARCHAR(50),
+                    severity VARCHAR(20),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE TABLE damage_vectors (
+                    damage_id VARCHAR(36) PRIMARY KEY,
+                    embedding vector({DIM}),
+                    metadata JSONB
+                );
+            """)
+            await conn.executemany(
+                "INSERT INTO damages (id, damage_type) VALUES ($1, '坑槽')",
+                [(f"d{i}",) for i in range(CANDIDATES + 1)]
+            )
+            await conn.executemany(
+                "INSERT INTO damage_vectors (damage_id, embedding) VALUES ($1, $2::vector)",
+                [(f"d{i}", random_vector(rng)) for i in range(CANDIDATES + 1)]
+            )
+            await conn.execute("""
+                CREATE INDEX ON damage_vectors USING hnsw (embedding vector_cosine_ops)
+            """)
+
+        async def get_pool():
+            return pool
+
+        await check(PgVectorStore(get_pool))
+    finally:
+        await pool.close()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
+
+
+def test_find_similar_pages_past_default_ef_search():
+    """默认 ef_search (40) 之后的分页仍返回整页，且各页不重复"""
+    async def check(store):
+        seen = []
+        for offset in (0, 20, 40, 60, 200, 280):
+            page = await store.find_similar("d0", 20, offset)
+            assert len(page) == 20, f"offset={offset} 只返回 {len(page)} 条"
+            seen.extend(row["id"] for row in page)
+            distances = [row["distance"] for row in page]
+            assert distances == sorted(distances)
+        assert len(seen) == len(set(seen))
+        assert "d0" not in seen
+
+    asyncio.run(with_store(check))
+
+
+def test_find_similar_last_page_is_partial():
+    async def check(store):
+        page = await store.find_similar("d0", 50, CANDIDATES - 10)
+        assert len(page) == 10
+
+    asyncio.run(with_store(check))